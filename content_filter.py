@@ -1,16 +1,27 @@
 import sys
-import json
-import csv
+import os
+import html
+import threading
+from contextlib import nullcontext
 from pathlib import Path
 from datetime import datetime
 from typing import List, Dict
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                             QHBoxLayout, QPushButton, QTextEdit, QLabel, 
                             QLineEdit, QFrame, QMenuBar, QMenu, QStatusBar,
-                            QFileDialog, QMessageBox)
-from PyQt6.QtCore import Qt, QMimeData
+                            QFileDialog, QMessageBox, QCheckBox, QProgressBar,
+                            QInputDialog)
+from PyQt6.QtCore import Qt, QMimeData, QObject, QRunnable, QThreadPool, pyqtSignal
 from PyQt6.QtGui import (QColor, QPalette, QAction, QKeySequence,
                         QDragEnterEvent, QDropEvent, QShortcut)
+import filter_core
+from filter_analysis import VerdictCache, FULL_REPORT, VERDICT_ONLY, evaluate_modes, highlight_html
+from filter_delta import DeltaUnavailable, apply_patch, make_patch, patch_size, patch_versions
+from filter_hits import HitTracker
+from filter_merge import batch_rules, plan_merge
+from filter_overlap import analyze_overlaps
+from filter_profile import Profiler
+from filter_store import MemoryRuleStore, empty_mode_data
 
 MODES = [
     {
@@ -27,14 +38,134 @@ MODES = [
     }
 ]
 
+HISTORY_LIMIT = 100
+# Set CONTENT_FILTER_COMPACT=1 to hold lists in compact buffers (disables undo)
+COMPACT_LISTS = os.environ.get('CONTENT_FILTER_COMPACT') == '1'
+IMPORT_BATCH_SIZE = 10000   # Dropped files are added and redrawn once per batch
+RULE_FILE_SUFFIXES = ('.csv', '.txt')
+
+
+class WorkerSignals(QObject):
+    """Signals of a FileWorker; slots connected from the GUI run on the GUI thread"""
+    progress = pyqtSignal(int)
+    batch = pyqtSignal(object)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+
+class FileWorker(QRunnable):
+    """Run ``task(worker, *args)`` on a thread pool.
+
+    Tasks must not touch widgets or the rule store: they report through
+    ``report_progress`` and ``signals.batch`` and return early once
+    ``cancelled`` is set.
+    """
+
+    def __init__(self, description, task, *args):
+        super().__init__()
+        self.description = description
+        self.task = task
+        self.args = args
+        self.signals = WorkerSignals()
+        self.profiler = None
+        self._cancel = threading.Event()
+        self._percent = -1
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def report_progress(self, done, total):
+        percent = int(done * 100 / total) if total else 100
+        if percent != self._percent:
+            self._percent = percent
+            self.signals.progress.emit(percent)
+
+    def run(self):
+        try:
+            with self.profiler.profile(self.description) if self.profiler else nullcontext():
+                result = self.task(self, *self.args)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
+
+
+def read_lines(worker, filename):
+    """Yield the lines of a file, reporting how much of it has been read"""
+    total = os.path.getsize(filename)
+    done = 0
+    with open(filename, 'rb') as f:
+        for index, raw in enumerate(f):
+            if worker.cancelled:
+                return
+            done += len(raw)
+            worker.report_progress(done, total)
+            line = raw.decode('utf-8', errors='replace')
+            yield line.lstrip('\ufeff') if index == 0 else line
+
+
+def parse_rules_task(worker, filename, format_type):
+    """Read a whole rule file, e.g. to preview the import before committing it"""
+    return filter_core.read_rules(read_lines(worker, filename), format_type)
+
+
+def stream_rules_task(worker, filename, default_list):
+    """Emit a rule file as per-list batches; returns the number of items read"""
+    count = 0
+    pairs = filter_core.iter_rules(read_lines(worker, filename), filter_core.rule_format(filename), default_list)
+    for batch in batch_rules(pairs, IMPORT_BATCH_SIZE):
+        worker.signals.batch.emit(batch)
+        count += sum(len(items) for items in batch.values())
+    return count
+
+
+def export_rules_task(worker, filename, format_type, mode, lists):
+    if filter_core.export_rules(mode, lists, filename, format_type,
+                                cancelled=lambda: worker.cancelled, progress=worker.report_progress):
+        return filename
+
+
+def export_hits_task(worker, filename, rows):
+    if filter_core.export_hit_report(rows, filename,
+                                     cancelled=lambda: worker.cancelled, progress=worker.report_progress):
+        return filename
+
+
+def save_configuration_task(worker, filename, mode_data):
+    if filter_core.save_configuration(mode_data, filename, cancelled=lambda: worker.cancelled):
+        return filename
+
+
+def load_configuration_task(worker, filename):
+    return filter_core.load_configuration(filename)
+
+
+def save_patch_task(worker, filename, patch):
+    if filter_core.save_patch(patch, filename, cancelled=lambda: worker.cancelled):
+        return filename
+
+
+def read_patch_task(worker, filename):
+    return filter_core.read_patch(filename)
+
+
 class ContentFilter(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.mode_data = {
-            mode['name']: {'whitelist': [], 'blacklist': []}
-            for mode in MODES
-        }
+        self.store = MemoryRuleStore(empty_mode_data(mode['name'] for mode in MODES),
+                                     history_limit=0 if COMPACT_LISTS else HISTORY_LIMIT,
+                                     compact=COMPACT_LISTS)
         self.current_mode = MODES[0]['name']
+        self.verdict_cache = VerdictCache(maxsize=2048)
+        self.hit_tracker = HitTracker()
+        self.profiler = Profiler()
+        self.patch_versions = {}  # Mode -> version the last exported patch ended at
+        self.thread_pool = QThreadPool(self)
+        self.workers = {}  # Running FileWorker -> last reported percent
         self.init_ui()
         self.setup_shortcuts()
         self.setup_menubar()
@@ -42,13 +173,9 @@ class ContentFilter(QMainWindow):
         self.setAcceptDrops(True)
         
         # Load default configuration if exists
-        default_config = Path('content_filter_config.json')
+        default_config = Path(filter_core.DEFAULT_CONFIG)
         if default_config.exists():
-            try:
-                self.load_configuration(default_config)
-                self.statusBar().showMessage('Loaded default configuration', 3000)
-            except Exception as e:
-                self.statusBar().showMessage(f'Failed to load default configuration: {str(e)}', 5000)
+            self.load_configuration(default_config)
 
     def init_ui(self):
         self.setWindowTitle('Content Filter')
@@ -158,6 +285,35 @@ class ContentFilter(QMainWindow):
         bl_remove_btn.clicked.connect(lambda: self.remove_selected('blacklist'))
         main_layout.addWidget(bl_remove_btn)
 
+        # Content tester section
+        tester_label = QLabel('Content Filter Tester')
+        tester_label.setStyleSheet('color: rgb(120, 60, 200); font-weight: bold;')
+        main_layout.addWidget(tester_label)
+
+        self.test_input = QTextEdit()
+        self.test_input.setPlaceholderText('Type or paste content here to analyze...')
+        self.test_input.setMaximumHeight(80)
+        main_layout.addWidget(self.test_input)
+
+        tester_btn_layout = QHBoxLayout()
+        self.verdict_only = QCheckBox('Verdict only')
+        self.verdict_only.setToolTip('Stop at the first blacklisted word and skip the detailed report')
+        self.all_modes = QCheckBox('Compare all modes')
+        self.all_modes.setToolTip('Also show the verdict of every mode, from a single scan')
+        self.stemming = QCheckBox('Match inflected forms')
+        self.stemming.setToolTip("A rule like 'kill' also matches 'kills', 'killed' and 'killing'")
+        analyze_btn = QPushButton('Analyze Content')
+        analyze_btn.clicked.connect(self.analyze_content)
+        tester_btn_layout.addWidget(self.verdict_only)
+        tester_btn_layout.addWidget(self.all_modes)
+        tester_btn_layout.addWidget(self.stemming)
+        tester_btn_layout.addWidget(analyze_btn)
+        main_layout.addLayout(tester_btn_layout)
+
+        self.test_result = QTextEdit()
+        self.test_result.setReadOnly(True)
+        main_layout.addWidget(self.test_result)
+
         layout.addWidget(main_area)
         
         # Set initial mode
@@ -169,6 +325,78 @@ class ContentFilter(QMainWindow):
         self.mode_desc.setText(next(m['description'] for m in MODES if m['name'] == mode_name))
         self.update_lists()
 
+    @property
+    def mode_data(self):
+        """Rules of every mode; write through ``self.store`` so changes can be undone"""
+        return self.store.mode_data
+
+    def mark_rules_changed(self, mode=None):
+        """Drop cached verdicts of a mode (or all modes); the store has bumped its version"""
+        self.verdict_cache.invalidate(mode)
+
+    def undo(self):
+        if self.store.undo():
+            self.mark_rules_changed()
+            self.update_lists()
+            self.statusBar().showMessage('Undone', 3000)
+        else:
+            self.statusBar().showMessage('Nothing to undo', 3000)
+
+    def redo(self):
+        if self.store.redo():
+            self.mark_rules_changed()
+            self.update_lists()
+            self.statusBar().showMessage('Redone', 3000)
+        else:
+            self.statusBar().showMessage('Nothing to redo', 3000)
+
+    def analyze_content(self):
+        text = self.test_input.toPlainText()
+        if not text.strip():
+            self.statusBar().showMessage('Please enter some content to analyze', 3000)
+            return
+
+        evaluation = VERDICT_ONLY if self.verdict_only.isChecked() else FULL_REPORT
+        lists = self.mode_data[self.current_mode]
+        with self.profiler.profile('Analyze content'):
+            result = self.verdict_cache.analyze(
+                self.current_mode, self.store.version(self.current_mode), text,
+                lambda: (lists['whitelist'], lists['blacklist']),
+                evaluation, self.stemming.isChecked()
+            )
+        self.hit_tracker.record(self.current_mode, result)
+        self.update_profile_action()
+
+        color = '#e57373' if result.blocked else '#81c784'
+        report = f'<p><b style="color: {color};">{result.status}</b>'
+        if evaluation == FULL_REPORT:
+            report += (f' &mdash; {result.total_words} words, '
+                       f'{len(result.whitelisted)} whitelisted, {len(result.blacklisted)} blacklisted')
+            if result.suppressed:
+                report += f', {result.suppressed} inside whitelisted phrases ignored'
+            report += '</p>'
+            report += f'<p style="color: #1f1f1f; background-color: #ffffff;">{highlight_html(text, result.spans)}</p>'
+        elif result.first_hit:
+            report += f' &mdash; first blacklisted word: {result.first_hit}</p>'
+        if self.all_modes.isChecked():
+            report += self.all_modes_report(text, evaluation)
+        self.test_result.setHtml(report)
+
+    def all_modes_report(self, text, evaluation):
+        """HTML table of every mode's verdict, from one scan of the text"""
+        versions = {mode: self.store.version(mode) for mode in self.mode_data}
+        rules = self.verdict_cache.modes_rules(
+            versions, lambda mode: (self.mode_data[mode]['whitelist'], self.mode_data[mode]['blacklist']),
+            self.stemming.isChecked())
+        with self.profiler.profile('Analyze all modes'):
+            results = evaluate_modes(text, rules, evaluation)
+        rows = ''
+        for mode, result in results.items():
+            color = '#e57373' if result.blocked else '#81c784'
+            rows += (f'<tr><td>{html.escape(mode)}</td><td style="color: {color};">{result.status}</td>'
+                     f'<td>{html.escape(result.first_hit or "")}</td></tr>')
+        return f'<table cellpadding="4"><tr><th>Mode</th><th>Verdict</th><th>First hit</th></tr>{rows}</table>'
+
     def setup_dark_theme(self):
         dark_palette = QPalette()
         dark_palette.setColor(QPalette.ColorRole.Window, QColor(53, 53, 53))
@@ -254,6 +482,18 @@ class ContentFilter(QMainWindow):
         # Edit menu
         edit_menu = menubar.addMenu('&Edit')
         
+        undo_action = QAction('&Undo', self)
+        undo_action.setShortcut(QKeySequence.StandardKey.Undo)
+        undo_action.triggered.connect(self.undo)
+        edit_menu.addAction(undo_action)
+        
+        redo_action = QAction('&Redo', self)
+        redo_action.setShortcut(QKeySequence.StandardKey.Redo)
+        redo_action.triggered.connect(self.redo)
+        edit_menu.addAction(redo_action)
+        
+        edit_menu.addSeparator()
+        
         clear_action = QAction('&Clear All Lists', self)
         clear_action.triggered.connect(self.clear_all_lists)
         edit_menu.addAction(clear_action)
@@ -279,6 +519,10 @@ class ContentFilter(QMainWindow):
         export_txt_action = QAction('Export to TXT', self)
         export_txt_action.triggered.connect(lambda: self.export_lists('txt'))
         imp_exp_menu.addAction(export_txt_action)
+
+        export_hits_action = QAction('Export Rule Hits to CSV', self)
+        export_hits_action.triggered.connect(self.export_rule_hits)
+        imp_exp_menu.addAction(export_hits_action)
         
         imp_exp_menu.addSeparator()
         
@@ -289,6 +533,16 @@ class ContentFilter(QMainWindow):
         import_txt_action = QAction('Import from TXT', self)
         import_txt_action.triggered.connect(lambda: self.import_lists('txt'))
         imp_exp_menu.addAction(import_txt_action)
+
+        imp_exp_menu.addSeparator()
+
+        export_patch_action = QAction('Export Delta Patch...', self)
+        export_patch_action.triggered.connect(self.export_patch)
+        imp_exp_menu.addAction(export_patch_action)
+
+        apply_patch_action = QAction('Apply Delta Patch...', self)
+        apply_patch_action.triggered.connect(self.apply_patch_file)
+        imp_exp_menu.addAction(apply_patch_action)
         
         # View menu
         view_menu = menubar.addMenu('&View')
@@ -297,10 +551,123 @@ class ContentFilter(QMainWindow):
         stats_action.triggered.connect(self.show_statistics)
         view_menu.addAction(stats_action)
 
+        view_menu.addSeparator()
+
+        self.profile_action = QAction('Profile Next Operations...', self)
+        self.profile_action.setCheckable(True)
+        self.profile_action.triggered.connect(self.toggle_profiling)
+        view_menu.addAction(self.profile_action)
+
+        save_profile_action = QAction('Save Profile Report...', self)
+        save_profile_action.triggered.connect(self.save_profile_report)
+        view_menu.addAction(save_profile_action)
+
     def setup_statusbar(self):
         status = QStatusBar()
         self.setStatusBar(status)
 
+        # Progress of background file operations
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setMaximumWidth(200)
+        self.progress_bar.hide()
+        status.addPermanentWidget(self.progress_bar)
+
+        self.cancel_button = QPushButton('Cancel')
+        self.cancel_button.clicked.connect(self.cancel_workers)
+        self.cancel_button.hide()
+        status.addPermanentWidget(self.cancel_button)
+
+    def start_worker(self, worker, on_finished, on_batch=None):
+        """Run a FileWorker on the pool; its callbacks are invoked on the GUI thread"""
+        self.workers[worker] = -1
+        worker.signals.progress.connect(lambda percent: self.worker_progress(worker, percent))
+        worker.signals.finished.connect(lambda result: self.worker_finished(worker, on_finished, result))
+        worker.signals.failed.connect(lambda message: self.worker_failed(worker, message))
+        if on_batch:
+            worker.signals.batch.connect(on_batch)
+        self.update_progress()
+        self.statusBar().showMessage(f'{worker.description}...')
+        worker.profiler = self.profiler
+        self.thread_pool.start(worker)
+
+    def worker_progress(self, worker, percent):
+        if worker in self.workers:
+            self.workers[worker] = percent
+            self.update_progress()
+
+    def worker_finished(self, worker, on_finished, result):
+        self.workers.pop(worker, None)
+        self.update_progress()
+        if worker.cancelled:
+            self.statusBar().showMessage(f'{worker.description} cancelled', 3000)
+        else:
+            on_finished(result)
+        self.update_profile_action()
+
+    def worker_failed(self, worker, message):
+        self.workers.pop(worker, None)
+        self.update_progress()
+        self.update_profile_action()
+        QMessageBox.critical(self, 'Error', f'{worker.description} failed: {message}')
+
+    def update_progress(self):
+        if not self.workers:
+            self.progress_bar.hide()
+            self.cancel_button.hide()
+            return
+        percents = list(self.workers.values())
+        if all(percent < 0 for percent in percents):
+            self.progress_bar.setRange(0, 0)  # Busy indicator until progress is known
+        else:
+            self.progress_bar.setRange(0, 100)
+            self.progress_bar.setValue(sum(max(percent, 0) for percent in percents) // len(percents))
+        self.progress_bar.show()
+        self.cancel_button.show()
+
+    def cancel_workers(self):
+        for worker in self.workers:
+            worker.cancel()
+
+    def toggle_profiling(self, checked):
+        if not checked:
+            self.profiler.disarm()
+            self.update_profile_action()
+            return
+        operations, ok = QInputDialog.getInt(self, 'Profile Operations',
+                                             'Profile the next analyze/import/export/load operations:',
+                                             5, 1, 100)
+        if ok:
+            self.profiler.arm(operations)
+            self.statusBar().showMessage(f'Profiling the next {operations} operations', 3000)
+        self.profile_action.setChecked(ok)
+
+    def update_profile_action(self):
+        """Untick the profiling toggle once the capture has finished"""
+        if self.profile_action.isChecked() and not self.profiler.armed:
+            self.profile_action.setChecked(False)
+            self.statusBar().showMessage('Profile captured; save it from View > Save Profile Report', 5000)
+
+    def save_profile_report(self):
+        if not self.profiler.has_report:
+            QMessageBox.information(self, 'Profile Report',
+                                    'No profile captured yet. Use View > Profile Next Operations first.')
+            return
+        timestamp = self.profiler.captured_at.strftime('%Y%m%d_%H%M%S')
+        filename, _ = QFileDialog.getSaveFileName(self, 'Save Profile Report',
+                                                f'content_filter_profile_{timestamp}.txt',
+                                                'Text files (*.txt)')
+        if filename:
+            try:
+                self.profiler.save_report(filename)
+                self.statusBar().showMessage(f'Profile report saved to {filename}', 3000)
+            except Exception as e:
+                QMessageBox.critical(self, 'Error', f'Failed to save profile report: {str(e)}')
+
+    def closeEvent(self, event):
+        self.cancel_workers()
+        self.thread_pool.waitForDone()
+        super().closeEvent(event)
+
     def setup_shortcuts(self):
         # Add item shortcuts
         QShortcut(QKeySequence('Return'), self.wl_input, lambda: self.add_to_list('whitelist'))
@@ -316,12 +683,13 @@ class ContentFilter(QMainWindow):
                                                     'content_filter_config.json',
                                                     'JSON files (*.json)')
         if filename:
-            try:
-                with open(filename, 'w') as f:
-                    json.dump(self.mode_data, f, indent=4)
-                self.statusBar().showMessage(f'Configuration saved to {filename}', 3000)
-            except Exception as e:
-                QMessageBox.critical(self, 'Error', f'Failed to save configuration: {str(e)}')
+            # Snapshot the lists so edits made while saving don't race the writer
+            snapshot = {mode: {list_type: list(items) for list_type, items in lists.items()}
+                        for mode, lists in self.mode_data.items()}
+            self.start_worker(
+                FileWorker('Saving configuration', save_configuration_task, filename, snapshot),
+                lambda _: self.statusBar().showMessage(f'Configuration saved to {filename}', 3000)
+            )
 
     def load_configuration(self, filename=None):
         if isinstance(filename, Path):
@@ -331,13 +699,16 @@ class ContentFilter(QMainWindow):
                                                     '',
                                                     'JSON files (*.json)')
         if filename:
-            try:
-                with open(filename) as f:
-                    self.mode_data = json.load(f)
-                self.update_lists()
-                self.statusBar().showMessage(f'Configuration loaded from {filename}', 3000)
-            except Exception as e:
-                QMessageBox.critical(self, 'Error', f'Failed to load configuration: {str(e)}')
+            self.start_worker(
+                FileWorker('Loading configuration', load_configuration_task, filename),
+                lambda mode_data: self.apply_configuration(mode_data, filename)
+            )
+
+    def apply_configuration(self, mode_data, filename):
+        self.store.load_mode_data(mode_data)
+        self.mark_rules_changed()
+        self.update_lists()
+        self.statusBar().showMessage(f'Configuration loaded from {filename}', 3000)
 
     def clear_all_lists(self):
         reply = QMessageBox.question(self, 'Clear All Lists',
@@ -345,8 +716,10 @@ class ContentFilter(QMainWindow):
                                    QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
         
         if reply == QMessageBox.StandardButton.Yes:
-            self.mode_data[self.current_mode]['whitelist'] = []
-            self.mode_data[self.current_mode]['blacklist'] = []
+            with self.store.action('Clear all lists'):
+                self.store.clear(self.current_mode, 'whitelist')
+                self.store.clear(self.current_mode, 'blacklist')
+            self.mark_rules_changed(self.current_mode)
             self.update_lists()
             self.statusBar().showMessage('All lists cleared', 3000)
 
@@ -363,38 +736,98 @@ class ContentFilter(QMainWindow):
         text_edit.setText('\n'.join(filtered_items))
 
     def dragEnterEvent(self, event: QDragEnterEvent):
-        if event.mimeData().hasText():
+        if event.mimeData().hasUrls() or event.mimeData().hasText():
             event.acceptProposedAction()
 
+    def list_at(self, pos):
+        """Return the list type whose text box is under a window position, if any"""
+        widget = self.childAt(int(pos.x()), int(pos.y()))
+        while widget is not None:
+            if widget is self.whitelist:
+                return 'whitelist'
+            if widget is self.blacklist:
+                return 'blacklist'
+            widget = widget.parentWidget()
+        return None
+
     def dropEvent(self, event: QDropEvent):
-        text = event.mimeData().text()
-        if text:
-            # Determine which list to add to based on drop position
-            pos = event.position()
-            target_widget = self.childAt(int(pos.x()), int(pos.y()))
-            
-            if isinstance(target_widget, QTextEdit):
-                if target_widget == self.whitelist:
-                    self.add_items_to_list('whitelist', text.split('\n'))
-                elif target_widget == self.blacklist:
-                    self.add_items_to_list('blacklist', text.split('\n'))
+        # Determine which list to add to based on drop position
+        list_type = self.list_at(event.position())
+        mime_data = event.mimeData()
+        if mime_data.hasUrls():
+            files = [url.toLocalFile() for url in mime_data.urls() if url.isLocalFile()]
+            files = [name for name in files if name.lower().endswith(RULE_FILE_SUFFIXES)]
+            if files:
+                for filename in files:
+                    self.stream_import(filename, list_type)
+                event.acceptProposedAction()
+                return
+
+        text = mime_data.text()
+        if text and list_type:
+            self.add_items_to_list(list_type, text.split('\n'))
+
+    def stream_import(self, filename, list_type=None):
+        """Import a dropped file in the background, adding each batch as it is read.
+
+        CSV rows and TXT sections name their own list; plain TXT lines go to
+        the list the file was dropped on. The whole import is one undo step,
+        and cancelling it removes the items it added so far.
+        """
+        mode = self.current_mode
+        name = Path(filename).name
+        group = object()  # Every batch extends the same undo step while it is the latest one
+        imported = {'whitelist': [], 'blacklist': []}
+
+        def add_batch(batch):
+            with self.store.action(f'Import {name}', group):
+                for batch_list, items in batch.items():
+                    count = self.store.add_items(mode, batch_list, [item.strip() for item in items])
+                    if count:
+                        # New items are appended at the end of the list, in order
+                        imported[batch_list] += self.store.search(mode, batch_list, '',
+                                                                  self.store.count(mode, batch_list) - count, count)
+            self.mark_rules_changed(mode)
+            self.update_lists()
+
+        def rollback(_):
+            # Only the import's own items go; edits made while it ran are kept
+            if not worker.cancelled or not any(imported.values()):
+                return
+            self.store.discard_action(group)
+            # An edit in between splits the import into several undo steps; only the latest one was dropped
+            remaining = {batch_list: [item for item in items if self.store.contains(mode, batch_list, item)]
+                         for batch_list, items in imported.items()}
+            if any(remaining.values()):
+                with self.store.action(f'Cancel import {name}'):
+                    for batch_list, items in remaining.items():
+                        if items:
+                            self.store.remove_items(mode, batch_list, items)
+            self.mark_rules_changed(mode)
+            self.update_lists()
+
+        worker = FileWorker(f'Importing {name}', stream_rules_task, filename, list_type)
+        # Batches are queued before the finished signal, so every batch has been added by then
+        worker.signals.finished.connect(rollback)
+        self.start_worker(
+            worker,
+            lambda _: self.statusBar().showMessage(
+                f'Imported {sum(len(items) for items in imported.values())} items from {name}', 3000),
+            add_batch
+        )
 
     def add_items_to_list(self, list_type, items):
-        added = 0
-        for item in items:
-            item = item.strip()
-            if item and item not in self.mode_data[self.current_mode][list_type]:
-                self.mode_data[self.current_mode][list_type].append(item)
-                added += 1
+        added = self.store.add_items(self.current_mode, list_type, [item.strip() for item in items])
         
         if added > 0:
+            self.mark_rules_changed(self.current_mode)
             self.update_lists()
             self.statusBar().showMessage(f'Added {added} items to {list_type}', 3000)
 
     def sort_lists(self, direction: str = 'asc'):
-        for list_type in ['whitelist', 'blacklist']:
-            items = self.mode_data[self.current_mode][list_type]
-            self.mode_data[self.current_mode][list_type] = sorted(items, reverse=(direction == 'desc'))
+        with self.store.action(f'Sort {direction}ending'):
+            for list_type in ['whitelist', 'blacklist']:
+                self.store.sort(self.current_mode, list_type, reverse=(direction == 'desc'))
         
         self.update_lists()
         self.statusBar().showMessage(f'Lists sorted {direction}ending', 3000)
@@ -407,77 +840,143 @@ class ContentFilter(QMainWindow):
             filename, _ = QFileDialog.getSaveFileName(self, 'Export Lists',
                                                     f'{default_name}.csv',
                                                     'CSV files (*.csv)')
-            if filename:
-                try:
-                    with open(filename, 'w', newline='') as f:
-                        writer = csv.writer(f)
-                        writer.writerow(['Type', 'Item'])
-                        for item in self.mode_data[self.current_mode]['whitelist']:
-                            writer.writerow(['whitelist', item])
-                        for item in self.mode_data[self.current_mode]['blacklist']:
-                            writer.writerow(['blacklist', item])
-                    self.statusBar().showMessage(f'Lists exported to {filename}', 3000)
-                except Exception as e:
-                    QMessageBox.critical(self, 'Error', f'Failed to export lists: {str(e)}')
-        
         elif format_type == 'txt':
             filename, _ = QFileDialog.getSaveFileName(self, 'Export Lists',
                                                     f'{default_name}.txt',
                                                     'Text files (*.txt)')
-            if filename:
-                try:
-                    with open(filename, 'w') as f:
-                        f.write(f'=== {self.current_mode} ===\n\n')
-                        f.write('=== Whitelist ===\n')
-                        f.write('\n'.join(self.mode_data[self.current_mode]['whitelist']))
-                        f.write('\n\n=== Blacklist ===\n')
-                        f.write('\n'.join(self.mode_data[self.current_mode]['blacklist']))
-                    self.statusBar().showMessage(f'Lists exported to {filename}', 3000)
-                except Exception as e:
-                    QMessageBox.critical(self, 'Error', f'Failed to export lists: {str(e)}')
+        else:
+            return
+
+        if filename:
+            lists = {list_type: list(items) for list_type, items in self.mode_data[self.current_mode].items()}
+            self.start_worker(
+                FileWorker('Exporting lists', export_rules_task, filename, format_type,
+                           self.current_mode, lists),
+                lambda _: self.statusBar().showMessage(f'Lists exported to {filename}', 3000)
+            )
     
+    def export_rule_hits(self):
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename, _ = QFileDialog.getSaveFileName(self, 'Export Rule Hits',
+                                                f'rule_hits_{self.current_mode}_{timestamp}.csv',
+                                                'CSV files (*.csv)')
+        if filename:
+            rows = self.hit_tracker.counter(self.current_mode).report(self.mode_data[self.current_mode])
+            self.start_worker(
+                FileWorker('Exporting rule hits', export_hits_task, filename, rows),
+                lambda _: self.statusBar().showMessage(f'Rule hits exported to {filename}', 3000)
+            )
+
+    def export_patch(self):
+        mode = self.current_mode
+        version = self.store.version(mode)
+        since, ok = QInputDialog.getInt(self, 'Export Delta Patch',
+                                        f'{mode} is at version {version}.\nExport the changes since version:',
+                                        min(self.patch_versions.get(mode, 0), version), 0, version)
+        if not ok:
+            return
+        try:
+            patch = make_patch(self.store, {mode: since})
+        except DeltaUnavailable as e:
+            QMessageBox.warning(self, 'Export Delta Patch', f'{e}.\nExport the full lists instead.')
+            return
+        filename, _ = QFileDialog.getSaveFileName(self, 'Export Delta Patch',
+                                                f'content_filter_patch_{mode}_{since}-{version}.json',
+                                                'JSON files (*.json)')
+        if filename:
+            added, removed = patch_size(patch)
+            self.start_worker(
+                FileWorker('Exporting patch', save_patch_task, filename, patch),
+                lambda _: self.patch_exported(patch, filename, added, removed)
+            )
+
+    def patch_exported(self, patch, filename, added, removed):
+        self.patch_versions.update(patch_versions(patch))
+        self.statusBar().showMessage(f'Patch with {added} additions and {removed} removals saved to {filename}', 3000)
+
+    def apply_patch_file(self):
+        filename, _ = QFileDialog.getOpenFileName(self, 'Apply Delta Patch', '', 'JSON files (*.json)')
+        if filename:
+            self.start_worker(
+                FileWorker('Reading patch', read_patch_task, filename),
+                lambda patch: self.commit_patch(patch, filename)
+            )
+
+    def commit_patch(self, patch, source):
+        added, removed = patch_size(patch)
+        reply = QMessageBox.question(
+            self, 'Apply Delta Patch',
+            f"Apply {Path(source).name} to {', '.join(patch['modes']) or 'no modes'}?\n\n"
+            f"- Additions: {added}\n- Removals: {removed}",
+            QMessageBox.StandardButton.Ok | QMessageBox.StandardButton.Cancel)
+        if reply != QMessageBox.StandardButton.Ok:
+            return
+        with self.profiler.profile(f'Apply patch {Path(source).name}'):
+            # Compiled rules are patched in place of a full recompile
+            applied = apply_patch(self.store, patch, self.verdict_cache)
+        self.update_profile_action()
+        self.update_lists()
+        self.statusBar().showMessage(
+            f"Patch applied: {sum(a for a, _ in applied.values())} added, "
+            f"{sum(r for _, r in applied.values())} removed", 3000)
+
     def import_lists(self, format_type: str):
         if format_type == 'csv':
             filename, _ = QFileDialog.getOpenFileName(self, 'Import Lists',
                                                     '',
                                                     'CSV files (*.csv)')
-            if filename:
-                try:
-                    with open(filename, newline='') as f:
-                        reader = csv.reader(f)
-                        next(reader)  # Skip header
-                        for row in reader:
-                            if len(row) == 2:
-                                list_type, item = row
-                                if list_type in ['whitelist', 'blacklist']:
-                                    if item not in self.mode_data[self.current_mode][list_type]:
-                                        self.mode_data[self.current_mode][list_type].append(item)
-                    self.update_lists()
-                    self.statusBar().showMessage(f'Lists imported from {filename}', 3000)
-                except Exception as e:
-                    QMessageBox.critical(self, 'Error', f'Failed to import lists: {str(e)}')
-        
         elif format_type == 'txt':
             filename, _ = QFileDialog.getOpenFileName(self, 'Import Lists',
                                                     '',
                                                     'Text files (*.txt)')
-            if filename:
-                try:
-                    current_list = None
-                    with open(filename) as f:
-                        for line in f:
-                            line = line.strip()
-                            if line.startswith('=== Whitelist ==='):
-                                current_list = 'whitelist'
-                            elif line.startswith('=== Blacklist ==='):
-                                current_list = 'blacklist'
-                            elif line and not line.startswith('===') and current_list:
-                                if line not in self.mode_data[self.current_mode][current_list]:
-                                    self.mode_data[self.current_mode][current_list].append(line)
-                    self.update_lists()
-                    self.statusBar().showMessage(f'Lists imported from {filename}', 3000)
-                except Exception as e:
-                    QMessageBox.critical(self, 'Error', f'Failed to import lists: {str(e)}')
+        else:
+            return
+
+        if filename:
+            # Parse in the background, then preview the merge on the GUI thread; the rules go
+            # into the mode selected now, even if another mode is selected while the file is read
+            mode = self.current_mode
+            self.start_worker(
+                FileWorker('Reading import file', parse_rules_task, filename, format_type),
+                lambda incoming: self.commit_import(incoming, filename, mode)
+            )
+
+    def commit_import(self, incoming, source, mode):
+        """Show the merge summary for an import into ``mode`` and apply it if confirmed"""
+        current_lists = self.mode_data[mode]
+        plan = plan_merge(current_lists, incoming)
+        summary = plan.summary()
+
+        details = (f"Import from {source} into {mode}:\n\n"
+                   f"- New whitelist items: {summary['added_whitelist']}\n"
+                   f"- New blacklist items: {summary['added_blacklist']}\n"
+                   f"- Duplicates: {summary['duplicates']}\n"
+                   f"- Items on both lists: {summary['conflicts']}\n")
+        if plan.conflicts:
+            details += '\n' + '\n'.join(f'  {item} ({kind})' for item, kind in plan.conflicts[:20])
+            if len(plan.conflicts) > 20:
+                details += f'\n  ... and {len(plan.conflicts) - 20} more'
+            details += '\n\nSkip conflicting incoming items?'
+            buttons = (QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+                       | QMessageBox.StandardButton.Cancel)
+        else:
+            details += '\nCommit this import?'
+            buttons = QMessageBox.StandardButton.Ok | QMessageBox.StandardButton.Cancel
+
+        reply = QMessageBox.question(self, 'Import Lists', details, buttons)
+        if reply == QMessageBox.StandardButton.Cancel:
+            self.statusBar().showMessage('Import cancelled', 3000)
+            return
+
+        with self.store.action(f'Import {source}'):
+            added = sum(
+                self.store.add_items(mode, list_type, items)
+                for list_type, items in plan.additions(reply == QMessageBox.StandardButton.Yes).items()
+            )
+        if added:
+            self.mark_rules_changed(mode)
+            self.update_lists()
+        self.statusBar().showMessage(f'Imported {added} items from {source}', 3000)
     
     def show_statistics(self):
         whitelist = self.mode_data[self.current_mode]['whitelist']
@@ -497,6 +996,29 @@ Blacklist:
 - Shortest item: {min((len(x), x) for x in blacklist)[1] if blacklist else 'N/A'}
 - Longest item: {max((len(x), x) for x in blacklist)[1] if blacklist else 'N/A'}
 """
+        overlap = analyze_overlaps(self.mode_data[self.current_mode])
+        stats += f"""
+Rule Overlap:
+- On both lists: {len(overlap.both_lists)}
+- Blacklist phrases shadowed by a shorter rule: {len(overlap.shadowed)}
+- Rules that never fire: {len(overlap.never_fire)}
+"""
+        for item, _, _ in overlap.both_lists[:5]:
+            stats += f"  both lists: {item}\n"
+        for phrase, shorter in overlap.shadowed[:5]:
+            stats += f"  shadowed: {phrase} (by {shorter})\n"
+        for list_type, rule, reason in overlap.never_fire[:5]:
+            stats += f"  never fires: {rule} ({list_type}, {reason})\n"
+
+        counter = self.hit_tracker.counter(self.current_mode)
+        never_hit = counter.never_hit(self.mode_data[self.current_mode])
+        stats += f"""
+Rule Hits ({counter.analyses} analyses):
+- Total hits: {counter.total}
+- Rules that never fired: {len(never_hit)}
+"""
+        for list_type, rule, hits in counter.top(5):
+            stats += f"  {hits} hits: {rule} ({list_type})\n"
         
         QMessageBox.information(self, 'List Statistics', stats)
     
@@ -509,8 +1031,8 @@ Blacklist:
         input_field = self.wl_input if list_type == 'whitelist' else self.bl_input
         item = input_field.text().strip()
         
-        if item and item not in self.mode_data[self.current_mode][list_type]:
-            self.mode_data[self.current_mode][list_type].append(item)
+        if item and self.store.add_items(self.current_mode, list_type, [item]):
+            self.mark_rules_changed(self.current_mode)
             input_field.clear()
             self.update_lists()
 
@@ -519,8 +1041,8 @@ Blacklist:
         cursor = text_edit.textCursor()
         if cursor.hasSelection():
             selected = cursor.selectedText()
-            if selected in self.mode_data[self.current_mode][list_type]:
-                self.mode_data[self.current_mode][list_type].remove(selected)
+            if self.store.remove_items(self.current_mode, list_type, [selected]):
+                self.mark_rules_changed(self.current_mode)
                 self.update_lists()
 
 def main():
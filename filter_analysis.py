@@ -0,0 +1,902 @@
+"""Content analysis shared by the Streamlit and Qt front ends.
+
+Holds the word-level analysis used by the Content Filter Tester and a
+verdict cache that sits in front of it, so repeated copy-paste content is
+only analyzed once per ruleset version.
+
+Two evaluation modes are supported: ``FULL_REPORT`` collects every
+whitelisted and blacklisted word, ``VERDICT_ONLY`` stops at the first
+blacklist hit and only reports ALLOWED/BLOCKED.
+
+Full reports also record a ``MatchSpan`` (start, end, rule, list) per hit
+during the same scan, which is enough to highlight the original text
+without searching it again.
+
+Rules may be single words or multi-word phrases. ``ContentScanner`` reads
+content incrementally so large documents can be analyzed chunk by chunk
+with bounded memory.
+
+Whitelist matches are protected spans: a blacklist hit lying entirely inside
+a whitelist match (e.g. a blacklisted word inside a whitelisted place name)
+is suppressed and does not count towards the verdict. Blacklist hits are
+held back for at most the length of the longest whitelist phrase, so the
+overlap is resolved during the same scan.
+
+With ``stemming`` rules and text words are reduced to their inflectional
+stem (``filter_stem``), so a rule also matches the word's other forms.
+
+``MultiModeRules`` merges every mode's compiled rules into one table where
+each rule carries a bitmask of the modes listing it, so
+``MultiModeScanner`` returns per-mode results from a single scan.
+"""
+import codecs
+import hashlib
+import html
+import re
+import sys
+import time
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass, field, replace
+from typing import BinaryIO, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from filter_stem import STEM_CACHE, stem
+
+FULL_REPORT = 'full'
+VERDICT_ONLY = 'verdict'
+EVALUATION_MODES = (FULL_REPORT, VERDICT_ONLY)
+
+_WORD_RE = re.compile(r'\S+')
+
+
+class MatchSpan(NamedTuple):
+    """Character offsets of one rule hit in the analyzed text"""
+    start: int
+    end: int
+    rule: str
+    list_type: str
+
+
+@dataclass
+class AnalysisResult:
+    """Outcome of testing a piece of content against a mode's lists.
+
+    In verdict-only mode the match lists, spans and word count are left as
+    None and ``first_hit`` holds the blacklist rule that decided the verdict.
+    Match lists hold the rule strings themselves, not copies of the text.
+    ``suppressed`` counts the blacklist hits overridden by a whitelist match.
+    """
+    blocked: bool
+    evaluation: str = FULL_REPORT
+    total_words: Optional[int] = None
+    whitelisted: Optional[List[str]] = None
+    blacklisted: Optional[List[str]] = None
+    first_hit: Optional[str] = None
+    spans: Optional[List[MatchSpan]] = None
+    suppressed: int = 0
+
+    @property
+    def status(self) -> str:
+        return "BLOCKED" if self.blocked else "ALLOWED"
+
+
+@dataclass(frozen=True)
+class CompiledRules:
+    """Lookup tables for one version of a mode's lists.
+
+    Single-word rules live in ``whitelist``/``blacklist``, which map the
+    lowercased rule to the rule as it is stored so hits can refer to the
+    shared rule string. Multi-word rules are indexed in ``phrases`` by their
+    last word, so they can be recognized when that word is scanned.
+
+    ``max_whitelist_words`` is the longest whitelist rule, i.e. how far a
+    blacklist hit must be held back before no whitelist match can cover it.
+    With ``stemming`` the keys are stemmed tokens, and scanners stem each
+    word before looking it up.
+
+    Rules that lowercase to the same tokens collapse to the last one listed;
+    the earlier ones are kept in ``shadowed`` under (list type, tokens) so
+    ``update_rules`` can restore them when the winning rule is removed.
+    """
+    whitelist: Dict[str, str]
+    blacklist: Dict[str, str]
+    phrases: Dict[str, List[Tuple[Tuple[str, ...], str, str]]]
+    max_phrase_words: int = 1
+    max_whitelist_words: int = 1
+    stemming: bool = False
+    shadowed: Dict[Tuple[str, Tuple[str, ...]], List[str]] = field(default_factory=dict)
+
+
+def rule_tokens(item: str, stemming: bool = False) -> Tuple[str, ...]:
+    """Lowercased (and optionally stemmed) words of a rule, as rules are matched"""
+    tokens = tuple(item.lower().split())
+    return tuple(stem(token) for token in tokens) if stemming else tokens
+
+
+def compile_rules(whitelist: List[str], blacklist: List[str], stemming: bool = False) -> CompiledRules:
+    words = {'whitelist': {}, 'blacklist': {}}
+    phrase_rules = {'whitelist': {}, 'blacklist': {}}
+    shadowed = {}
+    for list_type, items in (('whitelist', whitelist), ('blacklist', blacklist)):
+        for item in items:
+            tokens = rule_tokens(item, stemming)
+            if not tokens:
+                continue
+            table, key = (words[list_type], tokens[0]) if len(tokens) == 1 else (phrase_rules[list_type], tokens)
+            if key in table:
+                shadowed.setdefault((list_type, tokens), []).append(table[key])
+            table[key] = item
+
+    # Equivalent rules collapse to the last one listed, for phrases as for words
+    phrases: Dict[str, List[Tuple[Tuple[str, ...], str, str]]] = {}
+    max_phrase_words = 1
+    for list_type, rules in phrase_rules.items():
+        for tokens, item in rules.items():
+            phrases.setdefault(tokens[-1], []).append((tokens, item, list_type))
+            max_phrase_words = max(max_phrase_words, len(tokens))
+    return CompiledRules(
+        whitelist=words['whitelist'],
+        blacklist=words['blacklist'],
+        phrases=phrases,
+        max_phrase_words=max_phrase_words,
+        max_whitelist_words=max((len(tokens) for tokens in phrase_rules['whitelist']), default=1),
+        stemming=stemming,
+        shadowed=shadowed,
+    )
+
+
+def update_rules(rules: CompiledRules, added: Dict[str, List[str]],
+                 removed: Dict[str, List[str]]) -> CompiledRules:
+    """Compiled tables after removing and then appending rules, without recompiling.
+
+    ``removed`` must only hold rules that were on the lists and ``added``
+    rules that were not, as the stores report them; like the stores, a
+    removal drops every copy of the rule. The tables are copied, so
+    ``rules`` stays valid for the previous version. The longest phrase
+    lengths are not lowered by removals; an overestimate only widens the
+    scan window.
+    """
+    tables = {'whitelist': dict(rules.whitelist), 'blacklist': dict(rules.blacklist)}
+    phrases = {word: list(candidates) for word, candidates in rules.phrases.items()}
+    shadowed = {key: list(items) for key, items in rules.shadowed.items()}
+    max_phrase_words = rules.max_phrase_words
+    max_whitelist_words = rules.max_whitelist_words
+
+    def set_phrase(tokens, list_type, rule):
+        candidates = phrases.setdefault(tokens[-1], [])
+        for index, (existing, _, existing_list) in enumerate(candidates):
+            if existing == tokens and existing_list == list_type:
+                candidates[index] = (tokens, rule, list_type)
+                return
+        # Whitelist phrases come first, as compile_rules orders them
+        position = len(candidates) if list_type == 'blacklist' else \
+            next((i for i, entry in enumerate(candidates) if entry[2] == 'blacklist'), len(candidates))
+        candidates.insert(position, (tokens, rule, list_type))
+
+    def current(tokens, list_type):
+        if len(tokens) == 1:
+            return tables[list_type].get(tokens[0])
+        return next((rule for existing, rule, existing_list in phrases.get(tokens[-1], ())
+                     if existing == tokens and existing_list == list_type), None)
+
+    for list_type, items in removed.items():
+        for item in items:
+            tokens = rule_tokens(item, rules.stemming)
+            if not tokens:
+                continue
+            earlier = shadowed.get((list_type, tokens))
+            if earlier and item in earlier:
+                # The stores drop every copy of a removed item, so none of them may be promoted
+                earlier[:] = [rule for rule in earlier if rule != item]
+                if not earlier:
+                    del shadowed[(list_type, tokens)]
+            if current(tokens, list_type) != item:
+                continue
+            if earlier:
+                replacement = earlier.pop()
+                if not earlier:
+                    del shadowed[(list_type, tokens)]
+            else:
+                replacement = None
+            if len(tokens) == 1:
+                if replacement is None:
+                    del tables[list_type][tokens[0]]
+                else:
+                    tables[list_type][tokens[0]] = replacement
+            elif replacement is None:
+                phrases[tokens[-1]] = [entry for entry in phrases[tokens[-1]]
+                                       if not (entry[0] == tokens and entry[2] == list_type)]
+                if not phrases[tokens[-1]]:
+                    del phrases[tokens[-1]]
+            else:
+                set_phrase(tokens, list_type, replacement)
+
+    for list_type, items in added.items():
+        for item in items:
+            tokens = rule_tokens(item, rules.stemming)
+            if not tokens:
+                continue
+            winner = current(tokens, list_type)
+            if winner is not None:
+                shadowed.setdefault((list_type, tokens), []).append(winner)
+            if len(tokens) == 1:
+                tables[list_type][tokens[0]] = item
+            else:
+                set_phrase(tokens, list_type, item)
+                max_phrase_words = max(max_phrase_words, len(tokens))
+                if list_type == 'whitelist':
+                    max_whitelist_words = max(max_whitelist_words, len(tokens))
+
+    return replace(rules, whitelist=tables['whitelist'], blacklist=tables['blacklist'],
+                   phrases=phrases, max_phrase_words=max_phrase_words,
+                   max_whitelist_words=max_whitelist_words, shadowed=shadowed)
+
+
+def normalize_content(text: str) -> str:
+    """Lowercase and collapse whitespace; analysis only depends on this form"""
+    return ' '.join(text.lower().split())
+
+
+def content_hash(text: str, exact: bool = False) -> str:
+    """Stable digest of the content, used as a cache key.
+
+    Verdicts only depend on the normalized form; full reports carry
+    character offsets and are keyed on the exact text instead.
+    """
+    data = text if exact else normalize_content(text)
+    return hashlib.blake2b(data.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class ContentScanner:
+    """Incremental word scanner that accepts the content in chunks.
+
+    A word cut off at the end of a chunk is held back until the next chunk
+    arrives, and the last few words are kept in a window, so words and
+    phrases spanning chunk boundaries are still matched at their absolute
+    character offsets. Memory stays bounded by the longest phrase unless
+    ``collect`` is set, in which case every hit is also kept for the final
+    report.
+
+    Blacklist hits are only counted once no whitelist match can still cover
+    them, ``max_whitelist_words - 1`` words after they start (or at
+    ``flush``); hits inside a whitelist match are dropped then and counted
+    in ``suppressed_hits``. Verdict-only scans look up the whitelist only
+    while a blacklist hit is pending.
+
+    ``context`` is called with each unknown word (on neither list) among the
+    ``context_words`` words before and after a blacklist hit, e.g. to feed a
+    heavy-hitter sketch during corpus scans.
+    """
+
+    def __init__(self, rules: CompiledRules, evaluation: str = FULL_REPORT,
+                 collect: bool = True, context: Optional[Callable[[str], None]] = None,
+                 context_words: int = 3):
+        if evaluation not in EVALUATION_MODES:
+            raise ValueError(f"Unknown evaluation mode: {evaluation}")
+        self.rules = rules
+        self.evaluation = evaluation
+        self.collect = collect and evaluation == FULL_REPORT
+        self.total_words = 0
+        self.whitelist_hits = 0
+        self.blacklist_hits = 0
+        self.suppressed_hits = 0
+        self.first_hit: Optional[str] = None
+        self.done = False
+        self._whitelisted: List[str] = []
+        self._blacklisted: List[str] = []
+        self._spans: List[MatchSpan] = []
+        self._window = deque(maxlen=rules.max_phrase_words)
+        # Blacklist hits not yet past the reach of a whitelist phrase, as (first word index, hit)
+        self._held = deque()
+        self._pending = ''
+        self._offset = 0
+        self._context = context
+        self._recent = deque(maxlen=context_words)
+        self._context_words = context_words
+        self._context_left = 0
+
+    def feed(self, chunk: str) -> List[MatchSpan]:
+        """Scan the next chunk and return the hits completed in it"""
+        if self.done:
+            return []
+        text = self._pending + chunk
+        cut = len(text)
+        while cut and not text[cut - 1].isspace():
+            cut -= 1
+        self._pending = text[cut:]
+        hits = self._scan(text, 0, cut)
+        self._offset += cut
+        return hits
+
+    def flush(self) -> List[MatchSpan]:
+        """Scan the word held back at the end of the last chunk and release held hits"""
+        pending, self._pending = self._pending, ''
+        if self.done:
+            return []
+        hits = []
+        if pending:
+            hits = self._scan(pending, 0, len(pending))
+            self._offset += len(pending)
+        while self._held and not self.done:
+            hits.extend(self._release(self._held.popleft()[1]))
+        return hits
+
+    def finish(self) -> AnalysisResult:
+        """Scan any held-back text and build the result"""
+        self.flush()
+        if self.evaluation == VERDICT_ONLY:
+            return AnalysisResult(blocked=self.first_hit is not None, evaluation=VERDICT_ONLY,
+                                  first_hit=self.first_hit, suppressed=self.suppressed_hits)
+        return AnalysisResult(
+            blocked=self.blacklist_hits > 0,
+            total_words=self.total_words,
+            whitelisted=self._whitelisted if self.collect else None,
+            blacklisted=self._blacklisted if self.collect else None,
+            first_hit=self.first_hit,
+            spans=self._spans if self.collect else None,
+            suppressed=self.suppressed_hits,
+        )
+
+    def _release(self, span: MatchSpan) -> List[MatchSpan]:
+        """Count a blacklist hit no whitelist match can cover any more"""
+        self.blacklist_hits += 1
+        if self.first_hit is None:
+            self.first_hit = span.rule
+        if self.evaluation == VERDICT_ONLY:
+            self.done = True
+        elif self.collect:
+            self._blacklisted.append(span.rule)
+            self._spans.append(span)
+        return [span]
+
+    def _protect(self, first_word: int):
+        """Drop held blacklist hits starting at or after ``first_word``.
+
+        Called with the first word of a whitelist match ending at the current
+        word, which is where every held hit ends at the latest.
+        """
+        kept = [entry for entry in self._held if entry[0] < first_word]
+        self.suppressed_hits += len(self._held) - len(kept)
+        self._held = deque(kept)
+
+    def _scan(self, text: str, pos: int, endpos: int) -> List[MatchSpan]:
+        whitelist, blacklist, phrases = self.rules.whitelist, self.rules.blacklist, self.rules.phrases
+        stemming = self.rules.stemming
+        stems = STEM_CACHE
+        verdict_only = self.evaluation == VERDICT_ONLY
+        reach = self.rules.max_whitelist_words - 1
+        window = self._window
+        held = self._held
+        offset = self._offset
+        hits = []
+        for match in _WORD_RE.finditer(text, pos, endpos):
+            word = match.group().lower()
+            if stemming:
+                word = stems.get(word) or stem(word)
+            start, end = offset + match.start(), offset + match.end()
+            index = self.total_words
+            self.total_words += 1
+            window.append((word, start))
+            candidates = phrases.get(word, ())
+            if word in blacklist:
+                held.append((index, MatchSpan(start, end, blacklist[word], 'blacklist')))
+            for tokens, rule, list_type in candidates:
+                size = len(tokens)
+                if list_type == 'blacklist' and size <= len(window) and \
+                        all(window[i - size][0] == tokens[i] for i in range(size - 1)):
+                    held.append((index - size + 1, MatchSpan(window[-size][1], end, rule, list_type)))
+            found = []
+            if held or not verdict_only:
+                protected_from = None
+                if word in whitelist:
+                    found.append(MatchSpan(start, end, whitelist[word], 'whitelist'))
+                    protected_from = index
+                for tokens, rule, list_type in candidates:
+                    size = len(tokens)
+                    if list_type == 'whitelist' and size <= len(window) and \
+                            all(window[i - size][0] == tokens[i] for i in range(size - 1)):
+                        found.append(MatchSpan(window[-size][1], end, rule, list_type))
+                        first = index - size + 1
+                        protected_from = first if protected_from is None else min(protected_from, first)
+                if protected_from is not None and held:
+                    self._protect(protected_from)
+                    held = self._held
+            if self._context is not None:
+                self._track_context(word, found + [span for _, span in held if span.end == end])
+            if found and not verdict_only:
+                self.whitelist_hits += len(found)
+                if self.collect:
+                    self._whitelisted.extend(span.rule for span in found)
+                    self._spans.extend(found)
+                hits.extend(found)
+            while held and held[0][0] + reach <= index:
+                hits.extend(self._release(held.popleft()[1]))
+                if self.done:
+                    return hits
+        return hits
+
+    def _track_context(self, word: str, found: List[MatchSpan]):
+        if any(span.list_type == 'blacklist' for span in found):
+            for neighbour in self._recent:
+                self._context(neighbour)
+            self._recent.clear()
+            self._context_left = self._context_words
+        elif word not in self.rules.whitelist and not found:
+            if self._context_left:
+                self._context(word)
+                self._context_left -= 1
+            else:
+                self._recent.append(word)
+
+
+def check_verdict(text: str, rules: CompiledRules) -> AnalysisResult:
+    """Scan words lazily and stop at the first blacklist hit"""
+    scanner = ContentScanner(rules, VERDICT_ONLY)
+    if rules.blacklist or rules.phrases:
+        scanner.feed(text)
+    return scanner.finish()
+
+
+def full_report(text: str, rules: CompiledRules) -> AnalysisResult:
+    """Check every word of the content against the whitelist and blacklist.
+
+    Hits and their character offsets are collected in a single pass.
+    """
+    scanner = ContentScanner(rules, FULL_REPORT)
+    scanner.feed(text)
+    return scanner.finish()
+
+
+@dataclass(frozen=True)
+class MultiModeRules:
+    """Union of several modes' rules, tagged with the modes that list them.
+
+    Bit i of a mask stands for ``modes[i]``. ``words`` maps a lowercased word
+    to (mask, rule, list type) entries, one per distinct stored rule, and
+    ``phrases`` indexes (tokens, mask, rule, list type) by the last word, with
+    whitelist entries first as in ``CompiledRules``.
+    """
+    modes: Tuple[str, ...]
+    words: Dict[str, Tuple[Tuple[int, str, str], ...]]
+    phrases: Dict[str, List[Tuple[Tuple[str, ...], int, str, str]]]
+    max_phrase_words: int = 1
+    max_whitelist_words: int = 1
+    stemming: bool = False
+
+    def mask_modes(self, mask: int) -> List[str]:
+        return [mode for bit, mode in enumerate(self.modes) if mask >> bit & 1]
+
+
+def merge_rules(compiled: Dict[str, CompiledRules]) -> MultiModeRules:
+    """Merge per-mode compiled rules so each rule is only stored once.
+
+    Every mode must have been compiled with the same ``stemming``.
+    """
+    modes = tuple(compiled)
+    stemming = {rules.stemming for rules in compiled.values()}
+    if len(stemming) > 1:
+        raise ValueError("Cannot merge stemmed and unstemmed rules")
+    words: Dict[str, Dict[Tuple[str, str], int]] = {}
+    phrases: Dict[str, Dict[Tuple[Tuple[str, ...], str, str], int]] = {}
+    for bit, mode in enumerate(modes):
+        rules = compiled[mode]
+        for list_type, table in (('whitelist', rules.whitelist), ('blacklist', rules.blacklist)):
+            for word, rule in table.items():
+                entries = words.setdefault(word, {})
+                entries[(rule, list_type)] = entries.get((rule, list_type), 0) | 1 << bit
+        for last_word, candidates in rules.phrases.items():
+            entries = phrases.setdefault(last_word, {})
+            for tokens, rule, list_type in candidates:
+                entries[(tokens, rule, list_type)] = entries.get((tokens, rule, list_type), 0) | 1 << bit
+
+    def whitelist_first(entry) -> bool:
+        return entry[-1] != 'whitelist'
+
+    return MultiModeRules(
+        modes=modes,
+        words={word: tuple(sorted(((mask, rule, list_type) for (rule, list_type), mask in entries.items()),
+                                  key=whitelist_first))
+               for word, entries in words.items()},
+        phrases={word: sorted(((tokens, mask, rule, list_type)
+                               for (tokens, rule, list_type), mask in entries.items()),
+                              key=whitelist_first)
+                 for word, entries in phrases.items()},
+        max_phrase_words=max((rules.max_phrase_words for rules in compiled.values()), default=1),
+        max_whitelist_words=max((rules.max_whitelist_words for rules in compiled.values()), default=1),
+        stemming=stemming.pop() if stemming else False,
+    )
+
+
+def compile_modes(lists: Dict[str, Tuple[List[str], List[str]]], stemming: bool = False) -> MultiModeRules:
+    """Compile {mode: (whitelist, blacklist)} into one multi-mode table"""
+    return merge_rules({mode: compile_rules(whitelist, blacklist, stemming)
+                        for mode, (whitelist, blacklist) in lists.items()})
+
+
+class MultiModeScanner(ContentScanner):
+    """``ContentScanner`` that evaluates every mode of a ``MultiModeRules``.
+
+    Each word is looked up once; hits are recorded with the mask of the
+    modes they apply to and only split per mode by ``finish``. ``feed`` and
+    ``flush`` return (mask, span) pairs. A whitelist match only suppresses a
+    blacklist hit for the modes listing both. In verdict-only mode the scan
+    stops once every mode is blocked.
+    """
+
+    def __init__(self, rules: MultiModeRules, evaluation: str = FULL_REPORT, collect: bool = True):
+        super().__init__(rules, evaluation, collect)
+        self._all_modes = (1 << len(rules.modes)) - 1
+        self._blocked = 0
+        self._first_hits: Dict[int, str] = {}
+        self._masked_spans: List[Tuple[int, MatchSpan]] = []
+        self._mask_counts = Counter()
+        self._suppressed_masks = Counter()
+
+    def _release(self, entry: Tuple[int, MatchSpan]) -> List[Tuple[int, MatchSpan]]:
+        mask, span = entry
+        self._mask_counts[(mask, 'blacklist')] += 1
+        self.blacklist_hits += 1
+        newly_blocked = mask & ~self._blocked
+        if newly_blocked:
+            self._blocked |= newly_blocked
+            for bit in range(newly_blocked.bit_length()):
+                if newly_blocked >> bit & 1:
+                    self._first_hits[bit] = span.rule
+            if self.first_hit is None:
+                self.first_hit = span.rule
+            if self.evaluation == VERDICT_ONLY and self._blocked == self._all_modes:
+                self.done = True
+        if self.collect:
+            self._masked_spans.append(entry)
+        return [entry]
+
+    def _protect(self, first_word: int, mask: int):
+        """Clear ``mask`` from held hits starting at or after ``first_word``"""
+        kept = deque()
+        for first, (held_mask, span) in self._held:
+            if first >= first_word and held_mask & mask:
+                self._suppressed_masks[held_mask & mask] += 1
+                held_mask &= ~mask
+                if not held_mask:
+                    self.suppressed_hits += 1
+                    continue
+            kept.append((first, (held_mask, span)))
+        self._held = kept
+
+    def _scan(self, text: str, pos: int, endpos: int) -> List[Tuple[int, MatchSpan]]:
+        words, phrases = self.rules.words, self.rules.phrases
+        stemming = self.rules.stemming
+        stems = STEM_CACHE
+        verdict_only = self.evaluation == VERDICT_ONLY
+        reach = self.rules.max_whitelist_words - 1
+        window = self._window
+        held = self._held
+        offset = self._offset
+        hits = []
+        for match in _WORD_RE.finditer(text, pos, endpos):
+            word = match.group().lower()
+            if stemming:
+                word = stems.get(word) or stem(word)
+            start, end = offset + match.start(), offset + match.end()
+            index = self.total_words
+            self.total_words += 1
+            window.append((word, start))
+            entries = words.get(word, ())
+            candidates = phrases.get(word, ())
+            for mask, rule, list_type in entries:
+                if list_type == 'blacklist':
+                    held.append((index, (mask, MatchSpan(start, end, rule, list_type))))
+            for tokens, mask, rule, list_type in candidates:
+                size = len(tokens)
+                if list_type == 'blacklist' and size <= len(window) and \
+                        all(window[i - size][0] == tokens[i] for i in range(size - 1)):
+                    held.append((index - size + 1, (mask, MatchSpan(window[-size][1], end, rule, list_type))))
+            if held or not verdict_only:
+                found = []
+                for mask, rule, list_type in entries:
+                    if list_type == 'whitelist':
+                        found.append((index, mask, MatchSpan(start, end, rule, list_type)))
+                for tokens, mask, rule, list_type in candidates:
+                    size = len(tokens)
+                    if list_type == 'whitelist' and size <= len(window) and \
+                            all(window[i - size][0] == tokens[i] for i in range(size - 1)):
+                        found.append((index - size + 1, mask, MatchSpan(window[-size][1], end, rule, list_type)))
+                for first, mask, span in found:
+                    if held:
+                        self._protect(first, mask)
+                        held = self._held
+                    if not verdict_only:
+                        self._mask_counts[(mask, 'whitelist')] += 1
+                        self.whitelist_hits += 1
+                        hits.append((mask, span))
+                        if self.collect:
+                            self._masked_spans.append((mask, span))
+            while held and held[0][0] + reach <= index:
+                hits.extend(self._release(held.popleft()[1]))
+                if self.done:
+                    return hits
+        return hits
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """Hits so far per mode and list type"""
+        counts = {mode: {'whitelist': 0, 'blacklist': 0} for mode in self.rules.modes}
+        for (mask, list_type), count in self._mask_counts.items():
+            for mode in self.rules.mask_modes(mask):
+                counts[mode][list_type] += count
+        return counts
+
+    def finish(self) -> Dict[str, AnalysisResult]:
+        """Scan any held-back text and build one result per mode"""
+        self.flush()
+        results = {}
+        for bit, mode in enumerate(self.rules.modes):
+            blocked = bool(self._blocked >> bit & 1)
+            first_hit = self._first_hits.get(bit)
+            suppressed = sum(count for mask, count in self._suppressed_masks.items() if mask >> bit & 1)
+            if self.evaluation == VERDICT_ONLY:
+                results[mode] = AnalysisResult(blocked=blocked, evaluation=VERDICT_ONLY, first_hit=first_hit,
+                                               suppressed=suppressed)
+                continue
+            spans = [span for mask, span in self._masked_spans if mask >> bit & 1] if self.collect else None
+            results[mode] = AnalysisResult(
+                blocked=blocked,
+                total_words=self.total_words,
+                whitelisted=[span.rule for span in spans if span.list_type == 'whitelist'] if self.collect else None,
+                blacklisted=[span.rule for span in spans if span.list_type == 'blacklist'] if self.collect else None,
+                first_hit=first_hit,
+                spans=spans,
+                suppressed=suppressed,
+            )
+        return results
+
+
+def evaluate_modes(text: str, rules: MultiModeRules, evaluation: str = FULL_REPORT) -> Dict[str, AnalysisResult]:
+    """Analyze content against every mode of ``rules`` in one pass"""
+    scanner = MultiModeScanner(rules, evaluation)
+    scanner.feed(text)
+    return scanner.finish()
+
+
+def iter_text_chunks(stream: BinaryIO, chunk_size: int = 64 * 1024,
+                     encoding: str = 'utf-8') -> Iterator[str]:
+    """Read a binary file object in fixed-size chunks and decode them.
+
+    An incremental decoder keeps multi-byte characters split across reads
+    intact.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            break
+        text = decoder.decode(data)
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+HIGHLIGHT_COLORS = {'whitelist': '#c8e6c9', 'blacklist': '#ffcdd2'}
+
+
+def highlight_html(text: str, spans: List[MatchSpan]) -> str:
+    """Render the text as HTML with every span wrapped in a colored <mark>.
+
+    The text is walked once in span order; a span overlapping an earlier,
+    wider one is skipped so the output stays well formed.
+    """
+    parts = []
+    position = 0
+    for span in sorted(spans, key=lambda span: (span.start, -span.end)):
+        if span.start < position:
+            continue
+        parts.append(html.escape(text[position:span.start]))
+        parts.append(
+            f'<mark style="background-color: {HIGHLIGHT_COLORS[span.list_type]};" '
+            f'title="{html.escape(span.list_type)}: {html.escape(span.rule)}">'
+            f'{html.escape(text[span.start:span.end])}</mark>'
+        )
+        position = span.end
+    parts.append(html.escape(text[position:]))
+    return ''.join(parts).replace('\n', '<br>')
+
+
+def analyze_content(text: str, whitelist: List[str], blacklist: List[str],
+                    evaluation: str = FULL_REPORT, stemming: bool = False) -> AnalysisResult:
+    """Analyze content in the requested evaluation mode"""
+    return evaluate(text, compile_rules(whitelist, blacklist, stemming), evaluation)
+
+
+def evaluate(text: str, rules: CompiledRules, evaluation: str = FULL_REPORT) -> AnalysisResult:
+    if evaluation == VERDICT_ONLY:
+        return check_verdict(text, rules)
+    if evaluation == FULL_REPORT:
+        return full_report(text, rules)
+    raise ValueError(f"Unknown evaluation mode: {evaluation}")
+
+
+def _result_size(key: Tuple, result: AnalysisResult) -> int:
+    """Approximate memory held by one cache entry"""
+    size = sys.getsizeof(key) + sum(sys.getsizeof(part) for part in key)
+    size += sys.getsizeof(result)
+    for words in (result.whitelisted, result.blacklisted):
+        if words is not None:
+            size += sys.getsizeof(words)
+    if result.spans is not None:
+        size += sys.getsizeof(result.spans) + sum(sys.getsizeof(span) for span in result.spans)
+    return size
+
+
+class VerdictCache:
+    """LRU (optionally TTL) cache of analysis results.
+
+    Entries are keyed by (mode, ruleset version, content hash, evaluation
+    mode, stemming), where verdicts hash the normalized content and full
+    reports the exact text; a cached full report also answers verdict-only
+    lookups. Callers bump the mode's ruleset version whenever its lists
+    change and call ``invalidate(mode)`` so stale entries are dropped right
+    away. Compiled lookup sets are also kept per (mode, version, stemming).
+
+    ``prebuilt(mode, version)`` may return ready unstemmed compiled rules,
+    e.g. a mapped ``filter_matcher`` file, or None to compile from the lists.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None,
+                 prebuilt: Optional[Callable[[str, int], Optional[CompiledRules]]] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.prebuilt = prebuilt
+        self._entries: "OrderedDict[Tuple, Tuple[float, int, AnalysisResult]]" = OrderedDict()
+        self._memory = 0
+        self._compiled: Dict[Tuple[str, int, bool], CompiledRules] = {}
+        self._merged: Optional[Tuple[Tuple, MultiModeRules]] = None
+        self.hits = 0
+        self.misses = 0
+
+    def _drop(self, key: Tuple):
+        _, size, _ = self._entries.pop(key)
+        self._memory -= size
+
+    def _lookup(self, key: Tuple) -> Optional[AnalysisResult]:
+        entry = self._entries.get(key)
+        if entry is not None and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+            self._drop(key)
+            entry = None
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[2]
+
+    def get(self, mode: str, version: int, text: str,
+            evaluation: str = FULL_REPORT, stemming: bool = False) -> Optional[AnalysisResult]:
+        result = self._lookup((mode, version, content_hash(text, exact=True), FULL_REPORT, stemming))
+        if result is None and evaluation == VERDICT_ONLY:
+            result = self._lookup((mode, version, content_hash(text), VERDICT_ONLY, stemming))
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, mode: str, version: int, text: str, result: AnalysisResult, stemming: bool = False):
+        exact = result.evaluation == FULL_REPORT
+        key = (mode, version, content_hash(text, exact=exact), result.evaluation, stemming)
+        if key in self._entries:
+            self._drop(key)
+        size = _result_size(key, result)
+        self._entries[key] = (time.monotonic(), size, result)
+        self._memory += size
+        while len(self._entries) > self.maxsize:
+            self._drop(next(iter(self._entries)))
+
+    def rules(self, mode: str, version: int,
+              load_lists: Callable[[], Tuple[List[str], List[str]]], stemming: bool = False) -> CompiledRules:
+        """Compiled lookup tables for a mode, built once per ruleset version.
+
+        ``load_lists`` returns the mode's (whitelist, blacklist) and is only
+        called when the tables need to be (re)built.
+        """
+        key = (mode, version, stemming)
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            for stale in [k for k in self._compiled if k[0] == mode and k[1] != version]:
+                del self._compiled[stale]
+            if self.prebuilt is not None and not stemming:
+                compiled = self.prebuilt(mode, version)
+            if compiled is None:
+                compiled = compile_rules(*load_lists(), stemming=stemming)
+            self._compiled[key] = compiled
+        return compiled
+
+    def modes_rules(self, versions: Dict[str, int],
+                    load_lists: Callable[[str], Tuple[List[str], List[str]]],
+                    stemming: bool = False) -> MultiModeRules:
+        """Merged rules of several modes, rebuilt when any of their versions changes.
+
+        ``versions`` maps each mode to its ruleset version; ``load_lists(mode)``
+        is only called for modes whose compiled tables are not cached.
+        """
+        key = (tuple(versions.items()), stemming)
+        if self._merged is None or self._merged[0] != key:
+            compiled = {mode: self.rules(mode, version, lambda mode=mode: load_lists(mode), stemming)
+                        for mode, version in versions.items()}
+            self._merged = (key, merge_rules(compiled))
+        return self._merged[1]
+
+    def patch_rules(self, mode: str, old_version: int, new_version: int,
+                    added: Dict[str, List[str]], removed: Dict[str, List[str]]):
+        """Move a mode's compiled tables to a new version by applying a delta.
+
+        Results of older versions are dropped. If the old version was never
+        compiled, nothing is kept and the next lookup compiles from scratch.
+        """
+        compiled = {key[2]: rules for key, rules in self._compiled.items() if key[:2] == (mode, old_version)}
+        self.invalidate(mode)
+        for stemming, rules in compiled.items():
+            self._compiled[(mode, new_version, stemming)] = update_rules(rules, added, removed)
+
+    def analyze(self, mode: str, version: int, text: str,
+                load_lists: Callable[[], Tuple[List[str], List[str]]],
+                evaluation: str = FULL_REPORT, stemming: bool = False) -> AnalysisResult:
+        """Return the cached result for this content or analyze and store it"""
+        result = self.get(mode, version, text, evaluation, stemming)
+        if result is None:
+            rules = self.rules(mode, version, load_lists, stemming)
+            result = evaluate(text, rules, evaluation)
+            self.put(mode, version, text, result, stemming)
+        return result
+
+    def invalidate(self, mode: Optional[str] = None):
+        """Drop all entries for a mode, or every entry when no mode is given"""
+        if mode is None:
+            self._entries.clear()
+            self._compiled.clear()
+            self._merged = None
+            self._memory = 0
+            return
+        for key in [k for k in self._entries if k[0] == mode]:
+            self._drop(key)
+        for key in [k for k in self._compiled if k[0] == mode]:
+            del self._compiled[key]
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'entries': len(self._entries),
+            'memory_bytes': self._memory,
+        }
+
+
+def benchmark_evaluation_modes(words: int = 200_000, rules: int = 5_000,
+                               hit_position: float = 0.1, repeat: int = 5) -> Dict[str, float]:
+    """Time both evaluation modes on synthetic blocked content.
+
+    The decisive blacklist word is placed ``hit_position`` of the way into
+    the text. Returns the best time in seconds for each mode and the
+    resulting speedup of verdict-only over the full report.
+    """
+    import random
+    import timeit
+
+    rng = random.Random(0)
+    vocabulary = [f"word{i}" for i in range(rules * 4)]
+    compiled = compile_rules(vocabulary[:rules], vocabulary[rules:rules * 2])
+    body = [rng.choice(vocabulary[rules * 2:]) for _ in range(words)]
+    body[int(words * hit_position)] = vocabulary[rules]
+    text = ' '.join(body)
+
+    timings = {
+        evaluation: min(timeit.repeat(lambda e=evaluation: evaluate(text, compiled, e),
+                                      number=1, repeat=repeat))
+        for evaluation in EVALUATION_MODES
+    }
+    timings['speedup'] = timings[FULL_REPORT] / timings[VERDICT_ONLY]
+    return timings
+
+
+if __name__ == '__main__':
+    for name, value in benchmark_evaluation_modes().items():
+        print(f"{name:>8}: {value:.4f}")
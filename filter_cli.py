@@ -0,0 +1,342 @@
+"""Command line interface for batch jobs.
+
+    python filter_cli.py scan --mode "Child Safe Mode" report.txt other.txt
+    python filter_cli.py scan --all-modes report.txt
+    python filter_cli.py import --mode "Custom Mode" rules.csv
+    python filter_cli.py export --format txt -o rules.txt
+    python filter_cli.py --db rules.db patch --after last.json -o next.json
+    python filter_cli.py apply next.json
+    python filter_cli.py stats
+    python filter_cli.py build-matchers -o matchers/
+    python filter_cli.py --matchers matchers/ scan big.txt
+    python filter_cli.py bench
+    python filter_cli.py --profile report.txt scan big.txt
+
+Rules come from the JSON configuration (``--config``) or, with ``--db`` or
+CONTENT_FILTER_DB, from the shared SQLite database. Only ``argparse`` is
+imported at startup; every command imports what it needs when it runs.
+"""
+import argparse
+import os
+import sys
+
+DEFAULT_MODE = 'Child Safe Mode'
+
+
+def open_store(args):
+    from filter_core import DEFAULT_CONFIG, open_store as open_rule_store
+    return open_rule_store(args.db, args.config or DEFAULT_CONFIG)
+
+
+def rules_source(args) -> str:
+    from filter_core import DEFAULT_CONFIG, rules_source as source
+    return source(args.db, args.config or DEFAULT_CONFIG)
+
+
+def open_matchers(args):
+    """Prebuilt matchers from ``--matchers``, if given"""
+    if not args.matchers:
+        return None
+    from filter_matcher import MatcherDirectory
+    return MatcherDirectory(args.matchers, rules_source(args))
+
+
+def known_modes(store, modes) -> bool:
+    """Report modes the store lacks; the stores would create them empty, letting everything through"""
+    unknown = [mode for mode in modes if mode not in store.modes()]
+    if unknown:
+        print(f"Unknown mode: {', '.join(unknown)}", file=sys.stderr)
+    return not unknown
+
+
+def scan_all_modes(args, store, evaluation) -> int:
+    from filter_core import all_mode_rules, scan_stream_modes
+
+    if not known_modes(store, args.modes or ()):
+        return 2
+    rules = all_mode_rules(store, args.modes, args.stem)
+    blocked = False
+    for path in args.files:
+        if path == '-':
+            results, counts = scan_stream_modes(rules, sys.stdin.buffer, evaluation)
+        else:
+            with open(path, 'rb') as stream:
+                results, counts = scan_stream_modes(rules, stream, evaluation)
+        print(f'{path}:')
+        for mode, result in results.items():
+            blocked = blocked or result.blocked
+            detail = f'first hit: {result.first_hit}' if result.first_hit else 'no blacklist hits'
+            if result.total_words is not None:
+                detail += (f", {counts[mode]['whitelist']} whitelisted, "
+                           f"{counts[mode]['blacklist']} blacklisted")
+            print(f'  {result.status:<7}  {mode} ({detail})')
+    return 1 if blocked else 0
+
+
+def command_scan(args) -> int:
+    from filter_analysis import FULL_REPORT, VERDICT_ONLY
+    from filter_core import mode_rules, scan_stream
+
+    store = open_store(args)
+    evaluation = VERDICT_ONLY if args.verdict else FULL_REPORT
+    if args.all_modes or args.modes:
+        return scan_all_modes(args, store, evaluation)
+    if not known_modes(store, [args.mode]):
+        return 2
+    rules = mode_rules(store, args.mode, open_matchers(args), args.stem)
+    blocked = False
+    for path in args.files:
+        if path == '-':
+            result, rule_counts = scan_stream(rules, sys.stdin.buffer, evaluation)
+        else:
+            with open(path, 'rb') as stream:
+                result, rule_counts = scan_stream(rules, stream, evaluation)
+        blocked = blocked or result.blocked
+        if evaluation == VERDICT_ONLY:
+            detail = f'first hit: {result.first_hit}' if result.first_hit else 'no blacklist hits'
+        else:
+            whitelisted = sum(count for (list_type, _), count in rule_counts.items() if list_type == 'whitelist')
+            blacklisted = sum(count for (list_type, _), count in rule_counts.items() if list_type == 'blacklist')
+            detail = f'{result.total_words} words, {whitelisted} whitelisted, {blacklisted} blacklisted'
+        print(f'{path}: {result.status} ({detail})')
+        for (list_type, rule), count in rule_counts.most_common(args.top):
+            print(f'  {count:>8}  {list_type:<9}  {rule}')
+    return 1 if blocked else 0
+
+
+def command_import(args) -> int:
+    from filter_core import DEFAULT_CONFIG, read_rules, rule_format, save_configuration
+    from filter_merge import plan_merge
+
+    store = open_store(args)
+    if not known_modes(store, [args.mode]):
+        return 2
+    for path in args.files:
+        with open(path, newline='') as f:
+            incoming = read_rules(f, rule_format(path), args.list)
+        current = {list_type: store.items(args.mode, list_type) for list_type in incoming}
+        plan = plan_merge(current, incoming)
+        summary = plan.summary()
+        print(f"{path}: {summary['added_whitelist']} new whitelist, {summary['added_blacklist']} new blacklist, "
+              f"{summary['duplicates']} duplicates, {summary['conflicts']} conflicts")
+        if args.dry_run:
+            continue
+        with store.action(f'Import {path}'):
+            for list_type, items in plan.additions(args.skip_conflicts).items():
+                store.add_items(args.mode, list_type, items)
+
+    if not args.dry_run and not args.db:
+        save_configuration(store.to_mode_data(), args.config or DEFAULT_CONFIG)
+    return 0
+
+
+def command_export(args) -> int:
+    from filter_core import export_rules, iter_export_chunks, mode_lists, rule_format
+
+    store = open_store(args)
+    if not known_modes(store, [args.mode]):
+        return 2
+    lists = mode_lists(store, args.mode)
+    if args.output:
+        export_rules(args.mode, lists, args.output, args.format or rule_format(args.output))
+    else:
+        for chunk in iter_export_chunks(args.mode, lists, args.format or 'csv'):
+            sys.stdout.write(chunk)
+    return 0
+
+
+def command_patch(args) -> int:
+    from filter_core import read_patch, save_patch
+    from filter_delta import DeltaUnavailable, dump_patch, make_patch, patch_size, patch_versions
+
+    if not args.db:
+        print('Patches are exported from a rule database; pass --db or set CONTENT_FILTER_DB', file=sys.stderr)
+        return 2
+    store = open_store(args)
+    if args.mode and not known_modes(store, [args.mode]):
+        return 2
+    since = patch_versions(read_patch(args.after)) if args.after else args.since
+    modes = [args.mode] if args.mode else None
+    try:
+        patch = make_patch(store, since, modes)
+    except DeltaUnavailable as e:
+        print(f'{e}; export the full lists instead', file=sys.stderr)
+        return 1
+    if args.output:
+        save_patch(patch, args.output)
+        added, removed = patch_size(patch)
+        print(f'{args.output}: {added} additions, {removed} removals', file=sys.stderr)
+    else:
+        print(dump_patch(patch))
+    return 0
+
+
+def command_apply(args) -> int:
+    from filter_core import DEFAULT_CONFIG, read_patch, save_configuration
+    from filter_delta import apply_patch
+
+    store = open_store(args)
+    for path in args.files:
+        for mode, (added, removed) in apply_patch(store, read_patch(path)).items():
+            print(f'{path}: {mode}: {added} added, {removed} removed')
+    if not args.db:
+        save_configuration(store.to_mode_data(), args.config or DEFAULT_CONFIG)
+    return 0
+
+
+def command_stats(args) -> int:
+    from filter_overlap import analyze_overlaps
+
+    store = open_store(args)
+    if args.mode and not known_modes(store, [args.mode]):
+        return 2
+    for mode in [args.mode] if args.mode else store.modes():
+        whitelist, blacklist = store.items(mode, 'whitelist'), store.items(mode, 'blacklist')
+        overlap = analyze_overlaps({'whitelist': whitelist, 'blacklist': blacklist}).summary()
+        print(f'{mode}:')
+        print(f'  whitelist: {len(whitelist)} items')
+        print(f'  blacklist: {len(blacklist)} items')
+        print(f"  on both lists: {overlap['both_lists']}, shadowed: {overlap['shadowed']}, "
+              f"never fire: {overlap['never_fire']}")
+    return 0
+
+
+def command_build_matchers(args) -> int:
+    from filter_matcher import build_matchers
+
+    store = open_store(args)
+    if args.mode and not known_modes(store, [args.mode]):
+        return 2
+    modes = [args.mode] if args.mode else None
+    for mode, path, size in build_matchers(store, args.output, rules_source(args), modes):
+        print(f'{path}: {mode} version {store.version(mode)}, {size / 1024 / 1024:.1f} MB')
+    return 0
+
+
+def command_verdicts(args) -> int:
+    from datetime import datetime, timedelta, timezone
+    from filter_verdicts import VerdictLog, log_summary
+
+    log = VerdictLog(args.log)
+    if args.compact:
+        merged = log.compact()
+        print(f'Merged small segments into {merged}' if merged else 'Nothing to compact', file=sys.stderr)
+    since = datetime.now(timezone.utc) - timedelta(days=args.days) if args.days else None
+    summary = log_summary(log, since, args.top)
+    print(f'{summary.analyses} analyses, {summary.blocked} blocked ({summary.block_rate:.1%}), '
+          f'{summary.words} words, from {len(log.segments())} segments in {summary.query_seconds:.3f}s')
+    for row in summary.by_mode.to_dict('records'):
+        print(f"  {row['Mode']}: {row['Analyses']} analyses, {row['Blocked']} blocked ({row['Block Rate']:.1%})")
+    if len(summary.top_rules):
+        print('Top blacklist rules:')
+        for row in summary.top_rules.itertuples(index=False):
+            print(f'  {row.Analyses:>8}  {row.Rule}')
+    return 0
+
+
+def command_bench(args) -> int:
+    from filter_analysis import benchmark_evaluation_modes
+
+    timings = benchmark_evaluation_modes(words=args.words, rules=args.rules, repeat=args.repeat)
+    for name, value in timings.items():
+        print(f'{name:>8}: {value:.4f}')
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='filter_cli', description='Content filter batch tools')
+    parser.add_argument('--config', help='JSON configuration file (default: content_filter_config.json)')
+    parser.add_argument('--db', default=os.environ.get('CONTENT_FILTER_DB'),
+                        help='SQLite rule database (default: $CONTENT_FILTER_DB)')
+    parser.add_argument('--matchers', metavar='DIR', default=os.environ.get('CONTENT_FILTER_MATCHERS'),
+                        help='prebuilt matchers to scan with when they match the rules '
+                             '(default: $CONTENT_FILTER_MATCHERS)')
+    parser.add_argument('--profile', metavar='REPORT',
+                        help="write a CPU and allocation profile of the command to REPORT ('-' for stderr)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    scan = commands.add_parser('scan', help='analyze files against a mode')
+    scan.add_argument('files', nargs='+', help="files to scan, '-' for stdin")
+    scan.add_argument('--mode', default=DEFAULT_MODE)
+    scan.add_argument('--all-modes', action='store_true', help='verdicts for every mode from a single pass')
+    scan.add_argument('--modes', type=lambda value: [mode.strip() for mode in value.split(',')],
+                      metavar='MODE,MODE', help='verdicts for these comma-separated modes from a single pass')
+    scan.add_argument('--verdict', action='store_true', help='stop at the first blacklist hit')
+    scan.add_argument('--stem', action='store_true', help='also match inflected forms (kills, killed, killing)')
+    scan.add_argument('--top', type=int, default=0, help='list the N most frequent rule hits')
+    scan.set_defaults(handler=command_scan)
+
+    import_ = commands.add_parser('import', help='merge CSV/TXT rule files into a mode')
+    import_.add_argument('files', nargs='+')
+    import_.add_argument('--mode', default=DEFAULT_MODE)
+    import_.add_argument('--list', choices=['whitelist', 'blacklist'],
+                         help='list for plain TXT lines outside any section')
+    import_.add_argument('--skip-conflicts', action='store_true',
+                         help='leave out incoming items that would end up on both lists')
+    import_.add_argument('--dry-run', action='store_true', help='only print the merge summary')
+    import_.set_defaults(handler=command_import)
+
+    export = commands.add_parser('export', help="write a mode's lists as CSV or TXT")
+    export.add_argument('--mode', default=DEFAULT_MODE)
+    export.add_argument('--format', choices=['csv', 'txt'],
+                        help='default: from the output file name, else csv')
+    export.add_argument('-o', '--output', help='output file (default: stdout)')
+    export.set_defaults(handler=command_export)
+
+    patch = commands.add_parser('patch', help='export the changes since a version as a delta patch')
+    patch.add_argument('--mode', help='only this mode (default: every mode)')
+    since = patch.add_mutually_exclusive_group()
+    since.add_argument('--since', type=int, default=0, help='database version to diff from (default: 0)')
+    since.add_argument('--after', metavar='PATCH', help='continue from the versions a previous patch ended at')
+    patch.add_argument('-o', '--output', help='output file (default: stdout)')
+    patch.set_defaults(handler=command_patch)
+
+    apply = commands.add_parser('apply', help='apply delta patches')
+    apply.add_argument('files', nargs='+')
+    apply.set_defaults(handler=command_apply)
+
+    stats = commands.add_parser('stats', help='list sizes and rule overlap per mode')
+    stats.add_argument('--mode', help='only this mode')
+    stats.set_defaults(handler=command_stats)
+
+    build = commands.add_parser('build-matchers', help='prebuild compiled matchers that scans map instead of compiling')
+    build.add_argument('--mode', help='only this mode (default: every mode)')
+    build.add_argument('-o', '--output', default='matchers', help='directory for the matcher files (default: matchers)')
+    build.set_defaults(handler=command_build_matchers)
+
+    verdicts = commands.add_parser('verdicts', help='summarize the verdict log of the Streamlit app')
+    verdicts.add_argument('--log', metavar='DIR', default=os.environ.get('CONTENT_FILTER_VERDICT_LOG') or 'verdict_log',
+                          help='verdict log directory (default: $CONTENT_FILTER_VERDICT_LOG or verdict_log)')
+    verdicts.add_argument('--days', type=float, help='only the last N days (default: everything)')
+    verdicts.add_argument('--top', type=int, default=10, help='list the N most frequent blacklist rules')
+    verdicts.add_argument('--compact', action='store_true', help='first merge the small segments into one')
+    verdicts.set_defaults(handler=command_verdicts)
+
+    bench = commands.add_parser('bench', help='time the full-report and verdict-only analysis')
+    bench.add_argument('--words', type=int, default=200_000)
+    bench.add_argument('--rules', type=int, default=5_000)
+    bench.add_argument('--repeat', type=int, default=5)
+    bench.set_defaults(handler=command_bench)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if not args.profile:
+        return args.handler(args)
+
+    from filter_profile import Profiler
+    profiler = Profiler()
+    profiler.arm(1)
+    try:
+        with profiler.profile(' '.join(sys.argv[1:] if argv is None else argv)):
+            return args.handler(args)
+    finally:
+        if args.profile == '-':
+            sys.stderr.write(profiler.report())
+        else:
+            profiler.save_report(args.profile)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
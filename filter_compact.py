@@ -0,0 +1,170 @@
+"""Compact storage for very large rule lists.
+
+A Python list of ``str`` costs a pointer plus a full string object (49+
+bytes of header) per rule. ``CompactList`` keeps every item UTF-8 encoded in
+one contiguous ``bytearray`` with an ``array`` of end offsets, so a rule costs
+its encoded length plus 4 bytes (8 once the buffer passes 4 GiB). Membership
+uses an open-addressing hash table of item positions (4 bytes per slot, 2 to 4
+slots per item, built on first use) that compares candidates against the
+buffer in place. Items only become ``str`` objects
+when they are read.
+"""
+import json
+import zlib
+from array import array
+from typing import Iterable, Iterator, List, Union
+
+_EMPTY = -1
+# Offsets are 32-bit until the buffer outgrows them
+_MAX_SHORT_OFFSET = 0xFFFFFFFF
+
+
+class CompactList:
+    """Sequence of strings stored in a single UTF-8 buffer.
+
+    Supports ``len``, indexing, slicing (which returns a new ``CompactList``),
+    iteration, ``in``, ``index``, ``append``/``extend`` and ``sort``; convert
+    with ``to_list``/``from_list`` or ``to_json``/``from_json``.
+    """
+
+    __slots__ = ('_data', '_offsets', '_table', '_mask')
+
+    def __init__(self, items: Iterable[str] = ()):
+        self._data = bytearray()
+        self._offsets = array('I', [0])
+        self._table = None
+        self._mask = 0
+        self.extend(items)
+
+    @classmethod
+    def from_list(cls, items: Iterable[str]) -> 'CompactList':
+        return items.copy() if isinstance(items, CompactList) else cls(items)
+
+    @classmethod
+    def from_json(cls, text: str) -> 'CompactList':
+        return cls(json.loads(text))
+
+    def to_list(self) -> List[str]:
+        return list(self)
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_list())
+
+    def copy(self) -> 'CompactList':
+        clone = CompactList()
+        clone._data = bytearray(self._data)
+        clone._offsets = array(self._offsets.typecode, self._offsets)
+        return clone
+
+    # Sequence protocol
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def _encoded(self, index: int) -> memoryview:
+        return memoryview(self._data)[self._offsets[index]:self._offsets[index + 1]]
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return CompactList(self[i] for i in range(start, stop, step))
+            part = CompactList()
+            if start < stop:
+                base = self._offsets[start]
+                part._data = self._data[base:self._offsets[stop]]
+                part._offsets = array(self._offsets.typecode, (offset - base for offset in self._offsets[start:stop + 1]))
+            return part
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('CompactList index out of range')
+        return self._data[self._offsets[index]:self._offsets[index + 1]].decode()
+
+    def __iter__(self) -> Iterator[str]:
+        data, offsets = self._data, self._offsets
+        for index in range(len(offsets) - 1):
+            yield data[offsets[index]:offsets[index + 1]].decode()
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, CompactList):
+            return self._offsets == other._offsets and self._data == other._data
+        if isinstance(other, list):
+            return len(other) == len(self) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        preview = ', '.join(repr(item) for item in self[:5])
+        more = f', ... {len(self) - 5} more' if len(self) > 5 else ''
+        return f'CompactList([{preview}{more}])'
+
+    # Hash index
+
+    def _insert(self, position: int, encoded):
+        table, mask = self._table, self._mask
+        slot = zlib.crc32(encoded) & mask
+        while table[slot] != _EMPTY:
+            slot = (slot + 1) & mask
+        table[slot] = position
+
+    def _build_index(self, capacity: int):
+        size = 8
+        while size < capacity * 2:
+            size *= 2
+        self._table = array('i', [_EMPTY]) * size
+        self._mask = size - 1
+        for position in range(len(self)):
+            self._insert(position, self._encoded(position))
+
+    def index(self, item: str) -> int:
+        """Position of the first occurrence of item"""
+        if isinstance(item, str) and len(self):
+            if self._table is None:
+                self._build_index(len(self))
+            encoded = item.encode()
+            table, mask = self._table, self._mask
+            slot = zlib.crc32(encoded) & mask
+            # Positions are inserted in order, so the first match is the earliest
+            while table[slot] != _EMPTY:
+                if self._encoded(table[slot]) == encoded:
+                    return table[slot]
+                slot = (slot + 1) & mask
+        raise ValueError(f'{item!r} is not in CompactList')
+
+    def __contains__(self, item) -> bool:
+        try:
+            self.index(item)
+        except ValueError:
+            return False
+        return True
+
+    # Updates
+
+    def append(self, item: str):
+        self.extend((item,))
+
+    def extend(self, items: Iterable[str]):
+        data, offsets = self._data, self._offsets
+        for item in items:
+            encoded = item.encode()
+            data += encoded
+            if len(data) > _MAX_SHORT_OFFSET and offsets.typecode == 'I':
+                self._offsets = offsets = array('q', offsets)
+            offsets.append(len(data))
+            if self._table is not None:
+                if len(offsets) * 2 > len(self._table):
+                    self._build_index(len(self))
+                else:
+                    self._insert(len(offsets) - 2, encoded)
+
+    def sort(self, reverse: bool = False):
+        items = sorted(self, reverse=reverse)
+        self._data = bytearray()
+        self._offsets = array('I', [0])
+        self._table = None
+        self.extend(items)
+
+    def nbytes(self) -> int:
+        """Bytes held by the buffer, offsets and hash index"""
+        table = len(self._table) * self._table.itemsize if self._table is not None else 0
+        return len(self._data) + len(self._offsets) * self._offsets.itemsize + table
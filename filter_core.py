@@ -0,0 +1,296 @@
+"""Headless core shared by the Qt app, the Streamlit app and the CLI.
+
+Nothing here imports a GUI toolkit, so batch jobs and worker processes can
+open a rule store, load and save configurations, import and export lists
+and analyze content without PyQt6 or Streamlit installed.
+"""
+import csv
+import io
+import json
+import os
+from collections import Counter
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from filter_analysis import (FULL_REPORT, AnalysisResult, CompiledRules, ContentScanner, MultiModeRules,
+                             MultiModeScanner, compile_modes, compile_rules, iter_text_chunks)
+from filter_delta import dump_patch, load_patch
+from filter_merge import LIST_TYPES, iter_csv_rules, iter_txt_rules, parse_csv_rules, parse_txt_rules
+from filter_store import MemoryRuleStore, SQLiteRuleStore, empty_mode_data
+
+DEFAULT_CONFIG = 'content_filter_config.json'
+SAMPLE_DATA = 'sample_filter_data.csv'
+EXPORT_FORMATS = ('csv', 'txt')
+EXPORT_CHUNK_SIZE = 10000
+DOCUMENT_CHUNK_SIZE = 256 * 1024
+
+ModeData = Dict[str, Dict[str, List[str]]]
+
+
+# Configuration files
+
+def load_configuration(path=DEFAULT_CONFIG) -> ModeData:
+    """Read a JSON configuration of every mode's lists"""
+    with open(path) as f:
+        return json.load(f)
+
+
+def iter_configuration_chunks(mode_data: ModeData) -> Iterator[str]:
+    return json.JSONEncoder(indent=4).iterencode(mode_data)
+
+
+def write_file(path, chunks: Iterable[str], cancelled: Optional[Callable[[], bool]] = None,
+               newline: Optional[str] = None) -> bool:
+    """Write text chunks to a temp file and move it into place when complete.
+
+    Returns False, leaving any existing file untouched, if ``cancelled``
+    reports True between chunks.
+    """
+    temp_name = f'{path}.part'
+    completed = True
+    try:
+        with open(temp_name, 'w', newline=newline) as f:
+            for chunk in chunks:
+                if cancelled is not None and cancelled():
+                    completed = False
+                    break
+                f.write(chunk)
+    except BaseException:
+        os.remove(temp_name)
+        raise
+    if not completed:
+        os.remove(temp_name)
+        return False
+    os.replace(temp_name, path)
+    return True
+
+
+def save_configuration(mode_data: ModeData, path=DEFAULT_CONFIG,
+                       cancelled: Optional[Callable[[], bool]] = None) -> bool:
+    return write_file(path, iter_configuration_chunks(mode_data), cancelled)
+
+
+def load_sample_data(path=SAMPLE_DATA) -> Optional[ModeData]:
+    """Build per-mode lists from the bundled Type,Item sample file, if present"""
+    if not Path(path).exists():
+        return None
+    with open(path, newline='') as f:
+        rules = read_rules(f, 'csv')
+    whitelist_items, blacklist_items = rules['whitelist'], rules['blacklist']
+    return {
+        'Child Safe Mode': {
+            'whitelist': whitelist_items[:10],  # First 10 items for Child Safe Mode
+            'blacklist': blacklist_items
+        },
+        'High School Teen Safe Mode': {
+            'whitelist': whitelist_items,       # All whitelist items for Teen Mode
+            'blacklist': blacklist_items[5:]   # Skip first 5 blacklist items for Teen Mode
+        },
+        'Custom Mode': {
+            'whitelist': [],
+            'blacklist': []
+        }
+    }
+
+
+def initial_mode_data(config=DEFAULT_CONFIG, sample=SAMPLE_DATA) -> ModeData:
+    """Default config, then sample data, then empty lists"""
+    if Path(config).exists():
+        try:
+            return load_configuration(config)
+        except (OSError, ValueError):
+            pass
+    return load_sample_data(sample) or empty_mode_data()
+
+
+def open_store(db_path: Optional[str] = None, config=DEFAULT_CONFIG, history_limit: int = 0,
+               compact: bool = False):
+    """Open the SQLite store at ``db_path`` (seeded from the config when empty)
+    or an in-memory store loaded from the config"""
+    if db_path:
+        store = SQLiteRuleStore(db_path)
+        if not any(store.count(mode, list_type) for mode in store.modes() for list_type in LIST_TYPES):
+            store.load_mode_data(initial_mode_data(config))
+        return store
+    return MemoryRuleStore(initial_mode_data(config), history_limit=history_limit, compact=compact)
+
+
+def mode_lists(store, mode: str) -> Dict[str, List[str]]:
+    return {list_type: store.items(mode, list_type) for list_type in LIST_TYPES}
+
+
+def rules_source(db_path: Optional[str] = None, config=DEFAULT_CONFIG, sample=SAMPLE_DATA) -> str:
+    """Identify where ``open_store`` takes the rules from, to stamp prebuilt matchers.
+
+    A database is identified by its path (its versions are shared); a
+    configuration or sample file also by its size and modification time,
+    since every process loading it starts at version 0.
+    """
+    if db_path:
+        return f'db:{os.path.abspath(db_path)}'
+    for kind, path in (('config', config), ('sample', sample)):
+        if Path(path).exists():
+            info = os.stat(path)
+            return f'{kind}:{os.path.abspath(path)}:{info.st_size}:{info.st_mtime_ns}'
+    return 'empty'
+
+
+def mode_rules(store, mode: str, matchers: Optional[Callable[[str, int], Optional[CompiledRules]]] = None,
+               stemming: bool = False) -> CompiledRules:
+    """A prebuilt matcher for the mode's current version if there is one, else freshly compiled rules"""
+    rules = matchers(mode, store.version(mode)) if matchers is not None and not stemming else None
+    if rules is None:
+        rules = compile_rules(store.items(mode, 'whitelist'), store.items(mode, 'blacklist'), stemming)
+    return rules
+
+
+# Import and export
+
+def rule_format(filename: str) -> str:
+    return 'csv' if str(filename).lower().endswith('.csv') else 'txt'
+
+
+def iter_rules(lines: Iterable[str], format_type: str,
+               default_list: Optional[str] = None) -> Iterator[Tuple[str, str]]:
+    """(list type, item) pairs from a CSV or TXT export"""
+    if format_type == 'csv':
+        return iter_csv_rules(lines)
+    return iter_txt_rules(lines, default_list)
+
+
+def read_rules(lines: Iterable[str], format_type: str, default_list: Optional[str] = None) -> Dict[str, List[str]]:
+    if format_type == 'csv':
+        return parse_csv_rules(lines)
+    return parse_txt_rules(lines, default_list)
+
+
+def iter_export_chunks(mode: str, lists: Dict[str, List[str]], format_type: str,
+                       chunk_size: int = EXPORT_CHUNK_SIZE,
+                       progress: Optional[Callable[[int, int], None]] = None) -> Iterator[str]:
+    """Render a mode's lists as CSV or TXT, ``chunk_size`` items at a time.
+
+    ``progress`` is called with (items rendered, total items) after each chunk.
+    """
+    if format_type not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {format_type}")
+    total = sum(len(lists.get(list_type, [])) for list_type in LIST_TYPES)
+    done = 0
+    if format_type == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['Type', 'Item'])
+        for list_type in LIST_TYPES:
+            items = lists.get(list_type, [])
+            for start in range(0, len(items), chunk_size):
+                chunk = items[start:start + chunk_size]
+                writer.writerows([list_type, item] for item in chunk)
+                yield buffer.getvalue()
+                done += len(chunk)
+                if progress is not None:
+                    progress(done, total)
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+        return
+
+    yield f'=== {mode} ===\n\n'
+    for list_type in LIST_TYPES:
+        items = lists.get(list_type, [])
+        yield '=== Whitelist ===\n' if list_type == 'whitelist' else '\n\n=== Blacklist ===\n'
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            yield ('\n' if start else '') + '\n'.join(chunk)
+            done += len(chunk)
+            if progress is not None:
+                progress(done, total)
+
+
+def export_text(mode: str, lists: Dict[str, List[str]], format_type: str) -> str:
+    return ''.join(iter_export_chunks(mode, lists, format_type))
+
+
+def export_rules(mode: str, lists: Dict[str, List[str]], path, format_type: Optional[str] = None,
+                 cancelled: Optional[Callable[[], bool]] = None,
+                 progress: Optional[Callable[[int, int], None]] = None) -> bool:
+    format_type = format_type or rule_format(path)
+    chunks = iter_export_chunks(mode, lists, format_type, progress=progress)
+    return write_file(path, chunks, cancelled, newline='')
+
+
+def iter_hit_report_chunks(rows: List[Tuple[str, str, int]], chunk_size: int = EXPORT_CHUNK_SIZE,
+                           progress: Optional[Callable[[int, int], None]] = None) -> Iterator[str]:
+    """Render (list type, rule, hits) rows as a Type,Item,Hits CSV"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['Type', 'Item', 'Hits'])
+    for start in range(0, len(rows), chunk_size):
+        writer.writerows(rows[start:start + chunk_size])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        if progress is not None:
+            progress(min(start + chunk_size, len(rows)), len(rows))
+    yield buffer.getvalue()
+
+
+def export_hit_report(rows: List[Tuple[str, str, int]], path,
+                      cancelled: Optional[Callable[[], bool]] = None,
+                      progress: Optional[Callable[[int, int], None]] = None) -> bool:
+    return write_file(path, iter_hit_report_chunks(rows, progress=progress), cancelled, newline='')
+
+
+def save_patch(patch: dict, path, cancelled: Optional[Callable[[], bool]] = None) -> bool:
+    return write_file(path, [dump_patch(patch)], cancelled)
+
+
+def read_patch(path) -> dict:
+    with open(path, 'rb') as f:
+        return load_patch(f.read())
+
+
+# Analysis
+
+def scan_stream(rules: CompiledRules, stream: BinaryIO, evaluation: str = FULL_REPORT,
+                chunk_size: int = DOCUMENT_CHUNK_SIZE,
+                context: Optional[Callable[[str], None]] = None,
+                progress: Optional[Callable[[ContentScanner], None]] = None
+                ) -> Tuple[AnalysisResult, Counter]:
+    """Analyze a binary stream chunk by chunk with bounded memory.
+
+    Returns the result and the hit count per (list type, rule); ``progress``
+    is called with the scanner after each chunk.
+    """
+    scanner = ContentScanner(rules, evaluation, collect=False, context=context)
+    rule_counts = Counter()
+    for chunk in iter_text_chunks(stream, chunk_size):
+        for span in scanner.feed(chunk):
+            rule_counts[(span.list_type, span.rule)] += 1
+        if progress is not None:
+            progress(scanner)
+        if scanner.done:
+            break
+    for span in scanner.flush():
+        rule_counts[(span.list_type, span.rule)] += 1
+    return scanner.finish(), rule_counts
+
+
+def all_mode_rules(store, modes: Optional[Iterable[str]] = None, stemming: bool = False) -> MultiModeRules:
+    """Merged rules of the given modes (default: every mode in the store)"""
+    return compile_modes({mode: (store.items(mode, 'whitelist'), store.items(mode, 'blacklist'))
+                          for mode in (modes or store.modes())}, stemming)
+
+
+def scan_stream_modes(rules: MultiModeRules, stream: BinaryIO, evaluation: str = FULL_REPORT,
+                      chunk_size: int = DOCUMENT_CHUNK_SIZE
+                      ) -> Tuple[Dict[str, AnalysisResult], Dict[str, Dict[str, int]]]:
+    """Analyze a binary stream against every mode of ``rules`` in one pass.
+
+    Returns the result and the whitelist/blacklist hit counts per mode.
+    """
+    scanner = MultiModeScanner(rules, evaluation, collect=False)
+    for chunk in iter_text_chunks(stream, chunk_size):
+        scanner.feed(chunk)
+        if scanner.done:
+            break
+    results = scanner.finish()
+    return results, scanner.counts()
@@ -0,0 +1,194 @@
+"""Versioned delta patches for syncing rule sets between instances.
+
+Both rule stores log every membership change with the ruleset version it
+produced. ``make_patch`` folds the log since a given version into the net
+adds and removes per list, and ``apply_patch`` replays them on another
+store, patching the compiled lookup tables in a ``VerdictCache`` instead of
+recompiling the whole mode. A patch is compact JSON::
+
+    {"format": "content-filter-patch", "format_version": 1, "created": "...",
+     "modes": {"Custom Mode": {"base": 12, "version": 15,
+                               "add": {"blacklist": ["..."]},
+                               "remove": {"whitelist": ["..."]}}}}
+
+``base`` and ``version`` are the exporting store's versions; export the next
+patch with ``since=patch_versions(previous_patch)`` to continue the chain.
+Patches only carry membership, not list order.
+"""
+import json
+from collections import deque
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from filter_merge import LIST_TYPES
+
+PATCH_FORMAT = 'content-filter-patch'
+PATCH_FORMAT_VERSION = 1
+
+ADD = 'add'
+REMOVE = 'remove'
+
+# (version, op, list type, items)
+Change = Tuple[int, str, str, Tuple[str, ...]]
+Lists = Dict[str, List[str]]
+
+
+class DeltaUnavailable(ValueError):
+    """The change log no longer (or never did) cover the requested version"""
+
+
+class ChangeJournal:
+    """In-memory change log of a ``MemoryRuleStore``, per mode.
+
+    At most ``limit`` logged items are kept per mode; trimming the oldest
+    entries raises the oldest version a delta can start from.
+    """
+
+    def __init__(self, limit: int = 100_000):
+        self.limit = limit
+        self._entries: Dict[str, deque] = {}
+        self._sizes: Dict[str, int] = {}
+        self._start: Dict[str, int] = {}
+
+    def record(self, mode: str, version: int, op: str, list_type: str, items: Iterable[str]):
+        items = tuple(items)
+        if not items:
+            return
+        entries = self._entries.setdefault(mode, deque())
+        entries.append((version, op, list_type, items))
+        self._sizes[mode] = self._sizes.get(mode, 0) + len(items)
+        while self._sizes[mode] > self.limit and len(entries) > 1:
+            oldest = entries[0][0]
+            while entries and entries[0][0] == oldest:
+                self._sizes[mode] -= len(entries.popleft()[3])
+            self._start[mode] = oldest
+
+    def start(self, mode: str) -> int:
+        return self._start.get(mode, 0)
+
+    def since(self, mode: str, version: int) -> List[Change]:
+        if version < self.start(mode):
+            raise DeltaUnavailable(f"{mode}: changes before version {self.start(mode)} were discarded")
+        return [entry for entry in self._entries.get(mode, ()) if entry[0] > version]
+
+
+def list_changes(before: Iterable[str], after: Iterable[str]) -> Tuple[List[str], List[str]]:
+    """(added, removed) items between two versions of a list"""
+    before, after = list(before), list(after)
+    before_set, after_set = set(before), set(after)
+    return ([item for item in after if item not in before_set],
+            [item for item in before if item not in after_set])
+
+
+def net_changes(changes: Iterable[Change]) -> Tuple[Lists, Lists]:
+    """Fold logged changes into net (adds, removes) per list type.
+
+    An item added and removed again (or the reverse) cancels out.
+    """
+    initial: Dict[Tuple[str, str], bool] = {}
+    final: Dict[Tuple[str, str], bool] = {}
+    for _, op, list_type, items in changes:
+        for item in items:
+            key = (list_type, item)
+            # A logged add means the item was absent before it, a remove that it was present
+            initial.setdefault(key, op == REMOVE)
+            final[key] = op == ADD
+    adds: Lists = {}
+    removes: Lists = {}
+    for key, present in final.items():
+        if present != initial[key]:
+            list_type, item = key
+            (adds if present else removes).setdefault(list_type, []).append(item)
+    return adds, removes
+
+
+def make_patch(store, since, modes: Optional[Iterable[str]] = None) -> dict:
+    """Net changes of the given modes since a version.
+
+    ``since`` is one version for every mode or a {mode: version} dict, e.g.
+    ``patch_versions`` of the previous patch. Raises ``DeltaUnavailable`` if
+    the store's log does not reach back that far.
+    """
+    modes = list(modes) if modes is not None else (list(since) if isinstance(since, dict) else store.modes())
+    patch_modes = {}
+    for mode in modes:
+        base = since.get(mode, 0) if isinstance(since, dict) else since
+        version = store.version(mode)
+        if base > version:
+            raise DeltaUnavailable(f"{mode}: version {base} is newer than the store's version {version}")
+        adds, removes = net_changes(store.changes_since(mode, base))
+        entry = {'base': base, 'version': version}
+        if adds:
+            entry[ADD] = adds
+        if removes:
+            entry[REMOVE] = removes
+        patch_modes[mode] = entry
+    return {
+        'format': PATCH_FORMAT,
+        'format_version': PATCH_FORMAT_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'modes': patch_modes,
+    }
+
+
+def dump_patch(patch: dict) -> str:
+    return json.dumps(patch, separators=(',', ':'), ensure_ascii=False)
+
+
+def load_patch(text) -> dict:
+    """Parse and check a patch from JSON text or bytes"""
+    patch = json.loads(text)
+    if not isinstance(patch, dict) or patch.get('format') != PATCH_FORMAT:
+        raise ValueError("Not a content filter patch")
+    if patch.get('format_version') != PATCH_FORMAT_VERSION:
+        raise ValueError(f"Unsupported patch format version: {patch.get('format_version')}")
+    for mode, entry in patch.get('modes', {}).items():
+        for op in (ADD, REMOVE):
+            for list_type, items in entry.get(op, {}).items():
+                if list_type not in LIST_TYPES or not isinstance(items, list):
+                    raise ValueError(f"{mode}: invalid {op} entry for {list_type!r}")
+    return patch
+
+
+def patch_versions(patch: dict) -> Dict[str, int]:
+    """The exporting store's version per mode once the patch is applied"""
+    return {mode: entry['version'] for mode, entry in patch['modes'].items()}
+
+
+def patch_size(patch: dict) -> Tuple[int, int]:
+    """(items added, items removed) across every mode"""
+    added = sum(len(items) for entry in patch['modes'].values() for items in entry.get(ADD, {}).values())
+    removed = sum(len(items) for entry in patch['modes'].values() for items in entry.get(REMOVE, {}).values())
+    return added, removed
+
+
+def apply_patch(store, patch: dict, verdict_cache=None) -> Dict[str, Tuple[int, int]]:
+    """Apply a patch's removes and adds to a store; returns {mode: (added, removed)}.
+
+    Items already in the requested state are skipped, so applying a patch
+    twice changes nothing. With a ``verdict_cache`` the compiled tables of
+    each changed mode are patched to the new version rather than dropped.
+    """
+    applied = {}
+    for mode, entry in patch['modes'].items():
+        old_version = store.version(mode)
+        added_items: Lists = {}
+        removed_items: Lists = {}
+        with store.action('Apply patch'):
+            for list_type, items in entry.get(REMOVE, {}).items():
+                # Only items on the list are removed; the rest need not reach the compiled tables
+                present = [item for item in items if store.contains(mode, list_type, item)]
+                if present and store.remove_items(mode, list_type, present):
+                    removed_items[list_type] = present
+            for list_type, items in entry.get(ADD, {}).items():
+                count = store.add_items(mode, list_type, items)
+                if count:
+                    # Both stores append new items at the end of the list, in order
+                    added_items[list_type] = store.search(mode, list_type, '',
+                                                          store.count(mode, list_type) - count, count)
+        added = sum(len(items) for items in added_items.values())
+        removed = sum(len(items) for items in removed_items.values())
+        if verdict_cache is not None and (added or removed):
+            verdict_cache.patch_rules(mode, old_version, store.version(mode), added_items, removed_items)
+        applied[mode] = (added, removed)
+    return applied
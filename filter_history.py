@@ -0,0 +1,314 @@
+"""Undo/redo history for rule lists built on persistent trees.
+
+Every list is mirrored by an immutable implicit treap (``PersistentList``).
+Changing a list copies only the O(log n) nodes on the path to each changed
+position, so consecutive versions share everything else and a history
+entry costs O(changed items * log n) memory instead of a full copy of
+``mode_data``. A version is just a small dict of tree roots, so moving to
+any version swaps roots without replaying edits.
+
+The store's live lists stay plain Python lists, which scans and searches
+need to be fast, so applying a version to the store rebuilds each changed
+list from its tree: undo and redo are O(n) in the length of the lists
+they change, not O(log n). The first change to a list also builds its
+tree in O(n). ``python filter_history.py`` measures both on large lists.
+"""
+import random
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Nodes are (item, priority, size, left, right) tuples
+_Node = Optional[tuple]
+ListKey = Tuple[str, str]
+
+
+def _size(node: _Node) -> int:
+    return node[2] if node else 0
+
+
+def _make(item, priority, left: _Node, right: _Node) -> tuple:
+    return (item, priority, _size(left) + _size(right) + 1, left, right)
+
+
+def _merge(left: _Node, right: _Node) -> _Node:
+    if not left:
+        return right
+    if not right:
+        return left
+    if left[1] > right[1]:
+        return _make(left[0], left[1], left[3], _merge(left[4], right))
+    return _make(right[0], right[1], _merge(left, right[3]), right[4])
+
+
+def _split(node: _Node, count: int) -> Tuple[_Node, _Node]:
+    """Split into the first ``count`` items and the rest"""
+    if not node:
+        return None, None
+    left_size = _size(node[3])
+    if count <= left_size:
+        left, right = _split(node[3], count)
+        return left, _make(node[0], node[1], right, node[4])
+    left, right = _split(node[4], count - left_size - 1)
+    return _make(node[0], node[1], node[3], left), right
+
+
+def _build(items: List) -> _Node:
+    """Build a treap in O(n) as the Cartesian tree of random priorities"""
+    stack: List[list] = []
+    for item in items:
+        node = [item, random.random(), None, None]
+        last = None
+        while stack and stack[-1][1] < node[1]:
+            last = stack.pop()
+        node[2] = last
+        if stack:
+            stack[-1][3] = node
+        stack.append(node)
+
+    def freeze(node) -> _Node:
+        if node is None:
+            return None
+        return _make(node[0], node[1], freeze(node[2]), freeze(node[3]))
+
+    return freeze(stack[0]) if stack else None
+
+
+class PersistentList:
+    """Immutable sequence; every update returns a new list sharing structure"""
+
+    __slots__ = ('_root',)
+
+    def __init__(self, items: Iterable = (), _root: _Node = None):
+        self._root = _root if _root is not None else _build(list(items))
+
+    def __len__(self) -> int:
+        return _size(self._root)
+
+    def __iter__(self) -> Iterator:
+        stack, node = [], self._root
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node[3]
+            node = stack.pop()
+            yield node[0]
+            node = node[4]
+
+    def __getitem__(self, index: int):
+        if index < 0:
+            index += len(self)
+        node = self._root
+        while node:
+            left_size = _size(node[3])
+            if index < left_size:
+                node = node[3]
+            elif index == left_size:
+                return node[0]
+            else:
+                index -= left_size + 1
+                node = node[4]
+        raise IndexError('PersistentList index out of range')
+
+    def extend(self, items: Iterable) -> 'PersistentList':
+        return PersistentList(_root=_merge(self._root, _build(list(items))))
+
+    def delete(self, indexes: Iterable[int]) -> 'PersistentList':
+        """Remove the items at the given positions, O(log n) each"""
+        root = self._root
+        for index in sorted(set(indexes), reverse=True):
+            left, right = _split(root, index)
+            _, right = _split(right, 1)
+            root = _merge(left, right)
+        return PersistentList(_root=root)
+
+    def to_list(self) -> List:
+        return list(self)
+
+
+class RuleHistory:
+    """Linear undo/redo history over a ``mode_data`` dict of lists.
+
+    Lists are mirrored lazily: a list's tree is only built the first time
+    it changes, and versions only hold roots for lists changed so far. The
+    store reports each change through ``appended``/``removed``/``replaced``;
+    changes made inside ``action()`` are grouped into one history entry.
+    Actions sharing a ``group`` keep extending the same entry while it is the
+    latest one, so work spread over many event-loop turns (a background
+    import) stays one undo step without absorbing the edits made meanwhile.
+    """
+
+    def __init__(self, limit: int = 100):
+        self.limit = limit
+        self._base: Dict[ListKey, PersistentList] = {}
+        # (label, roots, group) per version
+        self._versions: List[Tuple[str, Dict[ListKey, PersistentList], object]] = [('Initial state', {}, None)]
+        self._position = 0
+        self._pending: Optional[Dict[ListKey, PersistentList]] = None
+        self._pending_label = ''
+        self._pending_group = None
+        self._depth = 0
+
+    # Recording
+
+    def action(self, label: str, group=None) -> 'RuleHistory':
+        """Group the changes made inside a ``with`` block into one entry"""
+        if self._depth == 0:
+            self._pending_label = label
+            self._pending_group = group
+        return self
+
+    def __enter__(self):
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0 and self._pending is not None:
+            self._commit()
+
+    def _extends_latest(self, group) -> bool:
+        return (group is not None and 0 < self._position == len(self._versions) - 1
+                and self._versions[-1][2] is group)
+
+    def discard(self, group) -> Optional[Dict[ListKey, PersistentList]]:
+        """Drop the latest entry if it holds ``group``'s changes; returns the trees restoring the lists.
+
+        Returns None when another change came after the group's entry, so it
+        cannot be dropped without losing that change too.
+        """
+        if self._depth or not self._extends_latest(group):
+            return None
+        changed = self.goto(self._position - 1)
+        del self._versions[-1]
+        return changed
+
+    def _current(self, key: ListKey, items: List) -> PersistentList:
+        roots = self._pending if self._pending is not None else self._versions[self._position][1]
+        if key in roots:
+            return roots[key]
+        if key not in self._base:
+            self._base[key] = PersistentList(items)
+        return self._base[key]
+
+    def _stage(self, key: ListKey, tree: PersistentList, label: str):
+        if self._pending is None:
+            self._pending = dict(self._versions[self._position][1])
+            if self._depth == 0:
+                self._pending_label = label
+                self._pending_group = None
+        self._pending[key] = tree
+        if self._depth == 0:
+            self._commit()
+
+    def _commit(self):
+        if self._extends_latest(self._pending_group):
+            self._versions[-1] = (self._versions[-1][0], self._pending, self._pending_group)
+        else:
+            del self._versions[self._position + 1:]
+            self._versions.append((self._pending_label, self._pending, self._pending_group))
+        self._pending = None
+        if len(self._versions) > self.limit + 1:
+            del self._versions[0]
+        self._position = len(self._versions) - 1
+
+    def appended(self, mode: str, list_type: str, before: List, items: List, label: str = 'Add items'):
+        """``items`` were appended to a list whose previous content was ``before``"""
+        key = (mode, list_type)
+        self._stage(key, self._current(key, before).extend(items), label)
+
+    def removed(self, mode: str, list_type: str, before: List, indexes: List[int],
+                label: str = 'Remove items'):
+        key = (mode, list_type)
+        self._stage(key, self._current(key, before).delete(indexes), label)
+
+    def replaced(self, mode: str, list_type: str, before: List, items: List, label: str = 'Replace list'):
+        key = (mode, list_type)
+        self._current(key, before)
+        self._stage(key, PersistentList(items), label)
+
+    # Navigation; not allowed while an action is open
+
+    @property
+    def can_undo(self) -> bool:
+        return self._depth == 0 and self._position > 0
+
+    @property
+    def can_redo(self) -> bool:
+        return self._depth == 0 and self._position < len(self._versions) - 1
+
+    @property
+    def undo_label(self) -> str:
+        return self._versions[self._position][0] if self.can_undo else ''
+
+    @property
+    def redo_label(self) -> str:
+        return self._versions[self._position + 1][0] if self.can_redo else ''
+
+    def labels(self) -> List[str]:
+        return [label for label, _, _ in self._versions]
+
+    @property
+    def position(self) -> int:
+        return self._position
+
+    def goto(self, position: int) -> Dict[ListKey, PersistentList]:
+        """Move to a version; returns the trees of lists that differ from the current one"""
+        current = self._versions[self._position][1]
+        target = self._versions[position][1]
+        changed = {}
+        for key in set(current) | set(target):
+            before = current.get(key, self._base.get(key))
+            after = target.get(key, self._base.get(key))
+            if after is not None and after is not before:
+                changed[key] = after
+        self._position = position
+        return changed
+
+    def undo(self) -> Dict[ListKey, PersistentList]:
+        return self.goto(self._position - 1) if self.can_undo else {}
+
+    def redo(self) -> Dict[ListKey, PersistentList]:
+        return self.goto(self._position + 1) if self.can_redo else {}
+
+    def memory_bytes(self) -> int:
+        """Approximate memory of all distinct tree nodes held by the history"""
+        seen = set()
+        total = 0
+        roots = [tree._root for tree in self._base.values()]
+        roots += [tree._root for _, trees, _ in self._versions for tree in trees.values()]
+        stack = [root for root in roots if root]
+        while stack:
+            node = stack.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            total += sys.getsizeof(node)
+            stack.extend(child for child in (node[3], node[4]) if child)
+        return total
+
+
+def benchmark_history(sizes=(10_000, 100_000, 1_000_000)) -> List[Dict[str, float]]:
+    """Time the first edit, a later edit, undo and redo of one list of each size, in seconds"""
+    import time
+    from filter_store import MemoryRuleStore
+
+    results = []
+    for size in sizes:
+        store = MemoryRuleStore({'mode': {'whitelist': [], 'blacklist': [f'rule{i}' for i in range(size)]}},
+                                history_limit=10)
+        timings = {'items': size}
+        for name, operation in (('first_edit', lambda: store.add_items('mode', 'blacklist', ['first'])),
+                                ('later_edit', lambda: store.add_items('mode', 'blacklist', ['second'])),
+                                ('undo', store.undo),
+                                ('redo', store.redo)):
+            start = time.perf_counter()
+            operation()
+            timings[name] = time.perf_counter() - start
+        results.append(timings)
+    return results
+
+
+if __name__ == '__main__':
+    for timings in benchmark_history():
+        print(f"{timings['items']:>9,} items: " + ', '.join(
+            f'{name} {seconds * 1000:.1f} ms' for name, seconds in timings.items() if name != 'items'))
@@ -0,0 +1,170 @@
+"""Rule hit analytics.
+
+``RuleHitCounter`` counts how often each rule fires, with the counts held in
+an ``array`` indexed by a slot per rule, so pruning candidates (rules that
+never fire) and the most active rules can be listed at any time.
+
+``SpaceSaving`` is a bounded-memory heavy-hitter sketch. During long corpus
+scans it is fed the unknown words around blacklist hits, surfacing frequent
+neighbours of blocked terms as candidates for new rules without keeping a
+count for every distinct word.
+"""
+import heapq
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from filter_analysis import FULL_REPORT, AnalysisResult, MatchSpan
+from filter_merge import LIST_TYPES
+
+
+class RuleHitCounter:
+    """Hit counts per (list type, rule)"""
+
+    def __init__(self):
+        self._slots: Dict[Tuple[str, str], int] = {}
+        self._keys: List[Tuple[str, str]] = []
+        self._counts = array('Q')
+        self.analyses = 0
+
+    def add(self, list_type: str, rule: str, count: int = 1):
+        key = (list_type, rule)
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = len(self._keys)
+            self._keys.append(key)
+            self._counts.append(0)
+        self._counts[slot] += count
+
+    def record_spans(self, spans: Iterable[MatchSpan]):
+        for span in spans:
+            self.add(span.list_type, span.rule)
+
+    def record(self, result: AnalysisResult):
+        """Count the hits of one analysis; verdict-only results count their deciding rule"""
+        self.analyses += 1
+        if result.evaluation == FULL_REPORT and result.spans is not None:
+            self.record_spans(result.spans)
+        elif result.first_hit is not None:
+            self.add('blacklist', result.first_hit)
+
+    def record_counts(self, counts: Dict[Tuple[str, str], int]):
+        """Add the per-rule totals of one analysis, e.g. a streamed document scan"""
+        self.analyses += 1
+        for (list_type, rule), count in counts.items():
+            self.add(list_type, rule, count)
+
+    def count(self, list_type: str, rule: str) -> int:
+        slot = self._slots.get((list_type, rule))
+        return self._counts[slot] if slot is not None else 0
+
+    @property
+    def total(self) -> int:
+        return sum(self._counts)
+
+    def top(self, k: int = 10, list_type: Optional[str] = None) -> List[Tuple[str, str, int]]:
+        """The k most frequent (list type, rule, hits), most hits first"""
+        slots = range(len(self._keys))
+        if list_type is not None:
+            slots = [slot for slot in slots if self._keys[slot][0] == list_type]
+        best = heapq.nlargest(k, slots, key=self._counts.__getitem__)
+        return [(*self._keys[slot], self._counts[slot]) for slot in best if self._counts[slot]]
+
+    def never_hit(self, lists: Dict[str, List[str]]) -> List[Tuple[str, str]]:
+        """(list type, rule) for every current rule that has not fired yet"""
+        return [(list_type, rule)
+                for list_type in LIST_TYPES
+                for rule in lists.get(list_type, [])
+                if (list_type, rule) not in self._slots]
+
+    def report(self, lists: Dict[str, List[str]]) -> List[Tuple[str, str, int]]:
+        """(list type, rule, hits) for every current rule, most hits first"""
+        rows = [(list_type, rule, self.count(list_type, rule))
+                for list_type in LIST_TYPES
+                for rule in lists.get(list_type, [])]
+        rows.sort(key=lambda row: -row[2])
+        return rows
+
+    def clear(self):
+        self.__init__()
+
+
+class SpaceSaving:
+    """Space-Saving heavy-hitter sketch over at most ``capacity`` counters.
+
+    Every item occurring more than n / capacity times in a stream of n items
+    is guaranteed to be tracked; an estimate overcounts by at most its
+    ``error``. When full, a new item replaces the minimum counter, found
+    through a lazily updated min-heap.
+    """
+
+    def __init__(self, capacity: int = 100):
+        self.capacity = capacity
+        self.seen = 0
+        self._counts: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        self._heap: List[Tuple[int, str]] = []
+
+    def offer(self, item: str, count: int = 1):
+        self.seen += count
+        counts = self._counts
+        if item in counts:
+            counts[item] += count
+        elif len(counts) < self.capacity:
+            counts[item] = count
+            self._errors[item] = 0
+        else:
+            minimum, victim = self._pop_min()
+            del counts[victim]
+            del self._errors[victim]
+            counts[item] = minimum + count
+            self._errors[item] = minimum
+        heapq.heappush(self._heap, (counts[item], item))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(value, key) for key, value in counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self) -> Tuple[int, str]:
+        # Heap entries go stale when their item is incremented or evicted
+        while True:
+            value, item = heapq.heappop(self._heap)
+            if self._counts.get(item) == value:
+                return value, item
+
+    def top(self, k: int = 10) -> List[Tuple[str, int, int]]:
+        """The k heaviest (item, estimated count, maximum overcount)"""
+        best = heapq.nlargest(k, self._counts.items(), key=lambda entry: entry[1])
+        return [(item, count, self._errors[item]) for item, count in best]
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def clear(self):
+        self.__init__(self.capacity)
+
+
+class HitTracker:
+    """Per-mode hit counters and neighbour sketches for one app session"""
+
+    def __init__(self, sketch_capacity: int = 200):
+        self.sketch_capacity = sketch_capacity
+        self._counters: Dict[str, RuleHitCounter] = {}
+        self._sketches: Dict[str, SpaceSaving] = {}
+
+    def counter(self, mode: str) -> RuleHitCounter:
+        if mode not in self._counters:
+            self._counters[mode] = RuleHitCounter()
+        return self._counters[mode]
+
+    def sketch(self, mode: str) -> SpaceSaving:
+        if mode not in self._sketches:
+            self._sketches[mode] = SpaceSaving(self.sketch_capacity)
+        return self._sketches[mode]
+
+    def record(self, mode: str, result: AnalysisResult):
+        self.counter(mode).record(result)
+
+    def reset(self, mode: Optional[str] = None):
+        modes = [mode] if mode is not None else list(self._counters) + list(self._sketches)
+        for name in modes:
+            self._counters.pop(name, None)
+            self._sketches.pop(name, None)
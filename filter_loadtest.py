@@ -0,0 +1,379 @@
+"""Load test for the Streamlit app.
+
+Drives ``streamlit_content_filter.py`` headlessly with Streamlit's
+``AppTest``. Every simulated moderator is a separate AppTest session in its
+own process (AppTest sessions cannot share one); once all have started they
+run concurrently, each performing a weighted mix of analyses, searches,
+adds, bulk imports and mode switches against a large synthetic
+configuration. It reports latency percentiles per interaction and the
+memory of each session.
+
+The figures are per-process, best-case numbers. The sessions do not share
+a Streamlit server, so they never contend for one GIL, one resource cache
+or one in-memory rule store the way real sessions of a deployed app do.
+AppTest also reruns the whole script on every interaction, even when only
+a fragment would rerun in the browser. Use the results to compare changes
+and to find the slow interactions; they are not a capacity estimate for a
+shared server, which needs browser or websocket clients against
+``streamlit run``.
+
+    python filter_loadtest.py --sessions 8 --interactions 40 --rules 50000
+
+The file uploader cannot be driven by AppTest, so imports go through the
+bulk add box, which runs the same store path. Switching the add mode to
+Bulk Add and back takes two extra reruns; they are timed separately and
+left out of the import latency.
+"""
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+APP_PATH = Path(__file__).with_name('streamlit_content_filter.py')
+# Imported before tracing starts, so startup memory is the session's own state
+APP_IMPORTS = ('pandas', 'numpy', 'plotly.express', 'plotly.graph_objects', 'filter_core')
+MODES = ['Child Safe Mode', 'High School Teen Safe Mode', 'Custom Mode']
+
+# Interaction -> relative weight in the mix
+DEFAULT_MIX = {
+    'analyze': 40,
+    'search': 25,
+    'add': 20,
+    'import': 10,
+    'switch_mode': 5,
+}
+
+
+def synthetic_config(rules: int, seed: int = 0) -> Dict[str, Dict[str, List[str]]]:
+    """Per-mode lists of ``rules`` items each, about a tenth of them phrases"""
+    rng = random.Random(seed)
+    mode_data = {}
+    for index, mode in enumerate(MODES):
+        lists = {}
+        for list_type in ('whitelist', 'blacklist'):
+            prefix = 'allow' if list_type == 'whitelist' else 'block'
+            items = [f'{prefix}{index}x{i}' for i in range(rules)]
+            for i in range(0, rules, 10):
+                items[i] = f'{items[i]} {rng.choice(items)}'
+            lists[list_type] = items
+        mode_data[mode] = lists
+    return mode_data
+
+
+def synthetic_text(rng: random.Random, vocabulary: List[str], words: int = 200) -> str:
+    """Filler text with a few rule words mixed in"""
+    body = [f'word{rng.randrange(5000)}' for _ in range(words)]
+    for _ in range(max(1, words // 50)):
+        body[rng.randrange(words)] = rng.choice(vocabulary)
+    return ' '.join(body)
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[rank]
+
+
+def rss_bytes() -> Optional[int]:
+    """Resident set size of this process, where /proc is available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Session:
+    """One simulated moderator driving its own AppTest instance"""
+
+    def __init__(self, number: int, vocabulary: List[str], timeout: float, seed: int):
+        from streamlit.testing.v1 import AppTest
+
+        self.number = number
+        self.vocabulary = vocabulary
+        self.rng = random.Random(seed * 1000 + number)
+        self.app = AppTest.from_file(str(APP_PATH), default_timeout=timeout)
+        self.added = 0
+        self.workaround_time = 0.0  # Seconds of the current interaction spent on workaround reruns
+
+    def _widget(self, elements, label: str):
+        for element in elements:
+            if element.label == label:
+                return element
+        raise LookupError(f'No widget labelled {label!r}')
+
+    def start(self):
+        self.app.run()
+
+    def _workaround_run(self):
+        """Rerun that only exists to work around AppTest; timed apart from the interaction"""
+        start = time.perf_counter()
+        self.app.run()
+        self.workaround_time += time.perf_counter() - start
+
+    def analyze(self):
+        self._widget(self.app.text_area, 'Enter content to test against your filters').input(
+            synthetic_text(self.rng, self.vocabulary))
+        self._widget(self.app.button, 'Analyze Content').click()
+        self.app.run()
+
+    def search(self):
+        list_type = self.rng.choice(['whitelist', 'blacklist'])
+        query = self.rng.choice(['', self.rng.choice(self.vocabulary)[:6], f'x{self.rng.randrange(100)}'])
+        self._widget(self.app.text_input, f'Search {list_type}...').input(query)
+        self.app.run()
+
+    def add(self):
+        list_type = self.rng.choice(['whitelist', 'blacklist'])
+        self.added += 1
+        self._widget(self.app.text_input, f'Add to {list_type}...').input(f'session{self.number}item{self.added}')
+        self._widget(self.app.button, f'Add to {list_type.capitalize()}').click()
+        self.app.run()
+
+    def bulk_import(self, items: int = 200):
+        list_type = self.rng.choice(['whitelist', 'blacklist'])
+        prefix = 'wl' if list_type == 'whitelist' else 'bl'
+        radio = self.app.radio(key=f'{prefix}_add_mode')
+        if radio.value != 'Bulk Add':
+            radio.set_value('Bulk Add')
+            self._workaround_run()
+        batch = self.added
+        self.added += 1
+        self.app.text_area(key=f'{prefix}_bulk_input').input(
+            '\n'.join(f'session{self.number}batch{batch}item{i}' for i in range(items)))
+        self._widget(self.app.button, f'Add All to {list_type.capitalize()}').click()
+        self.app.run()
+        self.app.radio(key=f'{prefix}_add_mode').set_value('Single Item')
+        self._workaround_run()
+
+    def switch_mode(self):
+        self._widget(self.app.selectbox, 'Select Mode').select(self.rng.choice(MODES))
+        self.app.run()
+
+    def perform(self, interaction: str):
+        actions = {
+            'analyze': self.analyze,
+            'search': self.search,
+            'add': self.add,
+            'import': self.bulk_import,
+            'switch_mode': self.switch_mode,
+        }
+        actions[interaction]()
+        if self.app.exception:
+            raise RuntimeError(self.app.exception[0].message)
+
+
+def run_session(number: int, workdir: str, vocabulary: List[str], interactions: int, mix: Dict[str, int],
+                timeout: float, seed: int, barrier) -> dict:
+    """Start one session, wait for the others, then run its interactions.
+
+    Runs in its own process: AppTest patches process-wide Streamlit state, so
+    sessions cannot share one.
+    """
+    # The app loads content_filter_config.json from the working directory
+    os.chdir(workdir)
+    outcome = {'latencies': defaultdict(list), 'workarounds': defaultdict(list), 'errors': defaultdict(list),
+               'failed': None}
+    for module in APP_IMPORTS:
+        importlib.import_module(module)
+    session = Session(number, vocabulary, timeout, seed)
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        session.start()
+        if session.app.exception:
+            outcome['failed'] = session.app.exception[0].message
+    except Exception as e:
+        outcome['failed'] = f'{type(e).__name__}: {e}'
+    outcome['startup_s'] = time.perf_counter() - start
+    outcome['startup_traced'] = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    outcome['rss_started'] = rss_bytes()
+    # Every session waits here, started or not, so the others are not left hanging
+    barrier.wait()
+    if outcome['failed']:
+        return outcome
+
+    names, weights = list(mix), list(mix.values())
+    outcome['phase'] = (time.time(), None)
+    for _ in range(interactions):
+        interaction = session.rng.choices(names, weights)[0]
+        session.workaround_time = 0.0
+        start = time.perf_counter()
+        try:
+            session.perform(interaction)
+        except Exception as e:
+            outcome['errors'][interaction].append(f'{type(e).__name__}: {e}')
+        else:
+            outcome['latencies'][interaction].append(time.perf_counter() - start - session.workaround_time)
+            if session.workaround_time:
+                outcome['workarounds'][interaction].append(session.workaround_time)
+    outcome['phase'] = (outcome['phase'][0], time.time())
+    outcome['rss_finished'] = rss_bytes()
+    return outcome
+
+
+class LoadTest:
+    """Runs the sessions concurrently and collects their latencies and memory"""
+
+    def __init__(self, sessions: int, interactions: int, rules: int, mix: Dict[str, int],
+                 timeout: float = 120, seed: int = 0):
+        self.sessions = sessions
+        self.interactions = interactions
+        self.rules = rules
+        self.mix = mix
+        self.timeout = timeout
+        self.seed = seed
+        self.outcomes: List[dict] = []
+
+    def run(self, workdir: str) -> 'LoadTest':
+        mode_data = synthetic_config(self.rules, self.seed)
+        vocabulary = [item for lists in mode_data.values() for items in lists.values() for item in items[:2000]]
+        with open(os.path.join(workdir, 'content_filter_config.json'), 'w') as f:
+            json.dump(mode_data, f)
+        with multiprocessing.Manager() as manager:
+            barrier = manager.Barrier(self.sessions)
+            with ProcessPoolExecutor(max_workers=self.sessions) as pool:
+                futures = [pool.submit(run_session, number, workdir, vocabulary, self.interactions, self.mix,
+                                       self.timeout, self.seed, barrier)
+                           for number in range(self.sessions)]
+                self.outcomes = [future.result() for future in futures]
+        return self
+
+    def summary(self) -> dict:
+        latencies: Dict[str, List[float]] = defaultdict(list)
+        workarounds: Dict[str, List[float]] = defaultdict(list)
+        errors: Dict[str, List[str]] = defaultdict(list)
+        for outcome in self.outcomes:
+            for name, values in outcome['latencies'].items():
+                latencies[name].extend(values)
+            for name, values in outcome['workarounds'].items():
+                workarounds[name].extend(values)
+            for name, messages in outcome['errors'].items():
+                errors[name].extend(messages)
+        interactions = {}
+        for name in self.mix:
+            values = [seconds * 1000 for seconds in latencies.get(name, [])]
+            interactions[name] = {
+                'count': len(values),
+                'errors': len(errors.get(name, [])),
+                'p50_ms': percentile(values, 50),
+                'p90_ms': percentile(values, 90),
+                'p99_ms': percentile(values, 99),
+                'max_ms': max(values, default=0.0),
+            }
+        excluded = {}
+        for name, seconds in workarounds.items():
+            values = [value * 1000 for value in seconds]
+            excluded[name] = {'count': len(values), 'p50_ms': percentile(values, 50),
+                              'max_ms': max(values, default=0.0)}
+
+        phases = [outcome['phase'] for outcome in self.outcomes if 'phase' in outcome]
+        wall_time = max(end for _, end in phases) - min(start for start, _ in phases) if phases else 0.0
+        completed = sum(len(values) for values in latencies.values())
+        startup = [outcome['startup_s'] * 1000 for outcome in self.outcomes]
+        traced = [outcome['startup_traced'] for outcome in self.outcomes]
+        finished = [outcome['rss_finished'] for outcome in self.outcomes if outcome.get('rss_finished')]
+        growth = [outcome['rss_finished'] - outcome['rss_started'] for outcome in self.outcomes
+                  if outcome.get('rss_finished') and outcome.get('rss_started')]
+        return {
+            'sessions': self.sessions,
+            'interactions_per_session': self.interactions,
+            'rules_per_list': self.rules,
+            'failed_sessions': [outcome['failed'] for outcome in self.outcomes if outcome['failed']],
+            'wall_time_s': wall_time,
+            'throughput_per_s': completed / wall_time if wall_time else 0.0,
+            'startup_ms': {'p50': percentile(startup, 50), 'max': max(startup, default=0.0)},
+            'session_memory_bytes': {
+                'startup_traced_p50': percentile(traced, 50),
+                'startup_traced_max': max(traced, default=0),
+                'rss_p50': percentile(finished, 50) if finished else None,
+                'rss_max': max(finished, default=None),
+                'rss_growth_p50': percentile(growth, 50) if growth else None,
+            },
+            'interactions': interactions,
+            'excluded_workaround_ms': excluded,
+            'sample_errors': {name: messages[:3] for name, messages in errors.items()},
+        }
+
+
+def format_summary(summary: dict) -> str:
+    lines = [
+        f"{summary['sessions']} sessions x {summary['interactions_per_session']} interactions, "
+        f"{summary['rules_per_list']:,} rules per list "
+        f"(one AppTest process per session, no shared server: best-case latencies)",
+        f"Wall time {summary['wall_time_s']:.1f} s, {summary['throughput_per_s']:.1f} interactions/s",
+        f"Session startup: p50 {summary['startup_ms']['p50']:.0f} ms, max {summary['startup_ms']['max']:.0f} ms",
+        '',
+        f"{'interaction':<12} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}",
+    ]
+    for name, stats in summary['interactions'].items():
+        lines.append(f"{name:<12} {stats['count']:>6} {stats['errors']:>6} {stats['p50_ms']:>9.1f} "
+                     f"{stats['p90_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f}")
+    for name, stats in summary['excluded_workaround_ms'].items():
+        lines.append(f"{name} latency excludes the add-mode reruns AppTest needs "
+                     f"(p50 {stats['p50_ms']:.1f} ms, max {stats['max_ms']:.1f} ms per {name})")
+    memory = summary['session_memory_bytes']
+    megabytes = 1024 * 1024
+    lines += ['', f"Traced allocations per session at startup: p50 {memory['startup_traced_p50'] / megabytes:.1f} MB, "
+                  f"max {memory['startup_traced_max'] / megabytes:.1f} MB"]
+    if memory['rss_p50'] is not None:
+        lines.append(f"Session process RSS when done: p50 {memory['rss_p50'] / megabytes:.1f} MB, "
+                     f"max {memory['rss_max'] / megabytes:.1f} MB, "
+                     f"p50 growth while interacting {memory['rss_growth_p50'] / megabytes:+.1f} MB")
+    for message in summary['failed_sessions']:
+        lines.append(f'Session failed to start: {message}')
+    for name, errors in summary['sample_errors'].items():
+        lines.append(f'{name} errors, e.g.: ' + '; '.join(errors))
+    return '\n'.join(lines)
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    """'analyze=50,search=30' -> weights; interactions left out are not run"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f'unknown interaction {name.strip()!r}')
+        mix[name.strip()] = int(weight or 1)
+    return mix
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='filter_loadtest',
+                                     description='Simulate concurrent sessions of the Streamlit app')
+    parser.add_argument('--sessions', type=int, default=4)
+    parser.add_argument('--interactions', type=int, default=25, help='interactions per session')
+    parser.add_argument('--rules', type=int, default=20_000, help='items per list in every mode')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='weights, e.g. analyze=40,search=25,add=20,import=10,switch_mode=5')
+    parser.add_argument('--timeout', type=float, default=120, help='seconds before a rerun counts as failed')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', metavar='FILE', help='also write the summary as JSON')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        test = LoadTest(args.sessions, args.interactions, args.rules, args.mix, args.timeout, args.seed)
+        summary = test.run(workdir).summary()
+    print(format_summary(summary))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=4)
+    failed = summary['failed_sessions'] or any(stats['errors'] for stats in summary['interactions'].values())
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,335 @@
+"""Prebuilt compiled matchers that worker processes map instead of compiling.
+
+``build_matchers`` writes each mode's ``CompiledRules`` to a flat binary
+file. ``load_matcher`` maps a file read-only and returns ``CompiledRules``
+whose tables look words up directly in the mapped pages, so opening a mode
+takes the same time whatever its size, and every process mapping the file
+shares one physical copy through the page cache. Offsets are relative to
+the file (or its string pool), and nothing is pickled.
+
+Layout, little-endian::
+
+    header   magic, format version, counts, section offsets, stamp
+    slots    open-addressing hash table: entry number + 1, 0 for an empty slot
+    entries  per distinct word: key, whitelist rule, blacklist rule, phrase run
+    phrases  per phrase rule ending in that word: rule, lowercased tokens, list
+    shadowed rules collapsed into an equivalent one, for ``update_rules``
+    strings  UTF-8 pool referenced by (offset, length) pairs
+
+Words are hashed with CRC-32 of their UTF-8 bytes, which unlike ``hash()`` is
+the same in every process. Each file is stamped with the mode, the ruleset
+version and the rule source it was built from; ``MatcherDirectory`` only
+hands out a matcher whose stamp matches what the caller has loaded.
+Rebuilt files replace the old ones atomically, so processes still mapping
+the old file keep reading consistent pages.
+"""
+import mmap
+import os
+import re
+import struct
+import zlib
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from filter_analysis import CompiledRules, compile_rules
+
+MAGIC = b'CFMATCH\x00'
+FORMAT_VERSION = 1
+SUFFIX = '.cfm'
+MEMO_SIZE = 1 << 16  # Decoded lookups kept per process; cleared when full
+
+_HEADER = struct.Struct('<8sIIIIIIIIIIQQQQQQIIII')
+_SLOT = struct.Struct('<I')
+_ENTRY = struct.Struct('<IIIIIIII')
+_PHRASE = struct.Struct('<IIIII')
+_SHADOWED = struct.Struct('<IIIII')
+_ABSENT = 0xFFFFFFFF
+_LIST_CODES = {'whitelist': 0, 'blacklist': 1}
+_LIST_TYPES = ('whitelist', 'blacklist')
+
+
+def matcher_filename(mode: str) -> str:
+    return re.sub(r'[^a-z0-9]+', '_', mode.lower()).strip('_') + SUFFIX
+
+
+class _StringPool:
+    def __init__(self):
+        self.data = bytearray()
+        self._offsets: Dict[str, Tuple[int, int]] = {}
+
+    def add(self, text: str) -> Tuple[int, int]:
+        ref = self._offsets.get(text)
+        if ref is None:
+            encoded = text.encode('utf-8')
+            ref = self._offsets[text] = (len(self.data), len(encoded))
+            self.data += encoded
+            if len(self.data) >= _ABSENT:
+                raise ValueError("Rules are too large for a matcher file (4 GiB string pool)")
+        return ref
+
+
+def dump_matcher(rules: CompiledRules, mode: str, version: int, source: str) -> bytes:
+    """Serialize compiled rules to the matcher file format"""
+    pool = _StringPool()
+    words = sorted(set(rules.whitelist) | set(rules.blacklist) | set(rules.phrases))
+    slot_count = 1
+    while slot_count < 2 * len(words):
+        slot_count <<= 1
+    slots = [0] * slot_count
+    entries = bytearray()
+    phrases = bytearray()
+    phrase_count = 0
+    for number, word in enumerate(words):
+        slot = zlib.crc32(word.encode('utf-8')) & (slot_count - 1)
+        while slots[slot]:
+            slot = (slot + 1) & (slot_count - 1)
+        slots[slot] = number + 1
+        refs = [pool.add(word)]
+        for table in (rules.whitelist, rules.blacklist):
+            rule = table.get(word)
+            refs.append(pool.add(rule) if rule is not None else (0, _ABSENT))
+        candidates = rules.phrases.get(word, ())
+        for tokens, rule, list_type in candidates:
+            phrases += _PHRASE.pack(*pool.add(rule), *pool.add(' '.join(tokens)), _LIST_CODES[list_type])
+        entries += _ENTRY.pack(*refs[0], *refs[1], *refs[2], phrase_count, len(candidates))
+        phrase_count += len(candidates)
+
+    shadowed = bytearray()
+    shadowed_count = 0
+    for (list_type, tokens), earlier in rules.shadowed.items():
+        for rule in earlier:
+            shadowed += _SHADOWED.pack(*pool.add(' '.join(tokens)), *pool.add(rule), _LIST_CODES[list_type])
+            shadowed_count += 1
+    mode_ref, source_ref = pool.add(mode), pool.add(source)
+
+    slots_offset = _HEADER.size
+    entries_offset = slots_offset + slot_count * _SLOT.size
+    phrases_offset = entries_offset + len(entries)
+    shadowed_offset = phrases_offset + len(phrases)
+    strings_offset = shadowed_offset + len(shadowed)
+    header = _HEADER.pack(
+        MAGIC, FORMAT_VERSION, slot_count, len(words), phrase_count, shadowed_count,
+        rules.max_phrase_words, rules.max_whitelist_words,
+        len(rules.whitelist), len(rules.blacklist), len(rules.phrases),
+        version, slots_offset, entries_offset, phrases_offset, shadowed_offset, strings_offset,
+        *mode_ref, *source_ref)
+    return b''.join([header, struct.pack(f'<{slot_count}I', *slots), entries, phrases, shadowed, pool.data])
+
+
+def write_matcher(path, rules: CompiledRules, mode: str, version: int, source: str) -> int:
+    """Write a matcher file next to ``path`` and move it into place; returns its size"""
+    data = dump_matcher(rules, mode, version, source)
+    temp_name = f'{path}.part'
+    try:
+        with open(temp_name, 'wb') as f:
+            f.write(data)
+    except BaseException:
+        os.remove(temp_name)
+        raise
+    # A new inode: processes mapping the old file are not affected
+    os.replace(temp_name, path)
+    return len(data)
+
+
+def build_matchers(store, directory, source: str,
+                   modes: Optional[Iterable[str]] = None) -> List[Tuple[str, Path, int]]:
+    """Compile and write a matcher for each mode; returns (mode, path, bytes)"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    built = []
+    for mode in modes or store.modes():
+        version = store.version(mode)
+        rules = compile_rules(store.items(mode, 'whitelist'), store.items(mode, 'blacklist'))
+        path = directory / matcher_filename(mode)
+        built.append((mode, path, write_matcher(path, rules, mode, version, source)))
+    return built
+
+
+class _WordTable(Mapping):
+    """Read-only {word: rule} view of one list in a mapped matcher"""
+
+    def __init__(self, matcher: 'MappedMatcher', field: int, size: int):
+        self._matcher = matcher
+        self._field = field
+        self._size = size
+
+    def __contains__(self, word) -> bool:
+        entry = self._matcher.entry(word)
+        return entry is not None and entry[self._field] is not None
+
+    def __getitem__(self, word) -> str:
+        entry = self._matcher.entry(word)
+        if entry is None or entry[self._field] is None:
+            raise KeyError(word)
+        return entry[self._field]
+
+    def get(self, word, default=None):
+        entry = self._matcher.entry(word)
+        if entry is None or entry[self._field] is None:
+            return default
+        return entry[self._field]
+
+    def __iter__(self) -> Iterator[str]:
+        for word, entry in self._matcher.iter_entries():
+            if entry[self._field] is not None:
+                yield word
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class _PhraseTable(_WordTable):
+    """Read-only {last word: phrase candidates} view of a mapped matcher"""
+
+    def __contains__(self, word) -> bool:
+        entry = self._matcher.entry(word)
+        return entry is not None and bool(entry[2])
+
+    def __getitem__(self, word):
+        entry = self._matcher.entry(word)
+        if entry is None or not entry[2]:
+            raise KeyError(word)
+        return entry[2]
+
+    def get(self, word, default=None):
+        entry = self._matcher.entry(word)
+        if entry is None or not entry[2]:
+            return default
+        return entry[2]
+
+    def __iter__(self) -> Iterator[str]:
+        for word, entry in self._matcher.iter_entries():
+            if entry[2]:
+                yield word
+
+
+class MappedMatcher:
+    """A matcher file mapped read-only, with ``rules`` scanning from its pages.
+
+    Only the words looked up are decoded, and the last ``MEMO_SIZE`` of them
+    are memoized, so repeated words cost one dict lookup.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(path, 'rb') as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._buffer) < _HEADER.size:
+            raise ValueError(f"{path}: not a matcher file")
+        (magic, format_version, self._slot_count, self._entry_count, _, shadowed_count,
+         max_phrase_words, max_whitelist_words, whitelist_count, blacklist_count, phrase_words,
+         self.version, self._slots, self._entries, self._phrases, shadowed_offset, self._strings,
+         mode_offset, mode_length, source_offset, source_length) = _HEADER.unpack_from(self._buffer)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a matcher file")
+        if format_version != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported matcher format version {format_version}")
+        self.mode = self._string(mode_offset, mode_length)
+        self.source = self._string(source_offset, source_length)
+        self._memo: Dict[str, Optional[tuple]] = {}
+
+        shadowed: Dict[Tuple[str, Tuple[str, ...]], List[str]] = {}
+        for index in range(shadowed_count):
+            tokens_offset, tokens_length, rule_offset, rule_length, list_code = \
+                _SHADOWED.unpack_from(self._buffer, shadowed_offset + index * _SHADOWED.size)
+            key = (_LIST_TYPES[list_code], tuple(self._string(tokens_offset, tokens_length).split(' ')))
+            shadowed.setdefault(key, []).append(self._string(rule_offset, rule_length))
+        self.rules = CompiledRules(
+            whitelist=_WordTable(self, 0, whitelist_count),
+            blacklist=_WordTable(self, 1, blacklist_count),
+            phrases=_PhraseTable(self, 2, phrase_words),
+            max_phrase_words=max_phrase_words,
+            max_whitelist_words=max_whitelist_words,
+            shadowed=shadowed,
+        )
+
+    def close(self):
+        self._buffer.close()
+
+    def _string(self, offset: int, length: int) -> Optional[str]:
+        if length == _ABSENT:
+            return None
+        start = self._strings + offset
+        return self._buffer[start:start + length].decode('utf-8')
+
+    def _decode(self, number: int) -> tuple:
+        (_, _, whitelist_offset, whitelist_length, blacklist_offset, blacklist_length,
+         phrase_start, phrase_count) = _ENTRY.unpack_from(self._buffer, self._entries + number * _ENTRY.size)
+        candidates = []
+        for index in range(phrase_start, phrase_start + phrase_count):
+            rule_offset, rule_length, tokens_offset, tokens_length, list_code = \
+                _PHRASE.unpack_from(self._buffer, self._phrases + index * _PHRASE.size)
+            candidates.append((tuple(self._string(tokens_offset, tokens_length).split(' ')),
+                               self._string(rule_offset, rule_length), _LIST_TYPES[list_code]))
+        return (self._string(whitelist_offset, whitelist_length),
+                self._string(blacklist_offset, blacklist_length), tuple(candidates))
+
+    def _find(self, word: str) -> Optional[tuple]:
+        key = word.encode('utf-8')
+        buffer, mask = self._buffer, self._slot_count - 1
+        slot = zlib.crc32(key) & mask
+        while True:
+            number = _SLOT.unpack_from(buffer, self._slots + slot * _SLOT.size)[0]
+            if not number:
+                return None
+            position = self._entries + (number - 1) * _ENTRY.size
+            key_offset, key_length = struct.unpack_from('<II', buffer, position)
+            start = self._strings + key_offset
+            if buffer[start:start + key_length] == key:
+                return self._decode(number - 1)
+            slot = (slot + 1) & mask
+
+    def entry(self, word: str) -> Optional[tuple]:
+        """(whitelist rule, blacklist rule, phrase candidates) of a word, or None"""
+        memo = self._memo
+        try:
+            return memo[word]
+        except KeyError:
+            pass
+        entry = self._find(word)
+        if len(memo) >= MEMO_SIZE:
+            memo.clear()
+        memo[word] = entry
+        return entry
+
+    def iter_entries(self) -> Iterator[Tuple[str, tuple]]:
+        """Every (word, entry), decoded from the file without memoizing"""
+        for number in range(self._entry_count):
+            key_offset, key_length = struct.unpack_from('<II', self._buffer, self._entries + number * _ENTRY.size)
+            yield self._string(key_offset, key_length), self._decode(number)
+
+
+def load_matcher(path) -> MappedMatcher:
+    return MappedMatcher(path)
+
+
+class MatcherDirectory:
+    """Prebuilt matchers of a rule source, opened on first use and shared.
+
+    Calling it with (mode, version) returns the mapped ``CompiledRules`` if a
+    matcher built from ``source`` at exactly that version exists, else None
+    so the caller compiles as usual. A rebuilt file is mapped again.
+    """
+
+    def __init__(self, directory, source: str):
+        self.directory = Path(directory)
+        self.source = source
+        self._open: Dict[str, Tuple[int, MappedMatcher]] = {}
+
+    def __call__(self, mode: str, version: int) -> Optional[CompiledRules]:
+        path = self.directory / matcher_filename(mode)
+        try:
+            modified = path.stat().st_mtime_ns
+        except OSError:
+            return None
+        opened = self._open.get(mode)
+        if opened is None or opened[0] != modified:
+            try:
+                opened = self._open[mode] = (modified, load_matcher(path))
+            except (OSError, ValueError):
+                return None
+        matcher = opened[1]
+        if matcher.mode != mode or matcher.version != version or matcher.source != self.source:
+            return None
+        return matcher.rules
@@ -0,0 +1,208 @@
+"""Sorted merge of imported rule sets into a mode's lists.
+
+Imports are planned before they are committed: both sides are sorted by
+their normalized form and walked together, so added items, duplicates and
+conflicts (an item ending up on both the whitelist and the blacklist) are
+found in O(n log n) without per-item list scans.
+
+Edits made on both sides since an export (e.g. an item moved to the other
+list here and removed there) are not detected: CSV/TXT exports carry no
+base version, so an import cannot tell a removal from an item that was
+never listed. Imports only ever add, and a move still surfaces as a
+cross-list conflict. Delta patches (``filter_delta``) carry versions for
+syncing removals.
+"""
+import csv
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+LIST_TYPES = ('whitelist', 'blacklist')
+
+# Conflict kinds reported by a merge plan
+CONFLICT_CROSS_LIST = 'cross-list'        # incoming on one list, already on the other
+CONFLICT_INCOMING_BOTH = 'incoming-both'  # the import itself lists the item on both
+CONFLICT_EXISTING_BOTH = 'existing-both'  # already on both lists before the import
+
+
+def normalize_item(item: str) -> str:
+    """Form used to compare rules; matching is case- and spacing-insensitive"""
+    return ' '.join(item.lower().split())
+
+
+def iter_csv_rules(lines: Iterable[str]) -> Iterator[Tuple[str, str]]:
+    """Yield (list type, item) pairs from a Type,Item export, one row at a time"""
+    reader = csv.reader(lines)
+    next(reader, None)  # Skip header
+    for row in reader:
+        if len(row) == 2:
+            list_type, item = row
+            if list_type in LIST_TYPES and item.strip():
+                yield list_type, item
+
+
+def iter_txt_rules(lines: Iterable[str], default_list: Optional[str] = None) -> Iterator[Tuple[str, str]]:
+    """Yield (list type, item) pairs from a sectioned TXT export.
+
+    Lines before the first section header go to ``default_list``, so a plain
+    one-item-per-line file can be imported into a given list.
+    """
+    current_list = default_list
+    for line in lines:
+        line = line.strip()
+        if line.startswith('=== Whitelist ==='):
+            current_list = 'whitelist'
+        elif line.startswith('=== Blacklist ==='):
+            current_list = 'blacklist'
+        elif line.startswith('==='):
+            continue
+        elif line and current_list:
+            yield current_list, line
+
+
+def batch_rules(pairs: Iterable[Tuple[str, str]], batch_size: int = 10000) -> Iterator[Dict[str, List[str]]]:
+    """Group (list type, item) pairs into per-list batches of at most batch_size items"""
+    batch = {list_type: [] for list_type in LIST_TYPES}
+    count = 0
+    for list_type, item in pairs:
+        batch[list_type].append(item)
+        count += 1
+        if count >= batch_size:
+            yield batch
+            batch = {list_type: [] for list_type in LIST_TYPES}
+            count = 0
+    if count:
+        yield batch
+
+
+def _collect(pairs: Iterable[Tuple[str, str]]) -> Dict[str, List[str]]:
+    rules = {list_type: [] for list_type in LIST_TYPES}
+    for list_type, item in pairs:
+        rules[list_type].append(item)
+    return rules
+
+
+def parse_csv_rules(lines: Iterable[str]) -> Dict[str, List[str]]:
+    """Read a Type,Item export into whitelist/blacklist item lists"""
+    return _collect(iter_csv_rules(lines))
+
+
+def parse_txt_rules(lines: Iterable[str], default_list: Optional[str] = None) -> Dict[str, List[str]]:
+    """Read a sectioned TXT export into whitelist/blacklist item lists"""
+    return _collect(iter_txt_rules(lines, default_list))
+
+
+def _sorted_keys(items: List[str]) -> List[Tuple[str, int]]:
+    return sorted((normalize_item(item), index) for index, item in enumerate(items))
+
+
+def _unique_keys(keyed: List[Tuple[str, int]]) -> List[str]:
+    keys = []
+    for key, _ in keyed:
+        if not keys or keys[-1] != key:
+            keys.append(key)
+    return keys
+
+
+def _intersect(left: List[str], right: List[str]) -> List[str]:
+    """Keys present in both sorted, de-duplicated key lists"""
+    common = []
+    i = j = 0
+    while i < len(left) and j < len(right):
+        if left[i] == right[j]:
+            common.append(left[i])
+            i += 1
+            j += 1
+        elif left[i] < right[j]:
+            i += 1
+        else:
+            j += 1
+    return common
+
+
+@dataclass
+class MergePlan:
+    """Outcome of merging an incoming rule set, computed before committing.
+
+    ``added`` and ``duplicates`` hold items per list in incoming order;
+    ``conflicts`` holds (normalized item, kind) pairs sorted by item.
+    """
+    added: Dict[str, List[str]] = field(default_factory=lambda: {lt: [] for lt in LIST_TYPES})
+    duplicates: Dict[str, List[str]] = field(default_factory=lambda: {lt: [] for lt in LIST_TYPES})
+    conflicts: List[Tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def conflicting_items(self) -> set:
+        return {key for key, kind in self.conflicts if kind != CONFLICT_EXISTING_BOTH}
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            'added_whitelist': len(self.added['whitelist']),
+            'added_blacklist': len(self.added['blacklist']),
+            'duplicates': sum(len(items) for items in self.duplicates.values()),
+            'conflicts': len(self.conflicts),
+        }
+
+    def additions(self, skip_conflicts: bool = False) -> Dict[str, List[str]]:
+        """Items to add per list, optionally leaving out conflicting ones"""
+        if not skip_conflicts:
+            return self.added
+        skipped = self.conflicting_items
+        return {
+            list_type: [item for item in items if normalize_item(item) not in skipped]
+            for list_type, items in self.added.items()
+        }
+
+    def apply(self, lists: Dict[str, List[str]], skip_conflicts: bool = False) -> int:
+        """Append the planned additions to a mode's lists; returns items added"""
+        added = 0
+        for list_type, items in self.additions(skip_conflicts).items():
+            lists[list_type].extend(items)
+            added += len(items)
+        return added
+
+
+def plan_merge(current: Dict[str, List[str]], incoming: Dict[str, List[str]]) -> MergePlan:
+    """Plan merging ``incoming`` lists into ``current`` without modifying either"""
+    plan = MergePlan()
+    merged_keys = {}
+    existing_keys = {}
+    incoming_keys = {}
+    for list_type in LIST_TYPES:
+        items = incoming.get(list_type, [])
+        existing = existing_keys[list_type] = _unique_keys(_sorted_keys(current.get(list_type, [])))
+        new = _sorted_keys(items)
+        incoming_keys[list_type] = _unique_keys(new)
+
+        # Walk both sorted sequences once; anything equal to the previous
+        # incoming key or an existing key is a duplicate.
+        added_indexes, duplicate_indexes = [], []
+        merged = []
+        i = 0
+        previous = None
+        for key, index in new:
+            while i < len(existing) and existing[i] < key:
+                merged.append(existing[i])
+                i += 1
+            if key == previous or (i < len(existing) and existing[i] == key):
+                duplicate_indexes.append(index)
+            else:
+                added_indexes.append(index)
+                merged.append(key)
+            previous = key
+        merged.extend(existing[i:])
+        merged_keys[list_type] = merged
+
+        plan.added[list_type] = [items[index] for index in sorted(added_indexes)]
+        plan.duplicates[list_type] = [items[index] for index in sorted(duplicate_indexes)]
+
+    existing_both = set(_intersect(existing_keys['whitelist'], existing_keys['blacklist']))
+    incoming_both = set(_intersect(incoming_keys['whitelist'], incoming_keys['blacklist']))
+    for key in _intersect(merged_keys['whitelist'], merged_keys['blacklist']):
+        if key in existing_both:
+            kind = CONFLICT_EXISTING_BOTH
+        elif key in incoming_both:
+            kind = CONFLICT_INCOMING_BOTH
+        else:
+            kind = CONFLICT_CROSS_LIST
+        plan.conflicts.append((key, kind))
+    return plan
@@ -0,0 +1,96 @@
+"""Overlap and shadowing analysis for a mode's whitelist and blacklist.
+
+Every check works on normalized rules through hash lookups, so a mode with
+n rules of at most k words is analyzed in O(n * k^2) rather than comparing
+rules pairwise.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Set, Tuple
+
+from filter_merge import LIST_TYPES, normalize_item
+
+
+@dataclass
+class OverlapReport:
+    """Redundant and contradictory rules found in a mode.
+
+    - ``both_lists``: (normalized item, whitelist rule, blacklist rule); the
+      whitelist match covers the blacklist one, so the item is never blocked
+    - ``shadowed``: (blacklist phrase, shorter blacklist rule inside it);
+      any content matching the phrase is already blocked by the shorter rule,
+      which no whitelist rule protects
+    - ``never_fire``: (list, rule, reason) for rules that can never produce a
+      hit, because they are empty or an equivalent rule on the same list
+      takes the match
+    """
+    both_lists: List[Tuple[str, str, str]] = field(default_factory=list)
+    shadowed: List[Tuple[str, str]] = field(default_factory=list)
+    never_fire: List[Tuple[str, str, str]] = field(default_factory=list)
+
+    @property
+    def removable(self) -> int:
+        return len(self.shadowed) + len(self.never_fire)
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            'both_lists': len(self.both_lists),
+            'shadowed': len(self.shadowed),
+            'never_fire': len(self.never_fire),
+        }
+
+
+def _sub_phrases(tokens: Tuple[str, ...]) -> Iterator[str]:
+    size = len(tokens)
+    for length in range(1, size + 1):
+        for start in range(size - length + 1):
+            yield ' '.join(tokens[start:start + length])
+
+
+def _shorter_rule(tokens: Tuple[str, ...], rules: Dict[str, str], protected: Set[str] = frozenset()) -> str:
+    """Return a rule matching a strict contiguous sub-phrase of tokens, if any.
+
+    Sub-phrases in ``protected`` are skipped: a whitelist match may suppress
+    them where it does not cover the whole phrase.
+    """
+    size = len(tokens)
+    for length in range(1, size):
+        for start in range(size - length + 1):
+            key = ' '.join(tokens[start:start + length])
+            rule = rules.get(key)
+            if rule is not None and key not in protected:
+                return rule
+    return ''
+
+
+def analyze_overlaps(lists: Dict[str, List[str]]) -> OverlapReport:
+    """Find rules that are on both lists, shadowed, or can never fire"""
+    report = OverlapReport()
+    effective = {}
+    for list_type in LIST_TYPES:
+        # Later duplicates win, mirroring how analysis compiles the lists
+        rules: Dict[str, str] = {}
+        for item in lists.get(list_type, []):
+            key = normalize_item(item)
+            if not key:
+                report.never_fire.append((list_type, item, 'empty rule'))
+                continue
+            previous = rules.get(key)
+            if previous is not None:
+                report.never_fire.append((list_type, previous, f"duplicate of '{item}'"))
+            rules[key] = item
+        effective[list_type] = rules
+
+    whitelist, blacklist = effective['whitelist'], effective['blacklist']
+    for key, item in whitelist.items():
+        if key in blacklist:
+            report.both_lists.append((key, item, blacklist[key]))
+
+    # Every contiguous part of a whitelist rule can be covered by a whitelist match
+    protected = {part for key in whitelist for part in _sub_phrases(tuple(key.split(' ')))}
+    for key, item in blacklist.items():
+        tokens = tuple(key.split(' '))
+        if len(tokens) > 1:
+            shorter = _shorter_rule(tokens, blacklist, protected)
+            if shorter:
+                report.shadowed.append((item, shorter))
+    return report
@@ -0,0 +1,152 @@
+"""On-demand profiling of slow operations.
+
+``Profiler.arm(n)`` captures the next n operations run inside
+``profiler.profile(name)``: each gets its own cProfile run (merged into one
+``pstats.Stats``), and tracemalloc traces allocations from the first captured
+operation until the last one ends, when a snapshot is taken. ``report()``
+renders the operation timings, the top functions and the top allocation
+sites as plain text. While the profiler is not armed ``profile`` does nothing.
+"""
+import cProfile
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+TRACEBACK_FRAMES = 10
+REPORT_TOP = 25
+
+# Allocations made by the profilers themselves
+_IGNORED_FILES = (__file__, tracemalloc.__file__, pstats.__file__, cProfile.__file__, '<frozen importlib._bootstrap>')
+
+
+class Profiler:
+    """Captures CPU profiles and allocation sites of the next n operations.
+
+    Operations may run on several threads; tracemalloc is process-wide, so
+    the allocation snapshot also covers anything else running meanwhile.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.remaining = 0
+        self._running = 0
+        self._stats: Optional[pstats.Stats] = None
+        self._operations: List[Tuple[str, float, int]] = []
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._peak = 0
+        self._started_tracing = False
+        self.captured_at: Optional[datetime] = None
+
+    @property
+    def armed(self) -> bool:
+        return self.remaining > 0 or self._running > 0
+
+    @property
+    def has_report(self) -> bool:
+        return self.captured_at is not None
+
+    def arm(self, operations: int = 5):
+        """Capture the next ``operations`` operations, dropping any previous capture"""
+        with self._lock:
+            self.remaining = max(operations, 0)
+            self._stats = None
+            self._operations = []
+            self._snapshot = None
+            self._peak = 0
+            self.captured_at = None
+
+    def disarm(self):
+        """Stop capturing; operations already running are still recorded"""
+        with self._lock:
+            self.remaining = 0
+            if self._running == 0 and self._operations:
+                self._finish()
+
+    @contextmanager
+    def profile(self, name: str):
+        with self._lock:
+            if self.remaining <= 0:
+                capture = False
+            else:
+                capture = True
+                self.remaining -= 1
+                self._running += 1
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(TRACEBACK_FRAMES)
+                    self._started_tracing = True
+        if not capture:
+            yield
+            return
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active on this thread (e.g. a nested operation)
+            profile = None
+        allocated = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if profile is not None:
+                profile.disable()
+            current, peak = tracemalloc.get_traced_memory()
+            with self._lock:
+                self._operations.append((name, elapsed, current - allocated))
+                self._peak = max(self._peak, peak)
+                if profile is not None:
+                    if self._stats is None:
+                        self._stats = pstats.Stats(profile)
+                    else:
+                        self._stats.add(profile)
+                self._running -= 1
+                if self.remaining == 0 and self._running == 0:
+                    self._finish()
+
+    def _finish(self):
+        if tracemalloc.is_tracing():
+            self._snapshot = tracemalloc.take_snapshot().filter_traces(
+                [tracemalloc.Filter(False, filename) for filename in _IGNORED_FILES])
+            if self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+        self.captured_at = datetime.now()
+
+    def report(self, top: int = REPORT_TOP) -> str:
+        """Plain text report of the last capture"""
+        with self._lock:
+            operations = list(self._operations)
+            stats, snapshot = self._stats, self._snapshot
+        out = io.StringIO()
+        captured = self.captured_at.strftime('%Y-%m-%d %H:%M:%S') if self.captured_at else 'in progress'
+        plural = '' if len(operations) == 1 else 's'
+        out.write(f'Profile of {len(operations)} operation{plural} ({captured})\n\n')
+
+        out.write('Operations\n')
+        for name, elapsed, allocated in operations:
+            out.write(f'  {elapsed * 1000:10.1f} ms  {allocated / 1024:+12.1f} KB  {name}\n')
+        out.write(f'  Peak traced memory: {self._peak / 1024 / 1024:.1f} MB\n\n')
+
+        if stats is not None:
+            stats.stream = out
+            for sort_key, title in (('cumulative', 'cumulative time'), ('tottime', 'own time')):
+                out.write(f'Top functions by {title}\n')
+                stats.sort_stats(sort_key).print_stats(top)
+
+        if snapshot is not None:
+            out.write('Top allocation sites (still held when the capture ended)\n')
+            for stat in snapshot.statistics('lineno')[:top]:
+                frame = stat.traceback[0]
+                out.write(f'  {stat.size / 1024:10.1f} KB  {stat.count:8} blocks  {frame.filename}:{frame.lineno}\n')
+        return out.getvalue()
+
+    def save_report(self, path, top: int = REPORT_TOP):
+        with open(path, 'w') as f:
+            f.write(self.report(top))
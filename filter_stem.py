@@ -0,0 +1,96 @@
+"""Inflection-insensitive matching for English rules.
+
+``stem`` strips the inflectional suffixes handled by step 1 of the Porter
+stemmer (plurals, -ed, -ing and a final -y), so "kill", "kills", "killed"
+and "killing" all reduce to "kill". Derivational suffixes (-ness, -ful,
+...) are left alone, which keeps distinct words from collapsing together.
+
+Rules are stemmed once when they are compiled; words of the analyzed text
+are memoized in ``STEM_CACHE``, which scanners read directly, so a
+document mostly costs one dict lookup per word. Tokens that are not purely
+alphabetic are returned unchanged.
+"""
+from typing import Dict
+
+STEM_CACHE_SIZE = 1 << 17
+
+# Word -> stem; cleared when full
+STEM_CACHE: Dict[str, str] = {}
+
+_VOWELS = frozenset('aeiou')
+
+
+def _consonant(word: str, i: int) -> bool:
+    if word[i] in _VOWELS:
+        return False
+    if word[i] == 'y':
+        return i == 0 or not _consonant(word, i - 1)
+    return True
+
+
+def _measure(stem: str) -> int:
+    """Number of vowel-consonant sequences, Porter's m"""
+    m = 0
+    previous_vowel = False
+    for i in range(len(stem)):
+        vowel = not _consonant(stem, i)
+        if previous_vowel and not vowel:
+            m += 1
+        previous_vowel = vowel
+    return m
+
+
+def _has_vowel(stem: str) -> bool:
+    return any(not _consonant(stem, i) for i in range(len(stem)))
+
+
+def _double_consonant(word: str) -> bool:
+    return len(word) >= 2 and word[-1] == word[-2] and _consonant(word, len(word) - 1)
+
+
+def _cvc(word: str) -> bool:
+    """Ends consonant-vowel-consonant, the last not w, x or y (e.g. hop, not hoop)"""
+    return (len(word) >= 3 and _consonant(word, len(word) - 3) and not _consonant(word, len(word) - 2)
+            and _consonant(word, len(word) - 1) and word[-1] not in 'wxy')
+
+
+def stem(word: str) -> str:
+    """Inflectional stem of a lowercased word, memoized"""
+    result = STEM_CACHE.get(word)
+    if result is None:
+        if len(STEM_CACHE) >= STEM_CACHE_SIZE:
+            STEM_CACHE.clear()
+        result = STEM_CACHE[word] = _stem(word)
+    return result
+
+
+def _stem(word: str) -> str:
+    if len(word) <= 2 or not word.isalpha():
+        return word
+
+    # Step 1a: plurals
+    if word.endswith('sses') or word.endswith('ies'):
+        word = word[:-2]
+    elif word.endswith('s') and not word.endswith('ss'):
+        word = word[:-1]
+
+    # Step 1b: -eed, -ed, -ing
+    if word.endswith('eed'):
+        if _measure(word[:-3]) > 0:
+            word = word[:-1]
+    else:
+        for suffix in ('ed', 'ing'):
+            if word.endswith(suffix) and _has_vowel(word[:-len(suffix)]):
+                word = word[:-len(suffix)]
+                if word.endswith(('at', 'bl', 'iz')):
+                    word += 'e'
+                elif _double_consonant(word) and word[-1] not in 'lsz':
+                    word = word[:-1]
+                elif _measure(word) == 1 and _cvc(word):
+                    word += 'e'
+                break
+
+    # Step 1c: final y after a vowel-bearing stem
+    if word.endswith('y') and _has_vowel(word[:-1]):
+        word = word[:-1] + 'i'
+    return word
@@ -0,0 +1,472 @@
+"""Rule storage backends.
+
+``MemoryRuleStore`` wraps the usual ``mode_data`` dict of Python lists that
+is saved to and loaded from JSON. ``SQLiteRuleStore`` keeps the same rules in
+an embedded SQLite database in WAL mode, so several editors can write
+concurrently and membership, search, pagination and counts are answered by
+indexed queries instead of loading every list into memory.
+
+With ``compact=True`` the memory store keeps each list as a ``CompactList``
+(see ``filter_compact``), which holds multi-million-item lists in a fraction
+of the memory of a list of ``str``.
+
+Both stores expose the same methods and keep a per-mode ruleset version
+that is bumped by every write, which callers use to key caches. The memory
+store can also keep an undo/redo history (see ``filter_history``).
+
+Both stores also log which items each version added and removed, so
+``changes_since`` can feed delta patches (see ``filter_delta``). The memory
+store keeps a bounded log for the life of the process; the SQLite store
+logs through triggers into a ``changes`` table.
+"""
+import contextlib
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from filter_compact import CompactList
+from filter_delta import ADD, REMOVE, ChangeJournal, DeltaUnavailable, list_changes
+from filter_history import RuleHistory
+from filter_merge import LIST_TYPES, normalize_item
+
+DEFAULT_MODES = ['Child Safe Mode', 'High School Teen Safe Mode', 'Custom Mode']
+
+
+def empty_mode_data(modes: Iterable[str] = DEFAULT_MODES) -> Dict[str, Dict[str, List[str]]]:
+    return {mode: {list_type: [] for list_type in LIST_TYPES} for mode in modes}
+
+
+class MemoryRuleStore:
+    """Rules held in a ``{mode: {'whitelist': [...], 'blacklist': [...]}}`` dict.
+
+    Pass ``history_limit`` to record every write for undo/redo, and
+    ``compact`` to store the lists as ``CompactList``. The history mirrors
+    changed lists as trees with a node per item, so very large compact
+    stores are best kept without history.
+    """
+
+    def __init__(self, mode_data: Optional[Dict[str, Dict[str, List[str]]]] = None,
+                 history_limit: int = 0, compact: bool = False, journal_limit: int = 100_000):
+        self.compact = compact
+        self.mode_data = self._convert(mode_data if mode_data is not None else empty_mode_data())
+        self._versions = {mode: 0 for mode in self.mode_data}
+        self.history = RuleHistory(history_limit) if history_limit else None
+        self.journal = ChangeJournal(journal_limit)
+
+    def _new_list(self, items: Iterable[str] = ()):
+        return CompactList(items) if self.compact else list(items)
+
+    def _convert(self, mode_data: Dict[str, Dict[str, List[str]]]) -> Dict[str, Dict[str, List[str]]]:
+        if not self.compact:
+            return mode_data
+        return {mode: {list_type: CompactList.from_list(lists.get(list_type, [])) for list_type in LIST_TYPES}
+                for mode, lists in mode_data.items()}
+
+    def _lists(self, mode: str) -> Dict[str, List[str]]:
+        return self.mode_data.setdefault(mode, {list_type: self._new_list() for list_type in LIST_TYPES})
+
+    def _bump(self, mode: str):
+        self._versions[mode] = self._versions.get(mode, 0) + 1
+
+    def _log(self, mode: str, list_type: str, before: Iterable[str], after: Iterable[str]):
+        """Record the items a write added and removed, under the version it produced"""
+        added, removed = list_changes(before, after)
+        self.journal.record(mode, self._versions[mode], REMOVE, list_type, removed)
+        self.journal.record(mode, self._versions[mode], ADD, list_type, added)
+
+    def changes_since(self, mode: str, version: int):
+        """(version, op, list type, items) logged after ``version``"""
+        return self.journal.since(mode, version)
+
+    def action(self, label: str, group=None):
+        """Context manager grouping the writes inside it into one undo step.
+
+        Actions passing the same ``group`` object extend that step for as
+        long as it is the latest one.
+        """
+        return self.history.action(label, group) if self.history else contextlib.nullcontext()
+
+    def discard_action(self, group) -> bool:
+        """Revert and forget ``group``'s undo step; False if other changes came after it"""
+        changes = self.history.discard(group) if self.history else None
+        if changes is None:
+            return False
+        self._restore(changes)
+        return True
+
+    def _restore(self, changes) -> bool:
+        for (mode, list_type), tree in changes.items():
+            before = self._lists(mode)[list_type]
+            self._lists(mode)[list_type] = self._new_list(tree)
+            self._bump(mode)
+            self._log(mode, list_type, before, self._lists(mode)[list_type])
+        return bool(changes)
+
+    def undo(self) -> bool:
+        return self._restore(self.history.undo()) if self.history else False
+
+    def redo(self) -> bool:
+        return self._restore(self.history.redo()) if self.history else False
+
+    def modes(self) -> List[str]:
+        return list(self.mode_data)
+
+    def version(self, mode: str) -> int:
+        return self._versions.get(mode, 0)
+
+    def items(self, mode: str, list_type: str) -> List[str]:
+        """The live list of rules; treat it as read-only"""
+        return self._lists(mode)[list_type]
+
+    def count(self, mode: str, list_type: str) -> int:
+        return len(self._lists(mode)[list_type])
+
+    def contains(self, mode: str, list_type: str, item: str) -> bool:
+        return item in self._lists(mode)[list_type]
+
+    def search(self, mode: str, list_type: str, query: str = '',
+               offset: int = 0, limit: Optional[int] = None) -> List[str]:
+        """Rules containing ``query`` (case-insensitive), in insertion order"""
+        items = self._lists(mode)[list_type]
+        if query:
+            query = query.lower()
+            items = [item for item in items if query in item.lower()]
+        return list(items[offset:offset + limit if limit is not None else None])
+
+    def search_count(self, mode: str, list_type: str, query: str = '') -> int:
+        if not query:
+            return self.count(mode, list_type)
+        query = query.lower()
+        return sum(1 for item in self._lists(mode)[list_type] if query in item.lower())
+
+    def add_items(self, mode: str, list_type: str, items: Iterable[str]) -> int:
+        """Append items not already on the list; returns how many were added"""
+        current = self._lists(mode)[list_type]
+        # A compact list answers membership from its own index
+        existing = current if isinstance(current, CompactList) else set(current)
+        seen = set()
+        new_items = []
+        for item in items:
+            if item and item not in seen and item not in existing:
+                new_items.append(item)
+                seen.add(item)
+        if new_items:
+            if self.history:
+                self.history.appended(mode, list_type, current, new_items, f'Add to {list_type}')
+            current.extend(new_items)
+            self._bump(mode)
+            self.journal.record(mode, self._versions[mode], ADD, list_type, new_items)
+        return len(new_items)
+
+    def remove_items(self, mode: str, list_type: str, items: Iterable[str]) -> int:
+        removed = set(items)
+        current = self._lists(mode)[list_type]
+        indexes = [index for index, item in enumerate(current) if item in removed]
+        if indexes:
+            if self.history:
+                self.history.removed(mode, list_type, current, indexes, f'Remove from {list_type}')
+            self._lists(mode)[list_type] = self._new_list(item for item in current if item not in removed)
+            self._bump(mode)
+            self.journal.record(mode, self._versions[mode], REMOVE, list_type, [current[i] for i in indexes])
+        return len(indexes)
+
+    def clear(self, mode: str, list_type: str):
+        if self.history:
+            self.history.replaced(mode, list_type, self._lists(mode)[list_type], [], f'Clear {list_type}')
+        before = self._lists(mode)[list_type]
+        self._lists(mode)[list_type] = self._new_list()
+        self._bump(mode)
+        self.journal.record(mode, self._versions[mode], REMOVE, list_type, before)
+
+    def sort(self, mode: str, list_type: str, reverse: bool = False):
+        current = self._lists(mode)[list_type]
+        if self.history:
+            self.history.replaced(mode, list_type, current, sorted(current, reverse=reverse),
+                                  f'Sort {list_type}')
+        current.sort(reverse=reverse)
+        self._bump(mode)  # Order is part of the version; paged views depend on it
+
+    def load_mode_data(self, mode_data: Dict[str, Dict[str, List[str]]]):
+        """Replace every mode's rules, e.g. after loading a configuration"""
+        if self.history:
+            with self.history.action('Load configuration'):
+                for mode in set(self.mode_data) | set(mode_data):
+                    for list_type in LIST_TYPES:
+                        self.history.replaced(mode, list_type, self._lists(mode)[list_type],
+                                              mode_data.get(mode, {}).get(list_type, []))
+        previous = self.mode_data
+        self.mode_data = self._convert(mode_data)
+        for mode in set(self._versions) | set(mode_data):
+            self._bump(mode)
+            for list_type in LIST_TYPES:
+                self._log(mode, list_type, previous.get(mode, {}).get(list_type, []),
+                          self.mode_data.get(mode, {}).get(list_type, []))
+
+    def to_mode_data(self) -> Dict[str, Dict[str, List[str]]]:
+        if self.compact:
+            return {mode: {list_type: items.to_list() for list_type, items in lists.items()}
+                    for mode, lists in self.mode_data.items()}
+        return self.mode_data
+
+
+class SQLiteRuleStore:
+    """Rules in one SQLite table of (mode, list, item, normalized item).
+
+    The database runs in WAL mode so readers never block the single writer,
+    and bulk additions are written in one transaction with ``executemany``.
+    Each connection is guarded by a lock so a store can be shared between
+    threads of the same process.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS rules (
+            id INTEGER PRIMARY KEY,
+            mode TEXT NOT NULL,
+            list_type TEXT NOT NULL,
+            item TEXT NOT NULL,
+            normalized TEXT NOT NULL,
+            UNIQUE (mode, list_type, item)
+        );
+        CREATE INDEX IF NOT EXISTS rules_normalized
+            ON rules (mode, list_type, normalized);
+        CREATE TABLE IF NOT EXISTS modes (
+            mode TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS changes (
+            id INTEGER PRIMARY KEY,
+            mode TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            list_type TEXT NOT NULL,
+            item TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS changes_version ON changes (mode, version);
+        CREATE TABLE IF NOT EXISTS changes_start (
+            mode TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        );
+        -- Rewrites that log their changes themselves (or have none) set this
+        -- inside their transaction, so other connections never see it
+        CREATE TABLE IF NOT EXISTS changes_paused (paused INTEGER);
+        -- Writes bump the mode's version at the end of their transaction,
+        -- so the changes they log belong to the next version
+        CREATE TRIGGER IF NOT EXISTS rules_added AFTER INSERT ON rules
+        WHEN NOT EXISTS (SELECT 1 FROM changes_paused) BEGIN
+            INSERT INTO changes (mode, version, op, list_type, item)
+            VALUES (NEW.mode, COALESCE((SELECT version FROM modes WHERE mode = NEW.mode), 0) + 1,
+                    'add', NEW.list_type, NEW.item);
+        END;
+        CREATE TRIGGER IF NOT EXISTS rules_removed AFTER DELETE ON rules
+        WHEN NOT EXISTS (SELECT 1 FROM changes_paused) BEGIN
+            INSERT INTO changes (mode, version, op, list_type, item)
+            VALUES (OLD.mode, COALESCE((SELECT version FROM modes WHERE mode = OLD.mode), 0) + 1,
+                    'remove', OLD.list_type, OLD.item);
+        END;
+    """
+
+    def __init__(self, path: str = 'content_filter.db', modes: Iterable[str] = DEFAULT_MODES,
+                 batch_size: int = 10_000):
+        self.path = path
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(self.SCHEMA)
+        with self._conn:
+            self._conn.executemany('INSERT OR IGNORE INTO modes (mode) VALUES (?)',
+                                   [(mode,) for mode in modes])
+            # Databases created before the change log can only diff from their current version
+            self._conn.execute('INSERT OR IGNORE INTO changes_start (mode, version) '
+                               'SELECT mode, version FROM modes')
+
+    # Undo history is not kept for the shared database; other editors'
+    # writes would make it ambiguous.
+    history = None
+
+    def action(self, label: str, group=None):
+        return contextlib.nullcontext()
+
+    def discard_action(self, group) -> bool:
+        return False
+
+    def undo(self) -> bool:
+        return False
+
+    def redo(self) -> bool:
+        return False
+
+    def close(self):
+        self._conn.close()
+
+    def _query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _write(self, mode: str, sql: str, rows: Iterable[tuple]) -> int:
+        """Run a statement over rows in batched transactions and bump the version"""
+        changed = 0
+        batch = []
+        with self._lock:
+            with self._conn:
+                for row in rows:
+                    batch.append(row)
+                    if len(batch) >= self.batch_size:
+                        changed += self._conn.executemany(sql, batch).rowcount
+                        batch = []
+                if batch:
+                    changed += self._conn.executemany(sql, batch).rowcount
+                if changed:
+                    self._bump(mode)
+        return changed
+
+    def _bump(self, mode: str):
+        self._conn.execute(
+            'INSERT INTO modes (mode, version) VALUES (?, 1) '
+            'ON CONFLICT (mode) DO UPDATE SET version = version + 1', (mode,))
+
+    @contextlib.contextmanager
+    def _unlogged(self):
+        """Suspend the change triggers within the current transaction"""
+        self._conn.execute('INSERT INTO changes_paused VALUES (1)')
+        yield
+        self._conn.execute('DELETE FROM changes_paused')
+
+    def _log(self, mode: str, list_type: str, before: Iterable[str], after: Iterable[str]):
+        """Log the difference between two versions of a list under the coming version"""
+        version = self._version(mode) + 1
+        added, removed = list_changes(before, after)
+        self._conn.executemany(
+            'INSERT INTO changes (mode, version, op, list_type, item) VALUES (?, ?, ?, ?, ?)',
+            [(mode, version, REMOVE, list_type, item) for item in removed] +
+            [(mode, version, ADD, list_type, item) for item in added])
+
+    def _version(self, mode: str) -> int:
+        row = self._conn.execute('SELECT version FROM modes WHERE mode = ?', (mode,)).fetchone()
+        return row[0] if row else 0
+
+    def changes_since(self, mode: str, version: int):
+        """(version, op, list type, (item,)) logged after ``version``"""
+        start = self._query('SELECT version FROM changes_start WHERE mode = ?', (mode,))
+        if start and version < start[0][0]:
+            raise DeltaUnavailable(f"{mode}: changes before version {start[0][0]} are not logged")
+        return [(row_version, op, list_type, (item,)) for row_version, op, list_type, item in self._query(
+            'SELECT version, op, list_type, item FROM changes WHERE mode = ? AND version > ? ORDER BY id',
+            (mode, version))]
+
+    def prune_changes(self, mode: str, version: int):
+        """Forget the change log up to ``version``; deltas can then only start from there"""
+        with self._lock:
+            with self._conn:
+                self._conn.execute('DELETE FROM changes WHERE mode = ? AND version <= ?', (mode, version))
+                self._conn.execute(
+                    'INSERT INTO changes_start (mode, version) VALUES (?, ?) '
+                    'ON CONFLICT (mode) DO UPDATE SET version = MAX(version, excluded.version)',
+                    (mode, version))
+
+    def modes(self) -> List[str]:
+        return [row[0] for row in self._query('SELECT mode FROM modes ORDER BY rowid')]
+
+    def version(self, mode: str) -> int:
+        rows = self._query('SELECT version FROM modes WHERE mode = ?', (mode,))
+        return rows[0][0] if rows else 0
+
+    def items(self, mode: str, list_type: str) -> List[str]:
+        return [row[0] for row in self._query(
+            'SELECT item FROM rules WHERE mode = ? AND list_type = ? ORDER BY id', (mode, list_type))]
+
+    def count(self, mode: str, list_type: str) -> int:
+        return self._query('SELECT COUNT(*) FROM rules WHERE mode = ? AND list_type = ?',
+                           (mode, list_type))[0][0]
+
+    def contains(self, mode: str, list_type: str, item: str) -> bool:
+        return bool(self._query(
+            'SELECT 1 FROM rules WHERE mode = ? AND list_type = ? AND item = ?',
+            (mode, list_type, item)))
+
+    @staticmethod
+    def _like(query: str) -> str:
+        escaped = query.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return f'%{escaped}%'
+
+    def search(self, mode: str, list_type: str, query: str = '',
+               offset: int = 0, limit: Optional[int] = None) -> List[str]:
+        """Rules containing ``query`` (case-insensitive), in insertion order"""
+        sql = 'SELECT item FROM rules WHERE mode = ? AND list_type = ?'
+        params = [mode, list_type]
+        if query:
+            sql += " AND normalized LIKE ? ESCAPE '\\'"
+            params.append(self._like(query))
+        sql += ' ORDER BY id LIMIT ? OFFSET ?'
+        params += [limit if limit is not None else -1, offset]
+        return [row[0] for row in self._query(sql, tuple(params))]
+
+    def search_count(self, mode: str, list_type: str, query: str = '') -> int:
+        if not query:
+            return self.count(mode, list_type)
+        return self._query(
+            "SELECT COUNT(*) FROM rules WHERE mode = ? AND list_type = ? AND normalized LIKE ? ESCAPE '\\'",
+            (mode, list_type, self._like(query)))[0][0]
+
+    def add_items(self, mode: str, list_type: str, items: Iterable[str]) -> int:
+        """Insert items not already on the list; returns how many were added"""
+        return self._write(
+            mode,
+            'INSERT OR IGNORE INTO rules (mode, list_type, item, normalized) VALUES (?, ?, ?, ?)',
+            ((mode, list_type, item, normalize_item(item)) for item in items if item))
+
+    def remove_items(self, mode: str, list_type: str, items: Iterable[str]) -> int:
+        return self._write(
+            mode,
+            'DELETE FROM rules WHERE mode = ? AND list_type = ? AND item = ?',
+            ((mode, list_type, item) for item in items))
+
+    def clear(self, mode: str, list_type: str):
+        with self._lock:
+            with self._conn:
+                self._conn.execute('DELETE FROM rules WHERE mode = ? AND list_type = ?', (mode, list_type))
+                self._bump(mode)
+
+    def sort(self, mode: str, list_type: str, reverse: bool = False):
+        """Renumber rows so insertion order follows the sorted order"""
+        items = sorted(self.items(mode, list_type), reverse=reverse)
+        with self._lock:
+            with self._conn:
+                # Membership does not change, so there is nothing to log
+                with self._unlogged():
+                    self._conn.execute('DELETE FROM rules WHERE mode = ? AND list_type = ?', (mode, list_type))
+                    self._conn.executemany(
+                        'INSERT INTO rules (mode, list_type, item, normalized) VALUES (?, ?, ?, ?)',
+                        [(mode, list_type, item, normalize_item(item)) for item in items])
+                self._bump(mode)
+
+    def load_mode_data(self, mode_data: Dict[str, Dict[str, List[str]]]):
+        """Replace every mode's rules in a single transaction"""
+        with self._lock:
+            with self._conn:
+                previous = {}
+                for mode, list_type, item in self._conn.execute('SELECT mode, list_type, item FROM rules'):
+                    previous.setdefault((mode, list_type), []).append(item)
+                # Log only the net difference instead of every deleted and re-inserted row
+                with self._unlogged():
+                    self._conn.execute('DELETE FROM rules')
+                    for mode, lists in mode_data.items():
+                        for list_type in LIST_TYPES:
+                            self._conn.executemany(
+                                'INSERT OR IGNORE INTO rules (mode, list_type, item, normalized) '
+                                'VALUES (?, ?, ?, ?)',
+                                [(mode, list_type, item, normalize_item(item))
+                                 for item in lists.get(list_type, []) if item])
+                # Modes left out of mode_data were emptied and change version too
+                for mode in dict.fromkeys([*mode_data, *(mode for mode, _ in previous)]):
+                    for list_type in LIST_TYPES:
+                        self._log(mode, list_type, previous.get((mode, list_type), []),
+                                  [item for item in mode_data.get(mode, {}).get(list_type, []) if item])
+                    self._bump(mode)
+
+    def to_mode_data(self) -> Dict[str, Dict[str, List[str]]]:
+        mode_data = empty_mode_data(self.modes())
+        for mode, list_type, item in self._query('SELECT mode, list_type, item FROM rules ORDER BY id'):
+            mode_data.setdefault(mode, {lt: [] for lt in LIST_TYPES})[list_type].append(item)
+        return mode_data
@@ -0,0 +1,324 @@
+"""Columnar log of analysis verdicts for moderation analytics.
+
+``VerdictLog`` buffers one row per analysis (timestamp, mode, ruleset
+version, verdict, hit counts and the distinct rules matched) and writes the
+buffer out as an immutable segment file, Parquet by default or Arrow IPC.
+Segments are only ever added, so several processes can log to the same
+directory, and a crash loses at most the unflushed buffer. Small segments
+pile up with many sessions, so once ``COMPACT_SEGMENTS`` of them exist
+the next flush merges them into one (``compact``); a lock file keeps two
+processes from merging the same segments.
+
+Queries read only the columns they need through ``pyarrow.dataset`` (with
+the time filter pushed down to the segments) and aggregate with
+``pyarrow.compute``, so summaries over millions of rows stay well under a
+second. pyarrow ships with Streamlit; without it ``LOG_AVAILABLE`` is
+False and the log cannot be used.
+"""
+import atexit
+import os
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from filter_analysis import FULL_REPORT, AnalysisResult
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # The verdict log is optional; analysis works without it
+    pa = None
+
+LOG_AVAILABLE = pa is not None
+DEFAULT_LOG_DIR = 'verdict_log'
+SEGMENT_FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+SEGMENT_ROWS = 10_000       # Flush once this many rows are buffered
+FLUSH_SECONDS = 60          # ... or when the oldest buffered row is this old
+SMALL_SEGMENT_BYTES = 8 << 20   # Compaction merges segments smaller than this
+COMPACT_SEGMENTS = 16       # ... once there are this many of them
+STALE_LOCK_SECONDS = 600    # A compaction lock older than this was left by a crashed process
+
+COLUMNS = ('timestamp', 'mode', 'version', 'evaluation', 'stemming', 'source', 'blocked',
+           'total_words', 'whitelist_hits', 'blacklist_hits', 'suppressed', 'first_hit',
+           'blacklist_rules', 'whitelist_rules')
+
+if LOG_AVAILABLE:
+    SCHEMA = pa.schema([
+        ('timestamp', pa.timestamp('ms', tz='UTC')),
+        ('mode', pa.string()),
+        ('version', pa.int64()),
+        ('evaluation', pa.string()),
+        ('stemming', pa.bool_()),
+        ('source', pa.string()),
+        ('blocked', pa.bool_()),
+        # Null for verdict-only analyses, which stop at the first hit
+        ('total_words', pa.int64()),
+        ('whitelist_hits', pa.int64()),
+        ('blacklist_hits', pa.int64()),
+        ('suppressed', pa.int64()),
+        ('first_hit', pa.string()),
+        ('blacklist_rules', pa.list_(pa.string())),
+        ('whitelist_rules', pa.list_(pa.string())),
+    ])
+
+
+def analysis_row(mode: str, version: int, result: AnalysisResult, stemming: bool = False,
+                 source: str = 'tester', rule_counts: Optional[Dict[Tuple[str, str], int]] = None,
+                 timestamp: Optional[datetime] = None) -> dict:
+    """One log row; ``rule_counts`` stands in for the match lists of streamed scans"""
+    if result.evaluation != FULL_REPORT:
+        hits = {'whitelist': None, 'blacklist': None}
+        rules = {'whitelist': [], 'blacklist': [result.first_hit] if result.first_hit else []}
+    elif rule_counts is not None:
+        hits, rules = Counter(), {'whitelist': [], 'blacklist': []}
+        for (list_type, rule), count in rule_counts.items():
+            hits[list_type] += count
+            rules[list_type].append(rule)
+    else:
+        matches = {'whitelist': result.whitelisted, 'blacklist': result.blacklisted}
+        hits = {list_type: None if found is None else len(found) for list_type, found in matches.items()}
+        rules = {list_type: list(dict.fromkeys(found or ())) for list_type, found in matches.items()}
+    return {
+        'timestamp': timestamp or datetime.now(timezone.utc),
+        'mode': mode,
+        'version': version,
+        'evaluation': result.evaluation,
+        'stemming': stemming,
+        'source': source,
+        'blocked': result.blocked,
+        'total_words': result.total_words,
+        'whitelist_hits': hits['whitelist'],
+        'blacklist_hits': hits['blacklist'],
+        'suppressed': result.suppressed,
+        'first_hit': result.first_hit,
+        'blacklist_rules': rules['blacklist'],
+        'whitelist_rules': rules['whitelist'],
+    }
+
+
+class VerdictLog:
+    """Append-only segmented log of analyses in ``directory``.
+
+    Thread-safe; rows are buffered per process and written as a new segment
+    every ``segment_rows`` rows, after ``flush_seconds``, on ``flush()`` and
+    at interpreter exit. Each flush compacts the small segments once there
+    are ``compact_segments`` of them (0 turns this off). Queries include the
+    rows still buffered.
+    """
+
+    def __init__(self, directory=DEFAULT_LOG_DIR, segment_format: str = 'parquet',
+                 segment_rows: int = SEGMENT_ROWS, flush_seconds: float = FLUSH_SECONDS,
+                 compact_segments: int = COMPACT_SEGMENTS):
+        if not LOG_AVAILABLE:
+            raise RuntimeError("The verdict log needs pyarrow")
+        if segment_format not in SEGMENT_FORMATS:
+            raise ValueError(f"Unknown segment format: {segment_format}")
+        self.directory = Path(directory)
+        self.segment_format = segment_format
+        self.segment_rows = segment_rows
+        self.flush_seconds = flush_seconds
+        self.compact_segments = compact_segments
+        self._lock = threading.Lock()
+        self._buffer: Dict[str, list] = {column: [] for column in COLUMNS}
+        self._buffered_since: Optional[float] = None
+        self._segments_written = 0
+        atexit.register(self.flush)
+
+    @property
+    def buffered(self) -> int:
+        return len(self._buffer['timestamp'])
+
+    def record(self, mode: str, version: int, result: AnalysisResult, stemming: bool = False,
+               source: str = 'tester', rule_counts: Optional[Dict[Tuple[str, str], int]] = None):
+        self.append(analysis_row(mode, version, result, stemming, source, rule_counts))
+
+    def append(self, row: dict):
+        with self._lock:
+            for column in COLUMNS:
+                self._buffer[column].append(row[column])
+            if self._buffered_since is None:
+                self._buffered_since = time.monotonic()
+            if (self.buffered >= self.segment_rows
+                    or time.monotonic() - self._buffered_since >= self.flush_seconds):
+                self._flush()
+
+    def flush(self) -> Optional[Path]:
+        """Write the buffered rows as a new segment; returns its path"""
+        with self._lock:
+            return self._flush()
+
+    def _flush(self) -> Optional[Path]:
+        if not self.buffered:
+            return None
+        path = self._write_segment(pa.Table.from_pydict(self._buffer, schema=SCHEMA))
+        self._buffer = {column: [] for column in COLUMNS}
+        self._buffered_since = None
+        if self.compact_segments:
+            self.compact(self.compact_segments)
+        return path
+
+    def _write_segment(self, table: 'pa.Table') -> Path:
+        """Write a table as a new segment; it only appears once complete"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+        path = self.directory / (f'analyses-{stamp}-{os.getpid()}-{self._segments_written}'
+                                 f'{SEGMENT_FORMATS[self.segment_format]}')
+        temp_name = f'{path}.part'
+        try:
+            if self.segment_format == 'parquet':
+                pq.write_table(table, temp_name)
+            else:
+                with pa.OSFile(temp_name, 'wb') as sink, pa.ipc.new_file(sink, SCHEMA) as writer:
+                    writer.write_table(table)
+        except BaseException:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+            raise
+        os.replace(temp_name, path)
+        self._segments_written += 1
+        return path
+
+    def compact(self, min_segments: int = 2) -> Optional[Path]:
+        """Merge the segments under ``SMALL_SEGMENT_BYTES`` into one; returns it, or None.
+
+        Nothing happens with fewer than ``min_segments`` small segments or
+        while another process holds the compaction lock. The merged segment
+        appears just before its sources are deleted, so a query running at
+        that moment may briefly count their rows twice.
+        """
+        if len(self._small_segments()) < min_segments:
+            return None
+        lock = self.directory / 'compact.lock'
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            try:
+                if time.time() - lock.stat().st_mtime > STALE_LOCK_SECONDS:
+                    lock.unlink()
+            except FileNotFoundError:
+                pass
+            return None
+        try:
+            # Listed again under the lock: another process may just have merged them
+            small = self._small_segments()
+            if len(small) < min_segments:
+                return None
+            path = self._write_segment(self._read(small, list(COLUMNS)))
+            for segment in small:
+                segment.unlink()
+            return path
+        finally:
+            lock.unlink()
+
+    def _small_segments(self) -> List[Path]:
+        small = []
+        for path in self.segments():
+            try:
+                if path.stat().st_size < SMALL_SEGMENT_BYTES:
+                    small.append(path)
+            except FileNotFoundError:  # Merged away meanwhile
+                pass
+        return small
+
+    def segments(self) -> List[Path]:
+        if not self.directory.exists():
+            return []
+        return sorted(path for path in self.directory.iterdir() if path.suffix in SEGMENT_FORMATS.values())
+
+    def table(self, since: Optional[datetime] = None, columns: Optional[List[str]] = None) -> 'pa.Table':
+        """Logged rows (optionally from ``since`` on), only reading ``columns``"""
+        columns = list(columns or COLUMNS)
+        time_filter = None
+        if since is not None:
+            time_filter = ds.field('timestamp') >= pa.scalar(since, type=SCHEMA.field('timestamp').type)
+        for attempt in range(3):
+            try:
+                tables = [self._read(self.segments(), columns, time_filter)]
+                break
+            except FileNotFoundError:
+                # A compaction deleted a listed segment; its rows are in the merged one now
+                if attempt == 2:
+                    raise
+        with self._lock:
+            if self.buffered:
+                buffered = pa.Table.from_pydict(self._buffer, schema=SCHEMA)
+                if time_filter is not None:
+                    buffered = buffered.filter(time_filter)
+                tables.append(buffered.select(columns))
+        return pa.concat_tables(tables)
+
+    def _read(self, segments: List[Path], columns: List[str], time_filter=None) -> 'pa.Table':
+        tables = [SCHEMA.empty_table().select(columns)]
+        for segment_format, suffix in SEGMENT_FORMATS.items():
+            files = [str(path) for path in segments if path.suffix == suffix]
+            if files:
+                dataset = ds.dataset(files, schema=SCHEMA, format='ipc' if segment_format == 'arrow' else 'parquet')
+                tables.append(dataset.to_table(columns=columns, filter=time_filter))
+        return pa.concat_tables(tables)
+
+
+@dataclass
+class LogSummary:
+    """Aggregates of a slice of the log, as small pandas frames for display"""
+    analyses: int
+    blocked: int
+    words: int
+    by_mode: 'object'        # Mode, Analyses, Blocked, Block Rate, Words
+    by_day: 'object'         # Day, Mode, Analyses, Blocked
+    top_rules: 'object'      # Rule, Analyses
+    query_seconds: float = 0.0
+
+    @property
+    def block_rate(self) -> float:
+        return self.blocked / self.analyses if self.analyses else 0.0
+
+
+SUMMARY_COLUMNS = ['timestamp', 'mode', 'blocked', 'total_words', 'blacklist_rules']
+
+
+def summarize(table: 'pa.Table', top: int = 20) -> LogSummary:
+    """Vectorized per-mode, per-day and top-rule aggregates of logged rows"""
+    blocked = pc.cast(table['blocked'], pa.int64())
+    table = table.set_column(table.schema.get_field_index('blocked'), 'blocked', blocked)
+    by_mode = (table.group_by('mode')
+               .aggregate([('blocked', 'count'), ('blocked', 'sum'), ('total_words', 'sum')])
+               .to_pandas()
+               .rename(columns={'mode': 'Mode', 'blocked_count': 'Analyses', 'blocked_sum': 'Blocked',
+                                'total_words_sum': 'Words'}))
+    by_mode['Block Rate'] = by_mode['Blocked'] / by_mode['Analyses']
+    by_mode = by_mode[['Mode', 'Analyses', 'Blocked', 'Block Rate', 'Words']].sort_values('Analyses', ascending=False)
+
+    days = pc.floor_temporal(table['timestamp'], unit='day')
+    by_day = (pa.table({'Day': days, 'Mode': table['mode'], 'blocked': blocked})
+              .group_by(['Day', 'Mode'])
+              .aggregate([('blocked', 'count'), ('blocked', 'sum')])
+              .to_pandas()
+              .rename(columns={'blocked_count': 'Analyses', 'blocked_sum': 'Blocked'})
+              .sort_values('Day'))
+
+    rule_counts = pc.value_counts(pc.list_flatten(table['blacklist_rules']))
+    top_rules = (pa.table({'Rule': rule_counts.field('values'), 'Analyses': rule_counts.field('counts')})
+                 .sort_by([('Analyses', 'descending')])
+                 .slice(0, top)
+                 .to_pandas())
+    return LogSummary(
+        analyses=len(table),
+        blocked=pc.sum(blocked).as_py() or 0,
+        words=pc.sum(table['total_words']).as_py() or 0,
+        by_mode=by_mode,
+        by_day=by_day,
+        top_rules=top_rules,
+    )
+
+
+def log_summary(log: VerdictLog, since: Optional[datetime] = None, top: int = 20) -> LogSummary:
+    start = time.perf_counter()
+    summary = summarize(log.table(since, SUMMARY_COLUMNS), top)
+    summary.query_seconds = time.perf_counter() - start
+    return summary
@@ -1,86 +1,127 @@
 import streamlit as st
 import pandas as pd
 import json
-from pathlib import Path
 from datetime import datetime
-import csv
 import io
 import os
 import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
 from collections import Counter
+import filter_core
+from filter_analysis import VerdictCache, FULL_REPORT, VERDICT_ONLY, evaluate_modes, highlight_html
+from filter_delta import DeltaUnavailable, apply_patch, dump_patch, load_patch, make_patch, patch_size
+from filter_hits import HitTracker
+from filter_verdicts import DEFAULT_LOG_DIR, LOG_AVAILABLE, VerdictLog, log_summary
+from filter_matcher import MatcherDirectory
+from filter_merge import LIST_TYPES, plan_merge
+from filter_overlap import analyze_overlaps
+from filter_profile import Profiler
+
+LIST_PAGE_SIZE = 200
+HISTORY_LIMIT = 50
+VIEW_CACHE_SIZE = 64
+TOP_HITS = 20
+
+# Set CONTENT_FILTER_DB to a file path to share rules through an SQLite database
+RULE_DB_PATH = os.environ.get('CONTENT_FILTER_DB')
+
+# Set CONTENT_FILTER_COMPACT=1 to hold in-memory lists in compact buffers (disables undo)
+COMPACT_LISTS = os.environ.get('CONTENT_FILTER_COMPACT') == '1'
+
+# Set CONTENT_FILTER_MATCHERS to a directory from `filter_cli.py build-matchers` to map prebuilt matchers
+MATCHER_DIR = os.environ.get('CONTENT_FILTER_MATCHERS')
+
+# Every analysis verdict is appended to columnar segments here; set CONTENT_FILTER_VERDICT_LOG= (empty) to turn logging off
+VERDICT_LOG_DIR = os.environ.get('CONTENT_FILTER_VERDICT_LOG', DEFAULT_LOG_DIR)
 
 # Functions for loading and saving configurations
-def save_configuration(data, filename='content_filter_config.json'):
+def save_configuration(data, filename=filter_core.DEFAULT_CONFIG):
     """Save filter configuration to a JSON file"""
     try:
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=4)
+        filter_core.save_configuration(data, filename)
         return True, f"Configuration saved to {filename}"
     except Exception as e:
         return False, f"Failed to save configuration: {str(e)}"
 
-def load_configuration(filename='content_filter_config.json'):
+def load_configuration(filename=filter_core.DEFAULT_CONFIG):
     """Load filter configuration from a JSON file"""
     try:
-        if Path(filename).exists():
-            with open(filename) as f:
-                return True, json.load(f)
+        return True, filter_core.load_configuration(filename)
+    except FileNotFoundError:
         return False, "Configuration file not found"
     except Exception as e:
         return False, f"Failed to load configuration: {str(e)}"
 
-# Function to load sample data from CSV
-def load_sample_data():
-    """Load sample filter data from CSV file"""
-    try:
-        sample_path = Path('sample_filter_data.csv')
-        if sample_path.exists():
-            df = pd.read_csv(sample_path)
-            whitelist_items = df[df['Type'] == 'whitelist']['Item'].tolist()
-            blacklist_items = df[df['Type'] == 'blacklist']['Item'].tolist()
-            return {
-                'Child Safe Mode': {
-                    'whitelist': whitelist_items[:10],  # First 10 items for Child Safe Mode
-                    'blacklist': blacklist_items
-                },
-                'High School Teen Safe Mode': {
-                    'whitelist': whitelist_items,       # All whitelist items for Teen Mode
-                    'blacklist': blacklist_items[5:]   # Skip first 5 blacklist items for Teen Mode
-                },
-                'Custom Mode': {
-                    'whitelist': [],
-                    'blacklist': []
-                }
-            }
-        return None
-    except Exception as e:
-        print(f"Error loading sample data: {e}")
-        return None
+def mark_rules_changed(mode=None):
+    """Drop cached verdicts of a mode (or all modes); the store has bumped its version"""
+    st.session_state.verdict_cache.invalidate(mode)
+
+def mode_lists(mode):
+    """Whitelist and blacklist of a mode, loaded from the rule store"""
+    lists = filter_core.mode_lists(store, mode)
+    return lists['whitelist'], lists['blacklist']
+
+def cached_view(name, mode, key, build):
+    """Return a view derived from a mode's rules, rebuilt only when the rules change.
+
+    Views are kept per session (versions of separate in-memory stores are not
+    comparable) and keyed by ``key``, e.g. the search query and page; a new
+    ruleset version replaces the stale entry instead of adding one.
+    """
+    cache = st.session_state.view_cache
+    cache_key = (name, mode, key)
+    version = store.version(mode)
+    entry = cache.pop(cache_key, None)
+    if entry is None or entry[0] != version:
+        entry = (version, build())
+    cache[cache_key] = entry
+    while len(cache) > VIEW_CACHE_SIZE:
+        del cache[next(iter(cache))]
+    return entry[1]
+
+@st.cache_resource(show_spinner=False)
+def prebuilt_matchers(source):
+    """Matchers mapped once per server process and shared by every session loading the same rules"""
+    return MatcherDirectory(MATCHER_DIR, source) if MATCHER_DIR else None
+
+@st.cache_resource(show_spinner=False)
+def verdict_log():
+    """One verdict log per server process, shared by every session"""
+    return VerdictLog(VERDICT_LOG_DIR) if VERDICT_LOG_DIR and LOG_AVAILABLE else None
+
+def rerun_app(message=None):
+    """Rerun the whole page after a change every section depends on"""
+    if message:
+        st.session_state.flash_message = message
+    st.rerun()
 
 # Initialize session state
-if 'mode_data' not in st.session_state:
-    # Try to load from default config first
-    success, result = load_configuration()
-    if success:
-        st.session_state.mode_data = result
-    else:
-        # Try to load sample data if available
-        sample_data = load_sample_data()
-        if sample_data:
-            st.session_state.mode_data = sample_data
-        else:
-            # Use default empty values if no data available
-            st.session_state.mode_data = {
-                'Child Safe Mode': {'whitelist': [], 'blacklist': []},
-                'High School Teen Safe Mode': {'whitelist': [], 'blacklist': []},
-                'Custom Mode': {'whitelist': [], 'blacklist': []}
-            }
+if 'rule_store' not in st.session_state:
+    st.session_state.rule_source = filter_core.rules_source(RULE_DB_PATH)
+    # With CONTENT_FILTER_DB each session gets its own connection; WAL lets sessions write concurrently
+    st.session_state.rule_store = filter_core.open_store(RULE_DB_PATH,
+                                                         history_limit=0 if COMPACT_LISTS else HISTORY_LIMIT,
+                                                         compact=COMPACT_LISTS)
+store = st.session_state.rule_store
 
 if 'current_mode' not in st.session_state:
     st.session_state.current_mode = 'Child Safe Mode'
 
+if 'verdict_cache' not in st.session_state:
+    st.session_state.verdict_cache = VerdictCache(maxsize=2048,
+                                                  prebuilt=prebuilt_matchers(st.session_state.rule_source))
+
+if 'hit_tracker' not in st.session_state:
+    st.session_state.hit_tracker = HitTracker()
+
+if 'view_cache' not in st.session_state:
+    st.session_state.view_cache = {}
+
+if 'profiler' not in st.session_state:
+    st.session_state.profiler = Profiler()
+profiler = st.session_state.profiler
+
 # Page config
 st.set_page_config(
     page_title="Content Filter",
@@ -207,415 +248,666 @@ with col2:
 # Content Analysis Section
 st.subheader("Content Filter Tester")
 
-with st.expander("Test your content against current filters"):
+@st.fragment
+def content_tester():
+    """Tester controls; analyzing content only reruns this section"""
     test_content = st.text_area(
         "Enter content to test against your filters",
         height=100,
         placeholder="Type or paste content here to analyze..."
     )
-    
+
+    evaluation_label = st.radio(
+        "Evaluation mode:",
+        ["Full report", "Verdict only"],
+        horizontal=True,
+        key="evaluation_mode",
+        help="Verdict only stops at the first blacklisted word and skips the detailed report"
+    )
+    evaluation = VERDICT_ONLY if evaluation_label == "Verdict only" else FULL_REPORT
+    compare_modes = st.checkbox("Compare all modes", key="compare_modes",
+                                help="Also show the verdict of every mode, from a single scan of the content")
+    stemming = st.checkbox("Match inflected forms", key="stemming",
+                           help="A rule like 'kill' also matches 'kills', 'killed' and 'killing'")
+
     if st.button("Analyze Content"):
         if test_content.strip():
-            # Get filter lists from current mode
-            whitelist = st.session_state.mode_data[st.session_state.current_mode]['whitelist']
-            blacklist = st.session_state.mode_data[st.session_state.current_mode]['blacklist']
-            
-            # Simple content analysis
-            words = test_content.lower().split()
-            total_words = len(words)
-            
-            # Check against whitelist and blacklist
-            whitelisted = [word for word in words if word in [w.lower() for w in whitelist]]
-            blacklisted = [word for word in words if word in [b.lower() for b in blacklist]]
-            
-            # Determine if content passes the filter
-            filter_status = "ALLOWED" if not blacklisted else "BLOCKED"
-            
+            # Analyze through the verdict cache so repeated content is only scanned once;
+            # the lists are only loaded when the mode's rules need compiling
+            mode = st.session_state.current_mode
+            with profiler.profile("Analyze content"):
+                result = st.session_state.verdict_cache.analyze(
+                    mode, store.version(mode), test_content,
+                    lambda: mode_lists(mode), evaluation, stemming
+                )
+            st.session_state.hit_tracker.record(mode, result)
+            if verdict_log():
+                verdict_log().record(mode, store.version(mode), result, stemming)
+            filter_status = result.status
+
             # Display results
             st.markdown(f"### Analysis Results")
-            
-            col1, col2, col3 = st.columns(3)
-            col1.metric("Total Words", total_words)
-            col2.metric("Whitelisted Words", len(whitelisted), f"{len(whitelisted)/total_words*100:.1f}%" if total_words > 0 else "0%")
-            col3.metric("Blacklisted Words", len(blacklisted), f"{len(blacklisted)/total_words*100:.1f}%" if total_words > 0 else "0%")
-            
+
+            if evaluation == FULL_REPORT:
+                total_words = result.total_words
+                whitelisted = result.whitelisted
+                blacklisted = result.blacklisted
+
+                col1, col2, col3 = st.columns(3)
+                col1.metric("Total Words", total_words)
+                col2.metric("Whitelisted Words", len(whitelisted), f"{len(whitelisted)/total_words*100:.1f}%" if total_words > 0 else "0%")
+                col3.metric("Blacklisted Words", len(blacklisted), f"{len(blacklisted)/total_words*100:.1f}%" if total_words > 0 else "0%")
+                if result.suppressed:
+                    st.caption(f"{result.suppressed} blacklist hits inside whitelisted phrases were ignored.")
+            else:
+                blacklisted = []
+
             # Display filter status with appropriate styling
             if filter_status == "ALLOWED":
                 st.success("✅ This content would be **ALLOWED** by your current filter settings.")
             else:
                 st.error("❌ This content would be **BLOCKED** by your current filter settings.")
-                
+
+            if compare_modes:
+                versions = {name: store.version(name) for name in store.modes()}
+                rules = st.session_state.verdict_cache.modes_rules(versions, mode_lists, stemming)
+                with profiler.profile("Analyze all modes"):
+                    results = evaluate_modes(test_content, rules, evaluation)
+                st.dataframe(
+                    pd.DataFrame(
+                        [(name, mode_result.status,
+                          len(mode_result.blacklisted) if mode_result.blacklisted is not None else None,
+                          mode_result.first_hit or '')
+                         for name, mode_result in results.items()],
+                        columns=['Mode', 'Verdict', 'Blacklisted Words', 'First Hit']
+                    ),
+                    use_container_width=True,
+                    hide_index=True
+                )
+
             # Show detected words
             if blacklisted:
                 st.markdown("**Detected blacklisted words:**")
                 st.write(', '.join([f"'{word}'" for word in set(blacklisted)]))
+            if evaluation == FULL_REPORT and result.spans:
+                st.markdown("**Highlighted content:**")
+                st.markdown(
+                    "<div style='max-height: 300px; overflow-y: auto; border: 1px solid #e0e0e0; "
+                    "border-radius: 6px; padding: 0.75rem;'>"
+                    f"{highlight_html(test_content, result.spans)}</div>",
+                    unsafe_allow_html=True
+                )
+            elif result.first_hit:
+                st.markdown(f"**First blacklisted word:** '{result.first_hit}'")
+
+            cache_stats = st.session_state.verdict_cache.stats()
+            st.caption(
+                f"Verdict cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+                f"({cache_stats['hit_ratio']:.0%} hit ratio), {cache_stats['entries']} entries, "
+                f"~{cache_stats['memory_bytes'] / 1024:.1f} KB"
+            )
         else:
             st.warning("Please enter some content to analyze")
 
+    # Large documents are streamed in chunks instead of pasted into the text area
+    st.markdown("**Or analyze a document:**")
+    uploaded_document = st.file_uploader(
+        "Upload a text document",
+        type=['txt', 'md', 'csv', 'srt'],
+        key="document_upload"
+    )
+    if uploaded_document is not None and st.button("Analyze Document"):
+        mode = st.session_state.current_mode
+        progress = st.progress(0.0, text="Scanning document...")
+        running_status = st.empty()
+        total_bytes = max(uploaded_document.size, 1)
+
+        def show_progress(scanner):
+            progress.progress(min(uploaded_document.tell() / total_bytes, 1.0), text="Scanning document...")
+            running_status.caption(
+                f"{scanner.total_words:,} words scanned • "
+                f"{scanner.whitelist_hits:,} whitelisted • {scanner.blacklist_hits:,} blacklisted"
+            )
+
+        uploaded_document.seek(0)
+        with profiler.profile(f"Analyze document {uploaded_document.name}"):
+            rules = st.session_state.verdict_cache.rules(mode, store.version(mode), lambda: mode_lists(mode), stemming)
+            # Unknown words around blacklist hits feed the session's heavy-hitter sketch
+            result, rule_counts = filter_core.scan_stream(rules, uploaded_document, evaluation,
+                                                          context=st.session_state.hit_tracker.sketch(mode).offer,
+                                                          progress=show_progress)
+        st.session_state.hit_tracker.counter(mode).record_counts(rule_counts)
+        if verdict_log():
+            verdict_log().record(mode, store.version(mode), result, stemming, 'document', rule_counts)
+        progress.progress(1.0, text="Scan complete")
+
+        if result.blocked:
+            st.error(f"❌ **{uploaded_document.name}** would be **BLOCKED** by your current filter settings.")
+        else:
+            st.success(f"✅ **{uploaded_document.name}** would be **ALLOWED** by your current filter settings.")
+        if evaluation == FULL_REPORT:
+            whitelist_hits = sum(count for (list_type, _), count in rule_counts.items() if list_type == 'whitelist')
+            running_status.caption(
+                f"{result.total_words:,} words scanned • "
+                f"{whitelist_hits:,} whitelisted • {sum(rule_counts.values()) - whitelist_hits:,} blacklisted"
+            )
+        if rule_counts:
+            st.dataframe(
+                pd.DataFrame(
+                    [(list_type, rule, count) for (list_type, rule), count in rule_counts.most_common()],
+                    columns=['List', 'Rule', 'Hits']
+                ),
+                use_container_width=True,
+                hide_index=True
+            )
+
+with st.expander("Test your content against current filters"):
+    content_tester()
+
 st.divider()
 
-# Main content
-col_wl, col_bl = st.columns(2)
+@st.fragment
+def list_column(list_type, prefix, color):
+    """Search, add and remove items of one list; edits only rerun this column"""
+    title = list_type.capitalize()
+    mode = st.session_state.current_mode
+    st.markdown(f"<h3 style='font-size: 1.2rem; font-weight: 500; color: {color}; margin-bottom: 1rem;'>{title}</h3>", unsafe_allow_html=True)
+
+    # Search functionality
+    search = st.text_input(f"Search {list_type}...", key=f"{prefix}_search")
 
-# Whitelist column
-with col_wl:
-    st.markdown("<h3 style='font-size: 1.2rem; font-weight: 500; color: #2e7d32; margin-bottom: 1rem;'>Whitelist</h3>", unsafe_allow_html=True)
-    
-    # Search functionality for whitelist
-    wl_search = st.text_input("Search whitelist...", key="wl_search")
-    
     # Switch between single and bulk add modes
-    wl_add_mode = st.radio(
+    add_mode = st.radio(
         "Add mode:",
         ["Single Item", "Bulk Add"],
         horizontal=True,
-        key="wl_add_mode"
+        key=f"{prefix}_add_mode"
     )
-    
-    if wl_add_mode == "Single Item":
-        wl_input = st.text_input("Add to whitelist...", key="wl_input")
-        if st.button("Add to Whitelist"):
-            item = wl_input.strip()
-            if item and item not in st.session_state.mode_data[st.session_state.current_mode]['whitelist']:
-                st.session_state.mode_data[st.session_state.current_mode]['whitelist'].append(item)
-                st.success(f"Added '{item}' to whitelist")
+
+    if add_mode == "Single Item":
+        new_item = st.text_input(f"Add to {list_type}...", key=f"{prefix}_input")
+        if st.button(f"Add to {title}"):
+            item = new_item.strip()
+            if item and store.add_items(mode, list_type, [item]):
+                mark_rules_changed(mode)
+                st.success(f"Added '{item}' to {list_type}")
     else:  # Bulk Add mode
-        wl_bulk_input = st.text_area(
+        bulk_input = st.text_area(
             "Add multiple items (one per line)",
             height=100,
-            key="wl_bulk_input"
+            key=f"{prefix}_bulk_input"
         )
-        if st.button("Add All to Whitelist"):
-            items = [item.strip() for item in wl_bulk_input.split('\n') if item.strip()]
-            added = 0
-            for item in items:
-                if item and item not in st.session_state.mode_data[st.session_state.current_mode]['whitelist']:
-                    st.session_state.mode_data[st.session_state.current_mode]['whitelist'].append(item)
-                    added += 1
+        if st.button(f"Add All to {title}"):
+            items = [item.strip() for item in bulk_input.split('\n') if item.strip()]
+            added = store.add_items(mode, list_type, items)
             if added > 0:
-                st.success(f"Added {added} items to whitelist")
+                mark_rules_changed(mode)
+                st.success(f"Added {added} items to {list_type}")
             else:
                 st.info("No new items to add")
 
-    # Show whitelist items with filtering
-    wl_items = st.session_state.mode_data[st.session_state.current_mode]['whitelist']
-    
-    # Filter the list based on search text
-    if wl_search and wl_items:
-        filtered_wl = [item for item in wl_items if wl_search.lower() in item.lower()]
-    else:
-        filtered_wl = wl_items
-        
-    if filtered_wl:
-        selected_wl = st.multiselect(
-            "Current whitelist items:",
-            options=filtered_wl,
-            default=filtered_wl,
-            key="wl_select"
-        )
-        if len(selected_wl) < len(filtered_wl):
-            removed = set(filtered_wl) - set(selected_wl)
-            
-            # Only remove items that are actually in the original list
-            for item in removed:
-                if item in st.session_state.mode_data[st.session_state.current_mode]['whitelist']:
-                    st.session_state.mode_data[st.session_state.current_mode]['whitelist'].remove(item)
-                    
-            st.warning(f"Removed {', '.join(removed)} from whitelist")
-
-# Blacklist column
-with col_bl:
-    st.markdown("<h3 style='font-size: 1.2rem; font-weight: 500; color: #c62828; margin-bottom: 1rem;'>Blacklist</h3>", unsafe_allow_html=True)
-    
-    # Search functionality for blacklist
-    bl_search = st.text_input("Search blacklist...", key="bl_search")
-    
-    # Switch between single and bulk add modes
-    bl_add_mode = st.radio(
-        "Add mode:",
-        ["Single Item", "Bulk Add"],
-        horizontal=True,
-        key="bl_add_mode"
-    )
-    
-    if bl_add_mode == "Single Item":
-        bl_input = st.text_input("Add to blacklist...", key="bl_input")
-        if st.button("Add to Blacklist"):
-            item = bl_input.strip()
-            if item and item not in st.session_state.mode_data[st.session_state.current_mode]['blacklist']:
-                st.session_state.mode_data[st.session_state.current_mode]['blacklist'].append(item)
-                st.success(f"Added '{item}' to blacklist")
-    else:  # Bulk Add mode
-        bl_bulk_input = st.text_area(
-            "Add multiple items (one per line)",
-            height=100,
-            key="bl_bulk_input"
+    # Show items with filtering, one page at a time
+    total = cached_view('count', mode, (list_type, search),
+                        lambda: store.search_count(mode, list_type, search))
+    page = 1
+    if total > LIST_PAGE_SIZE:
+        page = st.number_input(
+            f"Page (of {(total - 1) // LIST_PAGE_SIZE + 1})",
+            min_value=1,
+            max_value=(total - 1) // LIST_PAGE_SIZE + 1,
+            value=1,
+            key=f"{prefix}_page"
         )
-        if st.button("Add All to Blacklist"):
-            items = [item.strip() for item in bl_bulk_input.split('\n') if item.strip()]
-            added = 0
-            for item in items:
-                if item and item not in st.session_state.mode_data[st.session_state.current_mode]['blacklist']:
-                    st.session_state.mode_data[st.session_state.current_mode]['blacklist'].append(item)
-                    added += 1
-            if added > 0:
-                st.success(f"Added {added} items to blacklist")
-            else:
-                st.info("No new items to add")
+    filtered = cached_view('page', mode, (list_type, search, page), lambda: store.search(
+        mode, list_type, search,
+        offset=(page - 1) * LIST_PAGE_SIZE, limit=LIST_PAGE_SIZE
+    ))
 
-    # Show blacklist items with filtering
-    bl_items = st.session_state.mode_data[st.session_state.current_mode]['blacklist']
-    
-    # Filter the list based on search text
-    if bl_search and bl_items:
-        filtered_bl = [item for item in bl_items if bl_search.lower() in item.lower()]
-    else:
-        filtered_bl = bl_items
-        
-    if filtered_bl:
-        selected_bl = st.multiselect(
-            "Current blacklist items:",
-            options=filtered_bl,
-            default=filtered_bl,
-            key="bl_select"
+    if filtered:
+        selected = st.multiselect(
+            f"Current {list_type} items ({total}):",
+            options=filtered,
+            default=filtered,
+            key=f"{prefix}_select"
         )
-        if len(selected_bl) < len(filtered_bl):
-            removed = set(filtered_bl) - set(selected_bl)
-            
-            # Only remove items that are actually in the original list
-            for item in removed:
-                if item in st.session_state.mode_data[st.session_state.current_mode]['blacklist']:
-                    st.session_state.mode_data[st.session_state.current_mode]['blacklist'].remove(item)
-                    
-            st.warning(f"Removed {', '.join(removed)} from blacklist")
+        if len(selected) < len(filtered):
+            removed = set(filtered) - set(selected)
 
-# Sidebar for additional features
-with st.sidebar:
-    st.markdown("<h2 style='font-size: 1.5rem; font-weight: 500; color: #1f1f1f; margin-bottom: 1.5rem;'>Tools</h2>", unsafe_allow_html=True)
-    
+            with store.action(f"Remove from {list_type}"):
+                removed_count = store.remove_items(mode, list_type, removed)
+            if removed_count:
+                mark_rules_changed(mode)
+
+            st.warning(f"Removed {', '.join(removed)} from {list_type}")
+
+# Main content
+col_wl, col_bl = st.columns(2)
+
+with col_wl:
+    list_column('whitelist', 'wl', '#2e7d32')
+
+with col_bl:
+    list_column('blacklist', 'bl', '#c62828')
+
+def list_stats(items, color):
+    """Summary values and charts of one list"""
+    stats = {'total': len(items)}
+    if items:
+        stats['avg_len'] = sum(len(x) for x in items) / len(items)
+        stats['min_item'] = min((len(x), x) for x in items)[1]
+        stats['max_item'] = max((len(x), x) for x in items)[1]
+
+        # Length distribution
+        lengths = [len(item) for item in items]
+        stats['length_fig'] = px.histogram(x=lengths, nbins=20, title="Item Length Distribution",
+                                           labels={'x': 'Length (characters)', 'y': 'Count'},
+                                           color_discrete_sequence=[color])
+
+        # First letter distribution
+        letter_counts = Counter(item[0].upper() if item else '' for item in items)
+        letter_df = pd.DataFrame({
+            'Letter': list(letter_counts.keys()),
+            'Count': list(letter_counts.values())
+        }).sort_values('Letter')
+        stats['letter_fig'] = px.bar(letter_df, x='Letter', y='Count', title="First Letter Distribution",
+                                     color_discrete_sequence=[color])
+    return stats
+
+def show_list_stats(title, stats):
+    st.markdown(f"**{title} Stats:**")
+    st.write(f"Total items: {stats['total']}")
+
+    if stats['total']:
+        st.write(f"Average length: {stats['avg_len']:.1f} characters")
+        st.write(f"Shortest item: '{stats['min_item']}' ({len(stats['min_item'])} chars)")
+        st.write(f"Longest item: '{stats['max_item']}' ({len(stats['max_item'])} chars)")
+        st.plotly_chart(stats['length_fig'], use_container_width=True)
+        st.plotly_chart(stats['letter_fig'], use_container_width=True)
+
+@st.fragment
+def statistics_panel():
     # Statistics with enhanced visualizations
     if st.button("Show Statistics", use_container_width=True):
         st.markdown("<h3 style='font-size: 1.2rem; font-weight: 500; color: #1f1f1f; margin: 1rem 0;'>Statistics</h3>", unsafe_allow_html=True)
-        whitelist = st.session_state.mode_data[st.session_state.current_mode]['whitelist']
-        blacklist = st.session_state.mode_data[st.session_state.current_mode]['blacklist']
-        
+        mode = st.session_state.current_mode
+
         # Summary tab with enhanced visual stats
         st.subheader("Summary Statistics")
-        
+
         # Comparison chart for list sizes
         list_sizes = pd.DataFrame({
             'List': ['Whitelist', 'Blacklist'],
-            'Count': [len(whitelist), len(blacklist)]
+            'Count': [store.count(mode, 'whitelist'), store.count(mode, 'blacklist')]
         })
-        fig = px.bar(list_sizes, x='List', y='Count', color='List', 
+        fig = px.bar(list_sizes, x='List', y='Count', color='List',
                     color_discrete_map={'Whitelist': '#4CAF50', 'Blacklist': '#F44336'},
                     title='Number of Items per List')
         st.plotly_chart(fig, use_container_width=True)
-        
+
         # Detailed stats tabs
-        tab1, tab2 = st.tabs(["Whitelist Analysis", "Blacklist Analysis"])
-        
+        tab1, tab2, tab3, tab4, tab5 = st.tabs(["Whitelist Analysis", "Blacklist Analysis", "Rule Overlap", "Rule Hits",
+                                                "Verdict Log"])
+
         with tab1:
-            st.markdown("**Whitelist Stats:**")
-            st.write(f"Total items: {len(whitelist)}")
-            
-            if whitelist:
-                avg_len = sum(len(x) for x in whitelist) / len(whitelist)
-                min_item = min((len(x), x) for x in whitelist)[1] if whitelist else 'N/A'
-                max_item = max((len(x), x) for x in whitelist)[1] if whitelist else 'N/A'
-                
-                st.write(f"Average length: {avg_len:.1f} characters")
-                st.write(f"Shortest item: '{min_item}' ({len(min_item)} chars)")
-                st.write(f"Longest item: '{max_item}' ({len(max_item)} chars)")
-                
-                # Length distribution
-                lengths = [len(item) for item in whitelist]
-                fig = px.histogram(x=lengths, nbins=20, title="Item Length Distribution",
-                                labels={'x': 'Length (characters)', 'y': 'Count'},
-                                color_discrete_sequence=['#4CAF50'])
-                st.plotly_chart(fig, use_container_width=True)
-                
-                # First letter distribution
-                if whitelist:
-                    first_letters = [item[0].upper() if item else '' for item in whitelist]
-                    letter_counts = Counter(first_letters)
-                    letter_df = pd.DataFrame({
-                        'Letter': list(letter_counts.keys()),
-                        'Count': list(letter_counts.values())
-                    }).sort_values('Letter')
-                    
-                    fig = px.bar(letter_df, x='Letter', y='Count', title="First Letter Distribution",
-                                color_discrete_sequence=['#4CAF50'])
-                    st.plotly_chart(fig, use_container_width=True)
-        
+            show_list_stats("Whitelist", cached_view('stats', mode, 'whitelist',
+                                                     lambda: list_stats(store.items(mode, 'whitelist'), '#4CAF50')))
+
         with tab2:
-            st.markdown("**Blacklist Stats:**")
-            st.write(f"Total items: {len(blacklist)}")
-            
-            if blacklist:
-                avg_len = sum(len(x) for x in blacklist) / len(blacklist)
-                min_item = min((len(x), x) for x in blacklist)[1] if blacklist else 'N/A'
-                max_item = max((len(x), x) for x in blacklist)[1] if blacklist else 'N/A'
-                
-                st.write(f"Average length: {avg_len:.1f} characters")
-                st.write(f"Shortest item: '{min_item}' ({len(min_item)} chars)")
-                st.write(f"Longest item: '{max_item}' ({len(max_item)} chars)")
-                
-                # Length distribution
-                lengths = [len(item) for item in blacklist]
-                fig = px.histogram(x=lengths, nbins=20, title="Item Length Distribution",
-                                labels={'x': 'Length (characters)', 'y': 'Count'},
-                                color_discrete_sequence=['#F44336'])
-                st.plotly_chart(fig, use_container_width=True)
-                
-                # First letter distribution
-                if blacklist:
-                    first_letters = [item[0].upper() if item else '' for item in blacklist]
-                    letter_counts = Counter(first_letters)
-                    letter_df = pd.DataFrame({
-                        'Letter': list(letter_counts.keys()),
-                        'Count': list(letter_counts.values())
-                    }).sort_values('Letter')
-                    
-                    fig = px.bar(letter_df, x='Letter', y='Count', title="First Letter Distribution",
-                                color_discrete_sequence=['#F44336'])
-                    st.plotly_chart(fig, use_container_width=True)
-
-    # Bulk Actions section
+            show_list_stats("Blacklist", cached_view('stats', mode, 'blacklist',
+                                                     lambda: list_stats(store.items(mode, 'blacklist'), '#F44336')))
+
+        with tab3:
+            overlap = cached_view('overlap', mode, None, lambda: analyze_overlaps(
+                dict(zip(LIST_TYPES, mode_lists(mode)))))
+            overlap_summary = overlap.summary()
+            st.markdown("**Rule Overlap:**")
+            st.write(f"On both lists: {overlap_summary['both_lists']}")
+            st.write(f"Blacklist phrases shadowed by a shorter rule: {overlap_summary['shadowed']}")
+            st.write(f"Rules that never fire: {overlap_summary['never_fire']}")
+
+            if overlap.both_lists:
+                st.markdown("**Items on both lists:**")
+                st.dataframe(pd.DataFrame(overlap.both_lists[:1000], columns=['Item', 'Whitelist Rule', 'Blacklist Rule']),
+                             use_container_width=True, hide_index=True)
+            if overlap.shadowed:
+                st.markdown("**Shadowed blacklist phrases:**")
+                st.dataframe(pd.DataFrame(overlap.shadowed[:1000], columns=['Phrase', 'Covered By']),
+                             use_container_width=True, hide_index=True)
+            if overlap.never_fire:
+                st.markdown("**Rules that never fire:**")
+                st.dataframe(pd.DataFrame(overlap.never_fire[:1000], columns=['List', 'Rule', 'Reason']),
+                             use_container_width=True, hide_index=True)
+            if overlap.removable:
+                st.caption(f"Removing the {overlap.removable} shadowed or dead rules would not change any verdict.")
+
+        with tab4:
+            rule_hits_view(mode)
+
+        with tab5:
+            verdict_log_view()
+
+def rule_hits_view(mode):
+    """Most frequent and never-hit rules, from every analysis in this session"""
+    counter = st.session_state.hit_tracker.counter(mode)
+    sketch = st.session_state.hit_tracker.sketch(mode)
+    lists = dict(zip(LIST_TYPES, mode_lists(mode)))
+    never_hit = counter.never_hit(lists)
+
+    st.markdown("**Rule Hits:**")
+    st.write(f"Analyses recorded: {counter.analyses}")
+    st.write(f"Total hits: {counter.total}")
+    st.write(f"Rules that never fired: {len(never_hit)}")
+
+    top_hits = counter.top(TOP_HITS)
+    if top_hits:
+        st.markdown(f"**Top {TOP_HITS} rules:**")
+        st.dataframe(pd.DataFrame(top_hits, columns=['List', 'Rule', 'Hits']),
+                     use_container_width=True, hide_index=True)
+    if never_hit and counter.analyses:
+        st.markdown("**Rules that never fired:**")
+        st.dataframe(pd.DataFrame(never_hit[:1000], columns=['List', 'Rule']),
+                     use_container_width=True, hide_index=True)
+    if len(sketch):
+        st.markdown("**Frequent unknown words near blacklist hits:**")
+        st.dataframe(pd.DataFrame(sketch.top(TOP_HITS), columns=['Word', 'Count', 'Max Overcount']),
+                     use_container_width=True, hide_index=True)
+        st.caption(f"Estimated from {sketch.seen:,} words seen in document scans.")
+
+    st.download_button(
+        label="Download Rule Hits CSV",
+        data=''.join(filter_core.iter_hit_report_chunks(counter.report(lists))),
+        file_name=f"rule_hits_{mode}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+        mime='text/csv'
+    )
+
+def verdict_log_view():
+    """Verdicts of every session and mode, aggregated from the analysis log"""
+    log = verdict_log()
+    if log is None:
+        st.info("The verdict log is off (needs pyarrow and CONTENT_FILTER_VERDICT_LOG).")
+        return
+    summary = log_summary(log, top=TOP_HITS)
+    if not summary.analyses:
+        st.write("No analyses logged yet.")
+        return
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Analyses", f"{summary.analyses:,}")
+    col2.metric("Blocked", f"{summary.blocked:,}", f"{summary.block_rate:.1%}", delta_color="off")
+    col3.metric("Words Scanned", f"{summary.words:,}")
+
+    st.markdown("**By mode:**")
+    st.dataframe(summary.by_mode, use_container_width=True, hide_index=True,
+                 column_config={'Block Rate': st.column_config.NumberColumn(format="%.3f")})
+    fig = px.bar(summary.by_day, x='Day', y='Analyses', color='Mode', title='Analyses per Day')
+    st.plotly_chart(fig, use_container_width=True)
+    if len(summary.top_rules):
+        st.markdown(f"**Top {TOP_HITS} blacklist rules (analyses matching them):**")
+        st.dataframe(summary.top_rules, use_container_width=True, hide_index=True)
+    st.caption(f"Aggregated {summary.analyses:,} analyses from {len(log.segments())} segments "
+               f"in {summary.query_seconds * 1000:.0f} ms.")
+
+@st.fragment
+def bulk_actions():
+    """Clear, undo/redo and sort; these change both lists, so they rerun the whole page"""
     st.markdown("<h3 style='font-size: 1.2rem; font-weight: 500; color: #1f1f1f; margin: 1.5rem 0 1rem;'>Bulk Actions</h3>", unsafe_allow_html=True)
-    
+    mode = st.session_state.current_mode
+
     bulk_col1, bulk_col2 = st.columns(2)
     with bulk_col1:
         list_to_clear = st.selectbox("Select list", ["Whitelist", "Blacklist", "Both"])
     with bulk_col2:
         if st.button("Clear Selected List"):
-            if list_to_clear == "Whitelist" or list_to_clear == "Both":
-                st.session_state.mode_data[st.session_state.current_mode]['whitelist'] = []
-            if list_to_clear == "Blacklist" or list_to_clear == "Both":
-                st.session_state.mode_data[st.session_state.current_mode]['blacklist'] = []
-            st.success(f"Cleared {list_to_clear.lower()}!")
-    
+            with store.action(f"Clear {list_to_clear.lower()}"):
+                if list_to_clear == "Whitelist" or list_to_clear == "Both":
+                    store.clear(mode, 'whitelist')
+                if list_to_clear == "Blacklist" or list_to_clear == "Both":
+                    store.clear(mode, 'blacklist')
+            mark_rules_changed(mode)
+            rerun_app(f"Cleared {list_to_clear.lower()}!")
+
+    # Undo/redo history; list edits rerun only their column, so the buttons
+    # stay enabled and report when there is nothing to undo
+    if store.history is not None:
+        history_col1, history_col2 = st.columns(2)
+        with history_col1:
+            if st.button("↩ Undo", help="Undo the last change to the lists"):
+                if store.undo():
+                    mark_rules_changed()
+                    rerun_app()
+                st.info("Nothing to undo")
+        with history_col2:
+            if st.button("↪ Redo", help="Redo the last undone change"):
+                if store.redo():
+                    mark_rules_changed()
+                    rerun_app()
+                st.info("Nothing to redo")
+
     # Sorting section
     st.markdown("<h3 style='font-size: 1.2rem; font-weight: 500; color: #1f1f1f; margin: 1.5rem 0 1rem;'>Sort Lists</h3>", unsafe_allow_html=True)
-    
+
     sort_col1, sort_col2 = st.columns(2)
     with sort_col1:
         if st.button("Sort Ascending"):
-            for list_type in ['whitelist', 'blacklist']:
-                st.session_state.mode_data[st.session_state.current_mode][list_type].sort()
-            st.success("Lists sorted in ascending order")
-    
+            with store.action("Sort ascending"):
+                for list_type in ['whitelist', 'blacklist']:
+                    store.sort(mode, list_type)
+            rerun_app("Lists sorted in ascending order")
+
     with sort_col2:
         if st.button("Sort Descending"):
-            for list_type in ['whitelist', 'blacklist']:
-                st.session_state.mode_data[st.session_state.current_mode][list_type].sort(reverse=True)
-            st.success("Lists sorted in descending order")
+            with store.action("Sort descending"):
+                for list_type in ['whitelist', 'blacklist']:
+                    store.sort(mode, list_type, reverse=True)
+            rerun_app("Lists sorted in descending order")
 
+@st.fragment
+def configuration_panel():
     # Save/Load Configuration
     st.markdown("<h3 style='font-size: 1.2rem; font-weight: 500; color: #1f1f1f; margin: 1.5rem 0 1rem;'>Configuration</h3>", unsafe_allow_html=True)
-    
+    if RULE_DB_PATH:
+        st.caption(f"Rules are stored in the shared database {RULE_DB_PATH}; edits are saved immediately.")
+
     # Save configuration
     save_col1, save_col2 = st.columns(2)
     with save_col1:
-        config_filename = st.text_input("Config filename", "content_filter_config.json")
+        config_filename = st.text_input("Config filename", filter_core.DEFAULT_CONFIG)
     with save_col2:
         if st.button("Save Config"):
-            success, message = save_configuration(st.session_state.mode_data, config_filename)
+            success, message = save_configuration(store.to_mode_data(), config_filename)
             if success:
                 st.success(message)
             else:
                 st.error(message)
-    
+
     # Load configuration
     load_col1, load_col2 = st.columns(2)
-    
+
     with load_col1:
         uploaded_config = st.file_uploader("Upload config file", type=['json'])
     with load_col2:
         if st.button("Load Default Config"):
-            success, result = load_configuration()
+            with profiler.profile("Load default configuration"):
+                success, result = load_configuration()
+                if success:
+                    store.load_mode_data(result)
             if success:
-                st.session_state.mode_data = result
-                st.success("Default configuration loaded")
+                mark_rules_changed()
+                rerun_app("Default configuration loaded")
             else:
                 st.error(result)
-    
+
     if uploaded_config is not None:
-        try:
-            config_data = json.load(uploaded_config)
-            st.session_state.mode_data = config_data
-            st.success("Configuration loaded successfully")
-        except Exception as e:
-            st.error(f"Error loading configuration: {str(e)}")
-    
-    st.divider()
-    
+        # The uploader keeps its file across reruns; only load each upload once
+        upload_id = getattr(uploaded_config, 'file_id', (uploaded_config.name, uploaded_config.size))
+        if st.session_state.get('loaded_config_id') != upload_id:
+            try:
+                with profiler.profile(f"Load configuration {uploaded_config.name}"):
+                    store.load_mode_data(json.load(uploaded_config))
+            except Exception as e:
+                st.error(f"Error loading configuration: {str(e)}")
+            else:
+                st.session_state.loaded_config_id = upload_id
+                mark_rules_changed()
+                rerun_app("Configuration loaded successfully")
+
+def export_payload(mode, export_format):
+    """CSV or TXT export of a mode's lists"""
+    with profiler.profile(f"Export {export_format}"):
+        return filter_core.export_text(mode, filter_core.mode_lists(store, mode), export_format.lower())
+
+@st.fragment
+def import_export_panel():
     # Import/Export
     st.markdown("<h3 style='font-size: 1.2rem; font-weight: 500; color: #1f1f1f; margin: 1.5rem 0 1rem;'>Import/Export</h3>", unsafe_allow_html=True)
-    
+    mode = st.session_state.current_mode
+
     # Export
     export_format = st.selectbox("Export Format", ["CSV", "TXT"])
     if st.button("Export Lists"):
-        if export_format == "CSV":
-            data = []
-            for item in st.session_state.mode_data[st.session_state.current_mode]['whitelist']:
-                data.append(['whitelist', item])
-            for item in st.session_state.mode_data[st.session_state.current_mode]['blacklist']:
-                data.append(['blacklist', item])
-            
-            df = pd.DataFrame(data, columns=['Type', 'Item'])
-            csv = df.to_csv(index=False)
-            
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f'content_filter_{st.session_state.current_mode}_{timestamp}.csv'
-            
-            st.download_button(
-                label="Download CSV",
-                data=csv,
-                file_name=filename,
-                mime='text/csv'
-            )
-        else:  # TXT
-            content = f"=== {st.session_state.current_mode} ===\n\n"
-            content += "=== Whitelist ===\n"
-            content += "\n".join(st.session_state.mode_data[st.session_state.current_mode]['whitelist'])
-            content += "\n\n=== Blacklist ===\n"
-            content += "\n".join(st.session_state.mode_data[st.session_state.current_mode]['blacklist'])
-            
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f'content_filter_{st.session_state.current_mode}_{timestamp}.txt'
-            
-            st.download_button(
-                label="Download TXT",
-                data=content,
-                file_name=filename,
-                mime='text/plain'
-            )
-    
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        extension = export_format.lower()
+        st.download_button(
+            label=f"Download {export_format}",
+            data=cached_view('export', mode, export_format, lambda: export_payload(mode, export_format)),
+            file_name=f'content_filter_{mode}_{timestamp}.{extension}',
+            mime='text/csv' if export_format == "CSV" else 'text/plain'
+        )
+
     # Import
     st.subheader("📥 Import")
     uploaded_file = st.file_uploader("Choose a file to import", type=['csv', 'txt'])
     if uploaded_file is not None:
+        added = 0
         try:
-            if uploaded_file.name.endswith('.csv'):
-                df = pd.read_csv(uploaded_file)
-                for _, row in df.iterrows():
-                    if row['Type'] in ['whitelist', 'blacklist']:
-                        if row['Item'] not in st.session_state.mode_data[st.session_state.current_mode][row['Type']]:
-                            st.session_state.mode_data[st.session_state.current_mode][row['Type']].append(row['Item'])
-            else:  # txt
-                content = uploaded_file.getvalue().decode()
-                current_list = None
-                for line in content.split('\n'):
-                    line = line.strip()
-                    if line.startswith('=== Whitelist ==='):
-                        current_list = 'whitelist'
-                    elif line.startswith('=== Blacklist ==='):
-                        current_list = 'blacklist'
-                    elif line and not line.startswith('===') and current_list:
-                        if line not in st.session_state.mode_data[st.session_state.current_mode][current_list]:
-                            st.session_state.mode_data[st.session_state.current_mode][current_list].append(line)
-            
-            st.success("File imported successfully!")
+            def preview():
+                with profiler.profile(f"Import preview {uploaded_file.name}"):
+                    content = io.StringIO(uploaded_file.getvalue().decode())
+                    incoming = filter_core.read_rules(content, filter_core.rule_format(uploaded_file.name))
+                    whitelist, blacklist = mode_lists(mode)
+                    return plan_merge({'whitelist': whitelist, 'blacklist': blacklist}, incoming)
+
+            # Preview what the import would change before committing it
+            upload_id = getattr(uploaded_file, 'file_id', (uploaded_file.name, uploaded_file.size))
+            plan = cached_view('import', mode, upload_id, preview)
+            summary = plan.summary()
+
+            imp_col1, imp_col2 = st.columns(2)
+            imp_col1.metric("New whitelist items", summary['added_whitelist'])
+            imp_col2.metric("New blacklist items", summary['added_blacklist'])
+            imp_col1.metric("Duplicates", summary['duplicates'])
+            imp_col2.metric("Conflicts", summary['conflicts'])
+
+            skip_conflicts = False
+            if plan.conflicts:
+                with st.expander(f"Items on both lists ({len(plan.conflicts)})"):
+                    st.dataframe(
+                        pd.DataFrame(plan.conflicts[:1000], columns=['Item', 'Conflict']),
+                        use_container_width=True,
+                        hide_index=True
+                    )
+                skip_conflicts = st.checkbox("Skip conflicting incoming items", value=True)
+
+            if st.button("Commit Import", disabled=not (summary['added_whitelist'] or summary['added_blacklist'])):
+                with profiler.profile(f"Import {uploaded_file.name}"), store.action(f"Import {uploaded_file.name}"):
+                    added = sum(
+                        store.add_items(mode, list_type, items)
+                        for list_type, items in plan.additions(skip_conflicts).items()
+                    )
+                if not added:
+                    st.info(f"No new items imported from {uploaded_file.name}")
         except Exception as e:
             st.error(f"Error importing file: {str(e)}")
+        if added:
+            mark_rules_changed(mode)
+            rerun_app(f"Imported {added} items from {uploaded_file.name}")
+
+@st.fragment
+def patch_panel():
+    # Delta patches carry only the changes since a version, for syncing with other instances
+    st.subheader("🔁 Delta Patches")
+    mode = st.session_state.current_mode
+    exported = st.session_state.setdefault('patch_exported_versions', {})
+    version = store.version(mode)
+    st.caption(f"{mode} is at version {version}.")
+    since = st.number_input("Changes since version", min_value=0, max_value=version,
+                            value=min(exported.get(mode, 0), version))
+    if st.button("Export Patch"):
+        try:
+            with profiler.profile(f"Export patch {mode}"):
+                patch = make_patch(store, {mode: int(since)})
+        except DeltaUnavailable as e:
+            st.error(f"{e}. Export the full lists instead.")
+        else:
+            added, removed = patch_size(patch)
+            exported[mode] = version
+            st.caption(f"{added} additions, {removed} removals")
+            st.download_button(
+                label="Download Patch",
+                data=dump_patch(patch),
+                file_name=f"content_filter_patch_{mode}_{since}-{version}.json",
+                mime='application/json'
+            )
+
+    uploaded_patch = st.file_uploader("Apply a patch", type=['json'], key="patch_upload")
+    if uploaded_patch is not None:
+        try:
+            patch = load_patch(uploaded_patch.getvalue())
+        except ValueError as e:
+            st.error(f"Invalid patch: {str(e)}")
+            return
+        added, removed = patch_size(patch)
+        st.caption(f"{added} additions and {removed} removals for {', '.join(patch['modes']) or 'no modes'}")
+        if st.button("Apply Patch", disabled=not (added or removed)):
+            with profiler.profile(f"Apply patch {uploaded_patch.name}"):
+                applied = apply_patch(store, patch, st.session_state.verdict_cache)
+            changed = sum(added + removed for added, removed in applied.values())
+            if changed:
+                rerun_app(f"Applied {uploaded_patch.name}: "
+                          f"{sum(added for added, _ in applied.values())} added, "
+                          f"{sum(removed for _, removed in applied.values())} removed")
+            st.info("The patch was already applied; nothing changed")
+
+@st.fragment
+def profiling_panel():
+    # Capture a CPU and allocation profile when the app feels slow
+    st.markdown("<h3 style='font-size: 1.2rem; font-weight: 500; color: #1f1f1f; margin: 1.5rem 0 1rem;'>Profiling</h3>", unsafe_allow_html=True)
+    if profiler.armed:
+        st.info(f"Profiling: {profiler.remaining} more analyze/import/export/load operations to capture")
+        prof_col1, prof_col2 = st.columns(2)
+        prof_col1.button("Refresh", key="profile_refresh")
+        if prof_col2.button("Stop Profiling"):
+            profiler.disarm()
+            rerun_app("Profiling stopped")
+    else:
+        operations = st.number_input("Operations to profile", min_value=1, max_value=100, value=5)
+        if st.button("Start Profiling"):
+            profiler.arm(int(operations))
+            rerun_app(f"Profiling the next {int(operations)} operations")
+
+    if profiler.has_report:
+        st.download_button(
+            label="Download Profile Report",
+            data=profiler.report(),
+            file_name=f"content_filter_profile_{profiler.captured_at.strftime('%Y%m%d_%H%M%S')}.txt",
+            mime='text/plain'
+        )
+
+# Sidebar for additional features
+with st.sidebar:
+    st.markdown("<h2 style='font-size: 1.5rem; font-weight: 500; color: #1f1f1f; margin-bottom: 1.5rem;'>Tools</h2>", unsafe_allow_html=True)
+    if 'flash_message' in st.session_state:
+        st.success(st.session_state.pop('flash_message'))
+
+    statistics_panel()
+    bulk_actions()
+    configuration_panel()
+
+    st.divider()
+
+    import_export_panel()
+    patch_panel()
+
+    st.divider()
+
+    profiling_panel()
@@ -0,0 +1,46 @@
+from filter_analysis import VerdictCache, compile_rules
+from filter_delta import apply_patch
+from filter_store import MemoryRuleStore
+
+MODE = 'Custom Mode'
+
+
+def make_store(blacklist, whitelist=()):
+    return MemoryRuleStore({MODE: {'whitelist': list(whitelist), 'blacklist': list(blacklist)}})
+
+
+def patched_rules(store, patch):
+    """Compile the store's rules, apply the patch and return the cache's patched tables"""
+    def lists():
+        return store.items(MODE, 'whitelist'), store.items(MODE, 'blacklist')
+
+    def recompile():
+        raise AssertionError('the patched tables were dropped and recompiled')
+
+    cache = VerdictCache()
+    cache.rules(MODE, store.version(MODE), lists)
+    apply_patch(store, patch, verdict_cache=cache)
+    return cache.rules(MODE, store.version(MODE), recompile)
+
+
+def assert_same_rules(patched, store):
+    expected = compile_rules(store.items(MODE, 'whitelist'), store.items(MODE, 'blacklist'))
+    assert patched.whitelist == expected.whitelist
+    assert patched.blacklist == expected.blacklist
+    assert patched.phrases == expected.phrases
+    assert patched.shadowed == expected.shadowed
+
+
+def test_removing_duplicated_rule_drops_every_copy():
+    store = make_store(['foo', 'bar', 'foo'])
+    patched = patched_rules(store, {'modes': {MODE: {'remove': {'blacklist': ['foo']}}}})
+    assert store.items(MODE, 'blacklist') == ['bar']
+    assert 'foo' not in patched.blacklist
+    assert_same_rules(patched, store)
+
+
+def test_removing_duplicated_phrase_keeps_other_spelling():
+    store = make_store(['Bad Word', 'bad word', 'x', 'bad word'])
+    patched = patched_rules(store, {'modes': {MODE: {'remove': {'blacklist': ['bad word']}}}})
+    assert store.items(MODE, 'blacklist') == ['Bad Word', 'x']
+    assert_same_rules(patched, store)